@@ -0,0 +1,54 @@
+"""APL identification from filenames and letter headers."""
+import re
+from typing import List, Tuple
+
+from pdf_extraction import ExtractedDocument
+
+_APL_FILENAME = re.compile(r'APL(\d{2})-(\d{3})', re.IGNORECASE)
+# "SUPERSEDES ALL PLAN LETTER 13-014", "SUPERSEDES ALL PLAN LETTERS 18-006 AND 19-011"
+_SUPERSEDES = re.compile(r'SUPERSEDES\s+ALL\s+PLAN\s+LETTERS?\s+((?:\d{2}-\d{3}(?:\s*(?:,|AND|&)\s*)?)+)', re.IGNORECASE)
+_APL_NUMBER = re.compile(r'\d{2}-\d{3}')
+
+
+def extract_apl_info(filename):
+    """Extract APL number and year from filename."""
+    match = _APL_FILENAME.search(filename)
+    if match:
+        year_prefix = int(match.group(1))
+        apl_number = match.group(1) + '-' + match.group(2)
+        # Determine century based on year prefix
+        year = f"19{year_prefix}" if year_prefix > 50 else f"20{year_prefix}"
+        return {
+            "apl_number": apl_number,
+            "year": year,
+            "citation_key": f"APL{match.group(1)}"
+        }
+    return None
+
+
+def distinct_citation_keys(old_info: dict, new_info: dict) -> Tuple[dict, dict]:
+    """
+    Return copies of two APLs' info whose citation keys differ.
+
+    Letters of the same year share a key ("APL25" for both 25-001 and
+    25-008), which would leave the model and the citation resolver unable
+    to tell them apart; such pairs are keyed by full APL number instead.
+    """
+    if old_info["citation_key"] != new_info["citation_key"]:
+        return old_info, new_info
+    return (
+        dict(old_info, citation_key=f"APL{old_info['apl_number']}"),
+        dict(new_info, citation_key=f"APL{new_info['apl_number']}"),
+    )
+
+
+def superseded_apl_numbers(document: ExtractedDocument, pages: int = 2) -> List[str]:
+    """Return the APL numbers a letter's header says it supersedes, e.g. ["13-014"]."""
+    header = "\n".join(document.pages[:pages])
+    numbers: List[str] = []
+    for match in _SUPERSEDES.finditer(header):
+        for number in _APL_NUMBER.findall(match.group(1)):
+            if number not in numbers:
+                numbers.append(number)
+    return numbers
+
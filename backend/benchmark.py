@@ -0,0 +1,306 @@
+"""
+Offline benchmark of the comparison pipeline.
+
+Starts the mock LLM server (mock_llm.py) and the API on free local ports,
+with fresh caches in a temporary directory, then submits comparisons of
+the sample APLs in the repository through /api/compare at a fixed
+concurrency. Each task is followed on /api/stream for stage timings while
+/api/status is polled for completion. Reports per-stage and end-to-end
+p50/p95 latency, throughput, status poll latency and backend memory.
+Run from the backend directory:
+
+    python -m benchmark --requests 20 --concurrency 5 --latency 0.5
+    python -m benchmark --quick --rate-limit-ratio 0.1 --json results.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+DEFAULT_OLD_PDF = os.path.join(REPO_DIR, "APL13-014.pdf")
+DEFAULT_NEW_PDF = os.path.join(REPO_DIR, "APL25-008.pdf")
+
+STAGES = ("extraction", "initial_diff", "estimate", "final_diff", "scoring", "completed")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values: List[float], share: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = share * (len(ordered) - 1)
+    lower = int(index)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (index - lower)
+
+
+def _tree_rss(pid: int) -> int:
+    """Resident memory in bytes of a process and its descendants (Linux /proc)."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+    return total
+
+
+def _unique_pdf(pdf_bytes: bytes, run: int) -> bytes:
+    # A trailing PDF comment changes the file hash without changing its content
+    return pdf_bytes + f"\n% benchmark run {run}\n".encode("ascii")
+
+
+async def _wait_ready(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+
+
+async def _follow_stream(client: httpx.AsyncClient, url: str, started: float, stage_times: Dict[str, float]):
+    """Record when each stage event of a task arrives, relative to submission."""
+    event = None
+    async with client.stream("GET", url, timeout=None) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line == "" and event is not None:
+                stage_times.setdefault(event, time.monotonic() - started)
+                if event in ("completed", "failed"):
+                    return
+                event = None
+
+
+async def _run_one(client: httpx.AsyncClient, base_url: str, run: int, args, pdfs: Dict[str, bytes]) -> dict:
+    old_name = os.path.basename(args.old).replace(".pdf", f"_run{run}.pdf")
+    new_name = os.path.basename(args.new).replace(".pdf", f"_run{run}.pdf")
+    old_bytes, new_bytes = pdfs["old"], pdfs["new"]
+    if not args.same_pdfs:
+        old_bytes, new_bytes = _unique_pdf(old_bytes, run), _unique_pdf(new_bytes, run)
+
+    result: dict = {"run": run, "stages": {}, "poll_latencies": []}
+    started = time.monotonic()
+    response = await client.post(
+        f"{base_url}/api/compare",
+        files={"old_apl": (old_name, old_bytes, "application/pdf"), "new_apl": (new_name, new_bytes, "application/pdf")},
+        data={
+            "quick_mode": str(args.quick).lower(),
+            "model": args.model,
+            "bypass_cache": str(not args.use_cache).lower(),
+            "chunked_mode": str(args.chunked).lower(),
+            "adaptive_mode": str(args.adaptive).lower(),
+        },
+    )
+    result["submit_seconds"] = time.monotonic() - started
+    if response.status_code != 200:
+        result.update(status="failed", error=f"HTTP {response.status_code}: {response.text}")
+        return result
+    task_id = response.json()["task_id"]
+
+    stream = asyncio.ensure_future(
+        _follow_stream(client, f"{base_url}/api/stream/{task_id}", started, result["stages"])
+    )
+    try:
+        while True:
+            poll_started = time.monotonic()
+            status = (await client.get(f"{base_url}/api/status/{task_id}")).json()
+            result["poll_latencies"].append(time.monotonic() - poll_started)
+            if status.get("status") in ("completed", "failed"):
+                result["status"] = status["status"]
+                result["error"] = status.get("error")
+                result["seconds"] = time.monotonic() - started
+                break
+            await asyncio.sleep(args.poll_interval)
+        await asyncio.wait_for(stream, timeout=5)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        stream.cancel()
+    return result
+
+
+async def _sample_memory(pid: int, samples: List[int], stop: asyncio.Event):
+    while not stop.is_set():
+        samples.append(_tree_rss(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.2)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _drive(args, base_url: str, app_pid: int) -> dict:
+    with open(args.old, "rb") as f:
+        old_bytes = f.read()
+    with open(args.new, "rb") as f:
+        new_bytes = f.read()
+    pdfs = {"old": old_bytes, "new": new_bytes}
+
+    memory: List[int] = []
+    stop = asyncio.Event()
+    sampler = asyncio.ensure_future(_sample_memory(app_pid, memory, stop))
+    idle_rss = _tree_rss(app_pid)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency * 3)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(600, connect=10), limits=limits) as client:
+        async def limited(run: int) -> dict:
+            async with semaphore:
+                return await _run_one(client, base_url, run, args, pdfs)
+
+        started = time.monotonic()
+        results = await asyncio.gather(*(limited(run) for run in range(args.requests)))
+        wall = time.monotonic() - started
+        try:
+            mock_stats = (await client.get(f"{args.mock_url}/stats")).json()
+        except httpx.HTTPError:
+            mock_stats = {}
+
+    stop.set()
+    await sampler
+    return _summarize(results, wall, idle_rss, memory, mock_stats)
+
+
+def _summarize(results: List[dict], wall: float, idle_rss: int, memory: List[int], mock_stats: dict) -> dict:
+    completed = [r for r in results if r.get("status") == "completed"]
+    stage_durations: Dict[str, List[float]] = {}
+    for result in completed:
+        previous = 0.0
+        for stage in STAGES:
+            if stage in result["stages"]:
+                at = result["stages"][stage]
+                stage_durations.setdefault(stage, []).append(at - previous)
+                previous = at
+
+    def latency(values: List[float]) -> dict:
+        return {"count": len(values), "p50": _percentile(values, 0.5), "p95": _percentile(values, 0.95)}
+
+    return {
+        "requests": len(results),
+        "completed": len(completed),
+        "failed": len(results) - len(completed),
+        "errors": sorted({r["error"] for r in results if r.get("error")})[:5],
+        "wall_seconds": wall,
+        "throughput_per_minute": len(completed) / wall * 60 if wall else 0.0,
+        "end_to_end": latency([r["seconds"] for r in completed]),
+        "submit": latency([r["submit_seconds"] for r in results]),
+        "status_poll": latency([latency_ for r in results for latency_ in r["poll_latencies"]]),
+        "stages": {stage: latency(values) for stage, values in stage_durations.items()},
+        "memory": {"idle_rss_mb": idle_rss / 2**20, "peak_rss_mb": max(memory, default=idle_rss) / 2**20},
+        "mock_llm": mock_stats,
+    }
+
+
+def _print_report(report: dict):
+    def fmt(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value:8.3f}s"
+
+    print(f"\n{report['completed']}/{report['requests']} comparisons completed in {report['wall_seconds']:.1f}s "
+          f"({report['throughput_per_minute']:.1f}/min)")
+    for error in report["errors"]:
+        print(f"  error: {error[:200]}")
+    print(f"\n{'':14}{'p50':>10}{'p95':>10}{'n':>6}")
+    rows = [("end-to-end", report["end_to_end"]), ("submit", report["submit"]), ("status poll", report["status_poll"])]
+    rows += [(f"  {stage}", stats) for stage, stats in report["stages"].items()]
+    for name, stats in rows:
+        print(f"{name:14}{fmt(stats['p50']):>10}{fmt(stats['p95']):>10}{stats['count']:>6}")
+    memory = report["memory"]
+    print(f"\nbackend RSS: {memory['idle_rss_mb']:.0f} MB idle, {memory['peak_rss_mb']:.0f} MB peak")
+    if report["mock_llm"]:
+        print(f"mock LLM: {json.dumps(report['mock_llm'])}")
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Offline benchmark of the comparison pipeline")
+    parser.add_argument("--requests", type=int, default=10, help="comparisons to run (default %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=4, help="comparisons in flight (default %(default)s)")
+    parser.add_argument("--old", default=DEFAULT_OLD_PDF, help="old APL fixture (default APL13-014.pdf)")
+    parser.add_argument("--new", default=DEFAULT_NEW_PDF, help="new APL fixture (default APL25-008.pdf)")
+    parser.add_argument("--model", default="gpt-4.1")
+    parser.add_argument("--quick", action="store_true", help="skip the estimate and final diff steps")
+    parser.add_argument("--chunked", action="store_true", help="compare section by section")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="run the estimate and final diff steps only for changes the initial diff does not cite")
+    parser.add_argument("--use-cache", action="store_true", help="allow cached model responses between runs")
+    parser.add_argument("--same-pdfs", action="store_true",
+                        help="upload identical bytes every run so extraction is cached after the first")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="seconds between status polls")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the API")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock LLM mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="mock LLM latency standard deviation")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="share of mock LLM requests answered with 429")
+    parser.add_argument("--recordings", help="llm_responses.sqlite to replay recorded responses from")
+    parser.add_argument("--json", help="also write the report to this file")
+    return parser.parse_args(argv)
+
+
+def run(argv=None) -> int:
+    args = _parse_args(sys.argv[1:] if argv is None else argv)
+    mock_port, app_port = _free_port(), _free_port()
+    args.mock_url = f"http://127.0.0.1:{mock_port}"
+    base_url = f"http://127.0.0.1:{app_port}"
+
+    with tempfile.TemporaryDirectory(prefix="apl-benchmark-") as cache_dir:
+        env = dict(os.environ, APL_CACHE_DIR=cache_dir, OPENAI_API_KEY="benchmark",
+                   OPENAI_BASE_URL=f"{args.mock_url}/v1", PYTHONUNBUFFERED="1")
+        mock_cmd = [sys.executable, "-m", "mock_llm", "--port", str(mock_port), "--latency", str(args.latency),
+                    "--jitter", str(args.jitter), "--rate-limit-ratio", str(args.rate_limit_ratio)]
+        if args.recordings:
+            mock_cmd += ["--recordings", os.path.abspath(args.recordings)]
+        app_cmd = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port),
+                   "--workers", str(args.workers), "--log-level", "warning"]
+
+        with open(os.path.join(cache_dir, "mock.log"), "w") as mock_log, \
+             open(os.path.join(cache_dir, "app.log"), "w") as app_log:
+            mock = subprocess.Popen(mock_cmd, cwd=BACKEND_DIR, env=env, stdout=mock_log, stderr=subprocess.STDOUT)
+            app = subprocess.Popen(app_cmd, cwd=BACKEND_DIR, env=env, stdout=app_log, stderr=subprocess.STDOUT)
+            try:
+                asyncio.run(_wait_ready(f"{args.mock_url}/stats"))
+                asyncio.run(_wait_ready(f"{base_url}/"))
+                report = asyncio.run(_drive(args, base_url, app.pid))
+            finally:
+                for process in (app, mock):
+                    process.terminate()
+                for process in (app, mock):
+                    try:
+                        process.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run())
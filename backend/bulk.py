@@ -0,0 +1,187 @@
+"""Bulk comparison of a release of APLs: pairing, a bounded worker pool and result files."""
+import os
+import json
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Collection, Dict, List, Optional, Tuple
+
+from apl_metadata import extract_apl_info, superseded_apl_numbers
+from extraction_cache import CACHE_DIR
+from pdf_extraction import ExtractedDocument
+
+logger = logging.getLogger(__name__)
+
+# Comparisons run at once in a bulk job, and where job inputs and results are written
+BULK_MAX_CONCURRENCY = int(os.getenv("BULK_MAX_CONCURRENCY", "4"))
+BULK_OUTPUT_DIR = os.getenv("BULK_OUTPUT_DIR", os.path.join(CACHE_DIR, "bulk"))
+
+INDEX_FILENAME = "index.json"
+
+
+@dataclass
+class APLPair:
+    """A predecessor APL and the letter that supersedes it."""
+    old_path: str
+    new_path: str
+
+    @property
+    def old_filename(self) -> str:
+        return os.path.basename(self.old_path)
+
+    @property
+    def new_filename(self) -> str:
+        return os.path.basename(self.new_path)
+
+    @property
+    def name(self) -> str:
+        old_stem = os.path.splitext(self.old_filename)[0]
+        new_stem = os.path.splitext(self.new_filename)[0]
+        return f"{old_stem}_vs_{new_stem}"
+
+
+def find_pdfs(directory: str) -> List[str]:
+    """List the PDF files in a directory, sorted by name."""
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith(".pdf")
+    )
+
+
+def manifest_entries(manifest: Any) -> List[Tuple[str, str]]:
+    """
+    Return the (old, new) paths a parsed manifest names.
+
+    The manifest is a list of {"old": ..., "new": ...} objects, or an object
+    with such a list under "pairs". Raises ValueError if it is neither.
+    """
+    entries = manifest.get("pairs") if isinstance(manifest, dict) else manifest
+    if not isinstance(entries, list):
+        raise ValueError('Manifest must be a list of {"old": ..., "new": ...} objects')
+    pairs = []
+    for entry in entries:
+        if not (isinstance(entry, dict) and isinstance(entry.get("old"), str) and isinstance(entry.get("new"), str)):
+            raise ValueError(f"Manifest entry {entry!r} needs an \"old\" and a \"new\" filename")
+        pairs.append((entry["old"], entry["new"]))
+    return pairs
+
+
+def load_manifest(manifest_path: str, allowed_files: Optional[Collection[str]] = None) -> List[APLPair]:
+    """
+    Read explicit pairs from a JSON manifest.
+
+    Relative paths are resolved against the manifest's directory. When
+    ``allowed_files`` is given (the files uploaded for a job), every entry
+    must name one of them exactly, so the manifest cannot reach outside the
+    job's input directory.
+    """
+    with open(manifest_path, "r") as f:
+        entries = manifest_entries(json.load(f))
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    if allowed_files is not None:
+        unknown = sorted({name for entry in entries for name in entry if name not in allowed_files})
+        if unknown:
+            raise ValueError(f"Manifest names files that were not uploaded: {', '.join(unknown)}")
+    return [APLPair(os.path.join(base_dir, old), os.path.join(base_dir, new)) for old, new in entries]
+
+
+def pair_apls(
+    paths: List[str], load_document: Callable[[str], ExtractedDocument]
+) -> Tuple[List[APLPair], List[str]]:
+    """
+    Pair predecessor and successor letters found among ``paths``.
+
+    Letters are identified by the APL number in their filename and paired
+    through the "SUPERSEDES ALL PLAN LETTER xx-xxx" line in the successor's
+    header. Returns the pairs and the paths that could not be paired.
+    """
+    by_number: Dict[str, str] = {}
+    for path in paths:
+        info = extract_apl_info(os.path.basename(path))
+        if info:
+            by_number[info["apl_number"]] = path
+
+    pairs: List[APLPair] = []
+    paired = set()
+    for number, new_path in sorted(by_number.items()):
+        for superseded in superseded_apl_numbers(load_document(new_path)):
+            old_path = by_number.get(superseded)
+            if old_path is not None:
+                pairs.append(APLPair(old_path, new_path))
+                paired.update((old_path, new_path))
+
+    unpaired = [path for path in paths if path not in paired]
+    logger.info(f"Paired {len(pairs)} APL pairs from {len(paths)} files ({len(unpaired)} unpaired)")
+    return pairs, unpaired
+
+
+def _write_json(path: str, content: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+async def run_bulk(
+    pairs: List[APLPair],
+    compare: Callable[[APLPair], Awaitable[Optional[dict]]],
+    output_dir: str,
+    concurrency: int = BULK_MAX_CONCURRENCY,
+    on_progress: Optional[Callable[[Dict[str, Any], Dict[str, int]], Awaitable[None]]] = None,
+    unpaired: Optional[List[str]] = None,
+) -> dict:
+    """
+    Run ``compare`` over every pair with at most ``concurrency`` at once.
+
+    ``compare`` returns the finished task dict ("status" plus "json" or
+    "error"). Each completed pair's result JSON is written to
+    ``<output_dir>/<old>_vs_<new>.json`` and a summary index of every pair
+    to ``<output_dir>/index.json``, which is also returned. ``on_progress``
+    is awaited after each pair with that pair's index entry and the
+    aggregate counts.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    semaphore = asyncio.Semaphore(concurrency)
+    progress = {"total": len(pairs), "completed": 0, "failed": 0}
+    started = time.monotonic()
+
+    async def run(pair: APLPair) -> Dict[str, Any]:
+        async with semaphore:
+            pair_started = time.monotonic()
+            task_info = await compare(pair) or {"status": "failed", "error": "Task expired before it was collected"}
+        entry: Dict[str, Any] = {
+            "name": pair.name,
+            "old": pair.old_filename,
+            "new": pair.new_filename,
+            "status": task_info["status"],
+            "seconds": round(time.monotonic() - pair_started, 2),
+        }
+        if task_info["status"] == "completed":
+            output_file = f"{pair.name}.json"
+            await asyncio.to_thread(_write_json, os.path.join(output_dir, output_file), task_info["json"])
+            entry["output"] = output_file
+            if task_info.get("metrics"):
+                entry["cost_usd"] = task_info["metrics"].get("cost_usd")
+            try:
+                entry["bullets"] = len(json.loads(task_info["json"]).get("bullets", []))
+            except (ValueError, AttributeError):
+                pass
+            progress["completed"] += 1
+        else:
+            entry["error"] = task_info.get("error", "Unknown error")
+            progress["failed"] += 1
+        if on_progress is not None:
+            await on_progress(entry, dict(progress))
+        return entry
+
+    entries = await asyncio.gather(*(run(pair) for pair in pairs))
+    index = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "seconds": round(time.monotonic() - started, 2),
+        **progress,
+        "pairs": list(entries),
+        "unpaired": [os.path.basename(path) for path in unpaired or []],
+    }
+    await asyncio.to_thread(_write_json, os.path.join(output_dir, INDEX_FILENAME), json.dumps(index, indent=2))
+    return index
@@ -0,0 +1,120 @@
+"""Local resolution and verification of the page/line citations in a diff JSON."""
+import os
+import re
+import json
+import logging
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from pdf_extraction import ExtractedDocument
+from diff_schema import parse_json_object, repair_diff
+
+logger = logging.getLogger(__name__)
+
+# Words per shingle, and the share of a citation's shingles that must agree on a location
+SHINGLE_SIZE = int(os.getenv("CITATION_SHINGLE_SIZE", "3"))
+CITATION_MIN_MATCH = float(os.getenv("CITATION_MIN_MATCH", "0.4"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _tokenize(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+class CitationIndex:
+    """
+    Shingle index over the words of an extracted document.
+
+    Every word position maps back to its global line so a matching shingle
+    can be turned into a page/line pair. Lookups cost time proportional to
+    the citation's length, not the document's.
+    """
+
+    def __init__(self, document: ExtractedDocument):
+        self.document = document
+        self.token_lines = array("I")
+        tokens: List[str] = []
+        global_line = 0
+        for _, _, line_text in document.iter_lines():
+            for token in _tokenize(line_text):
+                tokens.append(token)
+                self.token_lines.append(global_line)
+            global_line += 1
+
+        self.shingles: Dict[Tuple[str, ...], List[int]] = defaultdict(list)
+        for position in range(len(tokens) - SHINGLE_SIZE + 1):
+            self.shingles[tuple(tokens[position:position + SHINGLE_SIZE])].append(position)
+
+    def locate(self, text: str) -> Optional[Tuple[int, int, float]]:
+        """
+        Find where a quoted passage starts.
+
+        Each shingle of the passage votes for the document position the
+        passage would start at. Returns (page, line, match share) for the
+        best-supported start, or None if too few shingles agree.
+        """
+        tokens = _tokenize(text)
+        if len(tokens) < SHINGLE_SIZE:
+            return None
+        shingle_count = len(tokens) - SHINGLE_SIZE + 1
+
+        votes: Counter = Counter()
+        for offset in range(shingle_count):
+            for position in self.shingles.get(tuple(tokens[offset:offset + SHINGLE_SIZE]), ()):
+                if position >= offset:
+                    votes[position - offset] += 1
+        if not votes:
+            return None
+
+        start, count = votes.most_common(1)[0]
+        share = count / shingle_count
+        if share < CITATION_MIN_MATCH:
+            return None
+        page, line = self.document.locate(self.token_lines[start])
+        return page, line, share
+
+
+def _resolve(citation: dict, indexes: List[CitationIndex]) -> Optional[Tuple[int, int, float]]:
+    """Best location of a citation's text in any of ``indexes``."""
+    locations = [location for location in (index.locate(citation.get("text") or "") for index in indexes) if location]
+    return max(locations, key=lambda location: location[2], default=None)
+
+
+def resolve_citations(
+    diff_json: str, old_index: CitationIndex, new_index: CitationIndex, old_key: str, new_key: str
+) -> str:
+    """
+    Rewrite each bullet's citation page/line to the location of its quoted text.
+
+    Citations under ``old_key`` are looked up in the old APL and those under
+    ``new_key`` in the new one. When both APLs share a key (two letters of
+    the same year) the quote is looked up in both and the better match wins.
+    Citations whose text is found are marked ``"verified": true``; those that
+    cannot be found keep the model's page/line and are marked false.
+
+    The diff is repaired first (see diff_schema.py), so citation lists or
+    strings from the model are normalized rather than skipped.
+    """
+    diff_data = repair_diff(parse_json_object(diff_json) if isinstance(diff_json, str) else diff_json)
+    indexes: Dict[str, List[CitationIndex]] = defaultdict(list)
+    indexes[old_key].append(old_index)
+    indexes[new_key].append(new_index)
+    resolved = unverified = 0
+
+    for bullet in diff_data["bullets"]:
+        for key, citation in bullet["citations"].items():
+            if not isinstance(citation, dict) or key not in indexes:
+                continue
+            location = _resolve(citation, indexes[key])
+            if location is None:
+                citation["verified"] = False
+                unverified += 1
+                continue
+            citation["page"], citation["line"] = location[0], location[1]
+            citation["verified"] = True
+            resolved += 1
+
+    logger.info(f"Resolved {resolved} citations locally, {unverified} could not be found")
+    return json.dumps(diff_data)
@@ -0,0 +1,111 @@
+"""
+Headless command line entry point.
+
+Compare a release of APLs without the web server, from the backend directory:
+
+    python -m cli bulk path/to/release --output results/
+    python -m cli bulk --manifest pairs.json --quick
+
+Rebuild the search index from every comparison in the lineage index:
+
+    python -m cli index
+"""
+import os
+import sys
+import uuid
+import asyncio
+import argparse
+
+from bulk import BULK_MAX_CONCURRENCY, BULK_OUTPUT_DIR, find_pdfs
+import bulk
+import main
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m cli", description="APL comparison tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bulk_parser = commands.add_parser("bulk", help="compare every predecessor/successor pair in a release")
+    source = bulk_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("directory", nargs="?", help="directory of APL PDFs, paired by supersession")
+    source.add_argument("--manifest", help='JSON list of {"old": path, "new": path} pairs')
+    bulk_parser.add_argument("--output", help=f"directory for result files (default {BULK_OUTPUT_DIR}/<job id>)")
+    bulk_parser.add_argument("--model", default="gpt-4.1")
+    bulk_parser.add_argument("--quick", action="store_true", help="skip the estimate and final diff steps")
+    bulk_parser.add_argument("--chunked", action="store_true", help="compare section by section")
+    bulk_parser.add_argument("--adaptive", action="store_true",
+                             help="run the estimate and final diff steps only for changes the initial diff does not cite")
+    bulk_parser.add_argument("--bypass-cache", action="store_true", help="ignore cached model responses")
+    bulk_parser.add_argument("--concurrency", type=int, default=BULK_MAX_CONCURRENCY,
+                             help="comparisons run at once (default %(default)s)")
+
+    commands.add_parser("index", help="add every stored comparison and its letters to the search index")
+    return parser.parse_args(argv)
+
+
+async def _run_bulk(args) -> int:
+    job_id = f"bulk_{uuid.uuid4().hex[:12]}"
+    output_dir = os.path.abspath(args.output or os.path.join(BULK_OUTPUT_DIR, job_id))
+    try:
+        index = await main.run_bulk_comparison(
+            job_id,
+            output_dir,
+            args.quick,
+            args.model,
+            not args.bypass_cache,
+            args.chunked,
+            pdf_paths=find_pdfs(args.directory) if args.directory else None,
+            manifest_path=args.manifest,
+            concurrency=args.concurrency,
+            adaptive_mode=args.adaptive,
+        )
+    finally:
+        await main.close_client()
+        main.shutdown_executor()
+
+    if index is None:
+        return 1
+    print(
+        f"{index['completed']} of {index['total']} pairs completed, {index['failed']} failed "
+        f"in {index['seconds']}s; index written to {os.path.join(output_dir, bulk.INDEX_FILENAME)}"
+    )
+    for path in index["unpaired"]:
+        print(f"  unpaired: {path}")
+    return 0 if index["failed"] == 0 else 1
+
+
+def _run_index() -> int:
+    from extraction_cache import extraction_cache
+    from lineage import lineage_index
+    from search_index import search_index
+
+    comparisons = lineage_index.all_comparisons()
+    documents = 0
+    for comparison in comparisons:
+        for side in ("old", "new"):
+            document = extraction_cache.get(comparison[f"{side}_sha256"])
+            if document is None:
+                print(f"  skipped text of APL {comparison[f'{side}_number']}: extracted text is no longer cached")
+                continue
+            documents += search_index.index_document(
+                comparison[f"{side}_sha256"], comparison[f"{side}_number"], comparison[f"{side}_filename"], document
+            )
+        search_index.index_comparison(
+            comparison["old_sha256"], comparison["new_sha256"],
+            comparison["old_number"], comparison["new_number"], comparison["diff"],
+        )
+    print(f"Indexed {len(comparisons)} comparisons and {documents} new documents; {search_index.stats()}")
+    return 0
+
+
+def run(argv=None) -> int:
+    args = _parse_args(sys.argv[1:] if argv is None else argv)
+    if args.command == "bulk":
+        return asyncio.run(_run_bulk(args))
+    if args.command == "index":
+        return _run_index()
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,247 @@
+"""Citation coverage of a new APL's changed text, used by adaptive mode to limit the estimate/final loop."""
+import os
+import re
+import json
+import bisect
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from pdf_extraction import ExtractedDocument
+from diff_prepass import Segment, compute_hunks, split_segments
+from citations import CitationIndex
+from sections import align_sections, section_texts, split_sections
+
+logger = logging.getLogger(__name__)
+
+# Share of the new APL's changed text the initial diff must cite for adaptive mode to skip the
+# estimate/final loop
+COVERAGE_THRESHOLD = float(os.getenv("COVERAGE_THRESHOLD", "0.9"))
+# Lines before or after a changed sentence at which a citation still counts for it
+COVERAGE_LINE_WINDOW = int(os.getenv("COVERAGE_LINE_WINDOW", "3"))
+# Word overlap (Jaccard) at which a final-diff bullet in the same section stands for an initial bullet
+COVERAGE_BULLET_SIMILARITY = float(os.getenv("COVERAGE_BULLET_SIMILARITY", "0.5"))
+
+_WORD = re.compile(r"\w+")
+_BULLET_WORD = re.compile(r"[a-z0-9]{3,}")
+
+
+@dataclass
+class CoverageReport:
+    """How much of the new APL's changed text the initial diff cites, and where it does not."""
+    ratio: float
+    changed_chars: int
+    uncovered: List[Segment] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            "ratio": round(self.ratio, 3),
+            "changed_chars": self.changed_chars,
+            "uncovered": [{"page": s.page, "line": s.line, "text": s.text} for s in self.uncovered],
+        }
+
+
+def _global_line(document: ExtractedDocument, page: int, line: int) -> int:
+    return document.page_line_starts[page - 1] + line - 1
+
+
+def _citation_line(index: CitationIndex, citation: dict) -> Optional[int]:
+    """
+    Global line a citation points to.
+
+    The citation is located by its quoted text, falling back to the model's
+    page/line; None if neither gives a line of the document.
+    """
+    document = index.document
+    location = index.locate(str(citation.get("text") or ""))
+    if location is not None:
+        return _global_line(document, location[0], location[1])
+    try:
+        page, line = int(citation.get("page")), int(citation.get("line"))
+    except (TypeError, ValueError):
+        return None
+    if not (1 <= page <= document.page_count and 1 <= line <= len(document.line_offsets[page - 1])):
+        return None
+    return _global_line(document, page, line)
+
+
+def _cited_spans(diff_json: str, key: str, document: ExtractedDocument) -> List[Tuple[int, int]]:
+    """
+    Global line spans of every citation of ``key`` in a diff.
+
+    A quote covers about as many lines as its length fills.
+    """
+    index = CitationIndex(document)
+    line_width = max(1, len(document.text) // max(1, document.line_count))
+    spans = []
+    for bullet in json.loads(diff_json).get("bullets", []):
+        citation = (bullet.get("citations") or {}).get(key) if isinstance(bullet, dict) else None
+        if not isinstance(citation, dict):
+            continue
+        start = _citation_line(index, citation)
+        if start is not None:
+            spans.append((start, start + len(str(citation.get("text") or "")) // line_width))
+    return spans
+
+
+def _segment_ends(document: ExtractedDocument, segments: List[Segment]) -> Dict[Tuple[int, int, str], int]:
+    """Global line on which each segment ends (where the next one starts)."""
+    ends = {}
+    for index, segment in enumerate(segments):
+        if index + 1 < len(segments):
+            end = _global_line(document, segments[index + 1].page, segments[index + 1].line)
+        else:
+            end = document.line_count - 1
+        ends[(segment.page, segment.line, segment.text)] = end
+    return ends
+
+
+def measure_coverage(
+    old_document: ExtractedDocument, new_document: ExtractedDocument, diff_json: str, new_key: str
+) -> CoverageReport:
+    """
+    Measure how much of the new APL's changed text the diff's citations point into.
+
+    Changed text is every new-APL sentence inside an addition or update hunk
+    of the local sentence diff (see diff_prepass.py), except sentences whose
+    words match a replaced old sentence. A sentence is covered when a
+    citation of ``new_key`` falls within COVERAGE_LINE_WINDOW lines of it.
+    Coverage is weighted by sentence length.
+    """
+    changed = []
+    for hunk in compute_hunks(old_document, new_document):
+        # Sentences that differ only in case, spacing or punctuation are editorial and need no bullet
+        old_words = {tuple(_WORD.findall(segment.text.lower())) for segment in hunk.old_segments}
+        changed.extend(
+            segment for segment in hunk.new_segments if tuple(_WORD.findall(segment.text.lower())) not in old_words
+        )
+    changed_chars = sum(len(segment.text) for segment in changed)
+    if not changed_chars:
+        return CoverageReport(1.0, 0)
+
+    spans = _cited_spans(diff_json, new_key, new_document)
+    ends = _segment_ends(new_document, split_segments(new_document))
+    covered_chars = 0
+    uncovered = []
+    for segment in changed:
+        start = _global_line(new_document, segment.page, segment.line)
+        end = ends.get((segment.page, segment.line, segment.text), start)
+        if any(
+            cited_start <= end + COVERAGE_LINE_WINDOW and cited_end >= start - COVERAGE_LINE_WINDOW
+            for cited_start, cited_end in spans
+        ):
+            covered_chars += len(segment.text)
+        else:
+            uncovered.append(segment)
+    return CoverageReport(covered_chars / changed_chars, changed_chars, uncovered)
+
+
+def uncovered_section_texts(
+    old_document: ExtractedDocument, new_document: ExtractedDocument, uncovered: List[Segment]
+) -> Tuple[str, str, List[str]]:
+    """
+    Return the old and new text of the sections holding uncovered changes, and their titles.
+
+    New sections containing an uncovered sentence are paired with their old
+    counterparts by heading (see sections.py). Each section is introduced
+    with the page and line where it starts so the model can still cite it.
+    """
+    new_sections = split_sections(new_document)
+    starts = [_global_line(new_document, section.page, section.line) for section in new_sections]
+
+    wanted = {
+        id(new_sections[max(0, bisect.bisect_right(starts, _global_line(new_document, s.page, s.line)) - 1)])
+        for s in uncovered
+    }
+    pairs = [
+        (old_section, new_section)
+        for old_section, new_section in align_sections(split_sections(old_document), new_sections)
+        if new_section is not None and id(new_section) in wanted
+    ]
+    old_text, new_text = section_texts(pairs)
+    return old_text, new_text, [new_section.title for _, new_section in pairs]
+
+
+def _bullet_words(bullet: dict) -> set:
+    text = f"{bullet.get('bullet_title') or ''} {bullet.get('bullet_content') or ''}"
+    return set(_BULLET_WORD.findall(text.lower()))
+
+
+class SectionLocator:
+    """
+    Which aligned old/new section pair a bullet's citations point into.
+
+    ``pairs`` holds the pairs of ``align_sections`` and ``locate`` returns
+    an index into it.
+    """
+
+    def __init__(self, old_document: ExtractedDocument, new_document: ExtractedDocument, old_key: str, new_key: str):
+        old_sections, new_sections = split_sections(old_document), split_sections(new_document)
+        self.pairs = align_sections(old_sections, new_sections)
+        pair_of: Dict[int, int] = {}
+        for pair_index, pair in enumerate(self.pairs):
+            for section in pair:
+                if section is not None:
+                    pair_of[id(section)] = pair_index
+        # Citations of the new APL are tried first; redactions only cite the old one
+        self.lookups = []
+        for key, document, sections in ((new_key, new_document, new_sections), (old_key, old_document, old_sections)):
+            starts = [_global_line(document, section.page, section.line) for section in sections]
+            pairs = [pair_of[id(section)] for section in sections]
+            self.lookups.append((key, CitationIndex(document), starts, pairs))
+
+    def locate(self, bullet: dict) -> Optional[int]:
+        citations = bullet.get("citations") or {}
+        for key, index, starts, pairs in self.lookups:
+            citation = citations.get(key) if isinstance(citations, dict) else None
+            if not isinstance(citation, dict) or not starts:
+                continue
+            line = _citation_line(index, citation)
+            if line is not None:
+                return pairs[max(0, bisect.bisect_right(starts, line) - 1)]
+        return None
+
+
+def keep_initial_bullets(
+    final_diff_json: str,
+    initial_diff_json: str,
+    old_document: ExtractedDocument,
+    new_document: ExtractedDocument,
+    old_key: str,
+    new_key: str,
+) -> str:
+    """
+    Add back initial-diff bullets a partial final diff left out.
+
+    A final diff made from only some sections can drop bullets about the
+    others. An initial bullet counts as kept when a final bullet cites the
+    same section (see sections.py) and their words overlap by at least
+    COVERAGE_BULLET_SIMILARITY; a bullet whose section cannot be told is
+    compared with every final bullet. Any other initial bullet is appended,
+    and the scoring stage merges near-duplicates this leaves.
+    """
+    locator = SectionLocator(old_document, new_document, old_key, new_key)
+    final_data = json.loads(final_diff_json)
+    final_bullets = final_data.setdefault("bullets", [])
+    kept = [
+        (locator.locate(bullet), _bullet_words(bullet)) for bullet in final_bullets if isinstance(bullet, dict)
+    ]
+
+    def is_kept(bullet: dict) -> bool:
+        section, words = locator.locate(bullet), _bullet_words(bullet)
+        for final_section, final_words in kept:
+            if section is not None and final_section is not None and section != final_section:
+                continue
+            union = words | final_words
+            if union and len(words & final_words) / len(union) >= COVERAGE_BULLET_SIMILARITY:
+                return True
+        return False
+
+    restored = [
+        bullet for bullet in json.loads(initial_diff_json).get("bullets", [])
+        if isinstance(bullet, dict) and not is_kept(bullet)
+    ]
+    final_bullets.extend(restored)
+    if restored:
+        logger.info(f"Kept {len(restored)} initial bullets missing from the partial final diff")
+    return json.dumps(final_data)
@@ -0,0 +1,174 @@
+"""Deterministic diff between two extracted APLs, used to shrink model input to changed regions."""
+import os
+import re
+import difflib
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from pdf_extraction import ExtractedDocument
+
+# Unchanged segments shown around each hunk, and the largest unchanged gap merged into one hunk
+DIFF_CONTEXT_SEGMENTS = int(os.getenv("DIFF_CONTEXT_SEGMENTS", "1"))
+DIFF_MERGE_GAP = int(os.getenv("DIFF_MERGE_GAP", "1"))
+# Above this share of changed text the hunk view saves nothing and full texts are sent instead
+DIFF_MAX_CHANGED_RATIO = float(os.getenv("DIFF_MAX_CHANGED_RATIO", "0.75"))
+
+# difflib opcode -> revision type used in the diff JSON
+REVISION_TYPES = {"insert": "addition", "replace": "update", "delete": "redaction"}
+
+_WHITESPACE = re.compile(r"\s+")
+_SENTENCE_BREAK = re.compile(r"(?<=[.;?!])\s+(?=[A-Z0-9(\"“•])")
+_TERMINAL = (".", ";", "?", "!", ":")
+
+
+@dataclass
+class Segment:
+    """A sentence (or heading) of a document anchored at the page/line where it starts."""
+    page: int
+    line: int
+    text: str
+
+
+@dataclass
+class DiffHunk:
+    """A block of changed segments with its page/line anchors and surrounding new-APL context."""
+    revision_type: str
+    old_segments: List[Segment] = field(default_factory=list)
+    new_segments: List[Segment] = field(default_factory=list)
+    context_before: List[Segment] = field(default_factory=list)
+    context_after: List[Segment] = field(default_factory=list)
+
+
+def _is_heading(text: str) -> bool:
+    return len(text) < 80 and not any(c.islower() for c in text)
+
+
+def split_segments(document: ExtractedDocument) -> List[Segment]:
+    """
+    Split a document into whitespace-normalized sentences anchored to their first line.
+
+    Sentences are used instead of raw lines so that text re-wrapped between
+    APL versions still lines up, while every unit keeps a page/line anchor.
+    """
+    segments: List[Segment] = []
+    current: List[str] = []
+    anchor: Tuple[int, int] = (0, 0)
+
+    def close():
+        if current:
+            segments.append(Segment(anchor[0], anchor[1], " ".join(current)))
+            current.clear()
+
+    for page, line, raw_text in document.iter_lines():
+        text = _WHITESPACE.sub(" ", raw_text).strip()
+        if not text:
+            continue
+        if _is_heading(text):
+            close()
+            segments.append(Segment(page, line, text))
+            continue
+        pieces = _SENTENCE_BREAK.split(text)
+        for index, piece in enumerate(pieces):
+            if not current:
+                anchor = (page, line)
+            current.append(piece)
+            if index < len(pieces) - 1 or piece.endswith(_TERMINAL):
+                close()
+    close()
+    return segments
+
+
+def _merge_opcodes(opcodes: List[Tuple[str, int, int, int, int]]) -> List[Tuple[str, int, int, int, int]]:
+    """Merge changed blocks separated by small unchanged gaps into single blocks."""
+    merged: List[List] = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            continue
+        if merged and i1 - merged[-1][2] <= DIFF_MERGE_GAP and j1 - merged[-1][4] <= DIFF_MERGE_GAP:
+            previous = merged[-1]
+            if previous[0] != tag:
+                previous[0] = "replace"
+            previous[2], previous[4] = i2, j2
+        else:
+            merged.append([tag, i1, i2, j1, j2])
+    return [tuple(block) for block in merged]
+
+
+def compute_hunks(old_document: ExtractedDocument, new_document: ExtractedDocument) -> List[DiffHunk]:
+    """Diff two documents sentence by sentence and return the changed hunks in reading order."""
+    old_segments = split_segments(old_document)
+    new_segments = split_segments(new_document)
+    matcher = difflib.SequenceMatcher(
+        None, [s.text for s in old_segments], [s.text for s in new_segments], autojunk=False
+    )
+
+    hunks = []
+    for tag, i1, i2, j1, j2 in _merge_opcodes(matcher.get_opcodes()):
+        hunks.append(DiffHunk(
+            revision_type=REVISION_TYPES[tag],
+            old_segments=old_segments[i1:i2],
+            new_segments=new_segments[j1:j2],
+            context_before=new_segments[max(0, j1 - DIFF_CONTEXT_SEGMENTS):j1],
+            context_after=new_segments[j2:j2 + DIFF_CONTEXT_SEGMENTS],
+        ))
+    return hunks
+
+
+def changed_ratio(hunks: List[DiffHunk], old_document: ExtractedDocument, new_document: ExtractedDocument) -> float:
+    """Share of the two documents' characters that fall inside changed hunks."""
+    total = len(old_document.text) + len(new_document.text)
+    if total == 0:
+        return 0.0
+    changed = sum(len(s.text) for h in hunks for s in h.old_segments + h.new_segments)
+    return changed / total
+
+
+def min_changed_ratio(old_document: ExtractedDocument, new_document: ExtractedDocument) -> float:
+    """
+    Lower bound of ``changed_ratio`` from the sentences the two documents share verbatim.
+
+    Only sentences present in both documents can fall outside a hunk, so
+    this cheap count tells when a pair is too rewritten for the hunk view
+    (see DIFF_MAX_CHANGED_RATIO) without running the sentence diff.
+    """
+    total = len(old_document.text) + len(new_document.text)
+    if total == 0:
+        return 0.0
+    old_texts = Counter(s.text for s in split_segments(old_document))
+    new_texts = Counter(s.text for s in split_segments(new_document))
+    shared = sum(len(text) * count for text, count in (old_texts & new_texts).items())
+    return max(0.0, 1 - 2 * shared / total)
+
+
+def _anchor(segments: List[Segment]) -> str:
+    first, last = segments[0], segments[-1]
+    if first.page == last.page:
+        return f"p.{first.page} l.{first.line}-{last.line}"
+    return f"p.{first.page} l.{first.line} - p.{last.page} l.{last.line}"
+
+
+def render_hunks(hunks: List[DiffHunk], old_key: str, new_key: str) -> str:
+    """
+    Render hunks as a compact, anchored text view for the model.
+
+    Segments prefixed with "-" exist only in the old APL, "+" only in the new
+    APL, and " " are unchanged context from the new APL. Every segment
+    carries the page/line where it starts.
+    """
+    if not hunks:
+        return "(No textual differences were found between the two APLs.)"
+
+    blocks = []
+    for number, hunk in enumerate(hunks, start=1):
+        header = [f"[Hunk {number}] {hunk.revision_type}"]
+        if hunk.old_segments:
+            header.append(f"{old_key} {_anchor(hunk.old_segments)}")
+        if hunk.new_segments:
+            header.append(f"{new_key} {_anchor(hunk.new_segments)}")
+        body = [f"  {new_key} p.{s.page} l.{s.line}: {s.text}" for s in hunk.context_before]
+        body += [f"- {old_key} p.{s.page} l.{s.line}: {s.text}" for s in hunk.old_segments]
+        body += [f"+ {new_key} p.{s.page} l.{s.line}: {s.text}" for s in hunk.new_segments]
+        body += [f"  {new_key} p.{s.page} l.{s.line}: {s.text}" for s in hunk.context_after]
+        blocks.append(" | ".join(header) + "\n" + "\n".join(body))
+    return "\n\n".join(blocks)
@@ -0,0 +1,198 @@
+"""Schema of the diff JSON the pipeline produces, with local repair of near-miss model output."""
+import re
+import json
+import logging
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+logger = logging.getLogger(__name__)
+
+REVISION_TYPES = ("addition", "update", "redaction")
+
+# Spellings the model uses for each revision type, matched by prefix
+_REVISION_ALIASES = {
+    "add": "addition", "new": "addition", "insert": "addition",
+    "update": "update", "modif": "update", "chang": "update", "revis": "update", "amend": "update", "expan": "update",
+    "redact": "redaction", "remov": "redaction", "delet": "redaction", "rescind": "redaction", "retir": "redaction",
+}
+_BULLET_KEY_ALIASES = {
+    "bullet_title": ("title", "heading", "name"),
+    "bullet_content": ("content", "bullet", "summary", "description", "details", "text"),
+    "revision_type": ("type", "category", "change_type", "revision"),
+}
+_CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_NUMBER = re.compile(r"\d+")
+
+
+class DiffValidationError(ValueError):
+    """Model output that is not a diff document even after local repair."""
+
+
+class Citation(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    page: Optional[int] = None
+    line: Optional[int] = None
+    text: str = ""
+
+
+class Bullet(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    bullet_title: str
+    bullet_content: str = ""
+    revision_type: Literal["addition", "update", "redaction"]
+    citations: Dict[str, Optional[Citation]] = {}
+    score: Optional[int] = None
+
+
+class DiffDocument(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    title: str = ""
+    summary: str = ""
+    bullets: List[Bullet] = []
+    conclusion: str = ""
+
+
+def parse_json_object(raw: str) -> dict:
+    """
+    Parse a JSON object from model output.
+
+    Tolerates a Markdown code fence, text around the object and trailing
+    commas; raises DiffValidationError if no object can be read.
+    """
+    text = _CODE_FENCE.sub("", raw or "").strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise DiffValidationError("Model output contains no JSON object")
+    text = text[start:end + 1]
+    for candidate in (text, _TRAILING_COMMA.sub(r"\1", text)):
+        try:
+            parsed = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(parsed, dict):
+            return parsed
+    raise DiffValidationError("Model output is not valid JSON")
+
+
+def _revision_type(value: Any) -> Optional[str]:
+    value = str(value or "").strip().lower()
+    for prefix, revision_type in _REVISION_ALIASES.items():
+        if value.startswith(prefix):
+            return revision_type
+    return None
+
+
+def _as_int(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = _NUMBER.search(str(value or ""))
+    return int(match.group()) if match else None
+
+
+def _repair_citation(value: Any) -> Optional[dict]:
+    if isinstance(value, list):
+        value = next((item for item in value if item), None)
+    if isinstance(value, str):
+        return {"page": None, "line": None, "text": value} if value.strip() else None
+    if not isinstance(value, dict):
+        return None
+    return dict(value, page=_as_int(value.get("page")), line=_as_int(value.get("line")), text=str(value.get("text") or ""))
+
+
+def _repair_bullet(bullet: Any, revision_type: Optional[str] = None) -> Optional[dict]:
+    if not isinstance(bullet, dict):
+        return None
+    repaired = dict(bullet)
+    for key, aliases in _BULLET_KEY_ALIASES.items():
+        if not repaired.get(key):
+            repaired[key] = next((repaired[alias] for alias in aliases if repaired.get(alias)), repaired.get(key))
+    repaired["revision_type"] = _revision_type(repaired.get("revision_type")) or revision_type
+    if not repaired["revision_type"] or not (repaired.get("bullet_title") or repaired.get("bullet_content")):
+        return None
+    repaired["bullet_title"] = str(repaired.get("bullet_title") or "")
+    repaired["bullet_content"] = str(repaired.get("bullet_content") or "")
+
+    citations = repaired.get("citations")
+    if isinstance(citations, list):
+        # [{"APL25": {...}}, ...] or [{"key": "APL25", ...}, ...]
+        merged: Dict[str, Any] = {}
+        for item in citations:
+            if isinstance(item, dict) and "key" in item:
+                merged[str(item["key"])] = item
+            elif isinstance(item, dict):
+                merged.update(item)
+        citations = merged
+    repaired["citations"] = (
+        {str(key): _repair_citation(value) for key, value in citations.items()} if isinstance(citations, dict) else {}
+    )
+    if "score" in repaired:
+        repaired["score"] = _as_int(repaired["score"])
+        if repaired["score"] is None:
+            del repaired["score"]
+    return repaired
+
+
+def repair_diff(data: dict) -> dict:
+    """
+    Bring a parsed diff close to the schema.
+
+    Accepts the older "categories" layout ({"Additions": [...], ...}),
+    common key and revision type misspellings, citation strings and lists,
+    and page/line numbers given as text. Bullets without a title or content,
+    or without a recognizable revision type, are dropped.
+    """
+    raw_bullets: List[tuple] = [(bullet, None) for bullet in data.get("bullets") or [] if bullet]
+    categories = data.get("categories")
+    if isinstance(categories, dict):
+        for category, bullets in categories.items():
+            raw_bullets.extend((bullet, _revision_type(category)) for bullet in bullets or [])
+
+    bullets = [_repair_bullet(bullet, revision_type) for bullet, revision_type in raw_bullets]
+    repaired = {key: value for key, value in data.items() if key not in ("bullets", "categories")}
+    repaired["bullets"] = [bullet for bullet in bullets if bullet is not None]
+    for key in ("title", "summary", "conclusion"):
+        repaired[key] = str(repaired.get(key) or "")
+
+    dropped = len(raw_bullets) - len(repaired["bullets"])
+    if dropped:
+        logger.warning(f"Dropped {dropped} of {len(raw_bullets)} bullets that could not be repaired")
+    return repaired
+
+
+def repair_section_diff(data: dict) -> dict:
+    """
+    Bring one section's diff result ({"bullets": [...], "impact": "..."}) close to the schema.
+
+    Bullets are repaired as in ``repair_diff``; a missing or non-text impact
+    becomes an empty string.
+    """
+    impact = data.get("impact")
+    return {
+        "bullets": repair_diff(data)["bullets"],
+        "impact": impact.strip() if isinstance(impact, str) else "",
+    }
+
+
+def validate_diff(raw: str) -> str:
+    """
+    Parse, repair and validate a diff JSON document, returning it re-serialized.
+
+    Raises DiffValidationError when the output cannot be read as a diff at
+    all, so the stage that produced it can be retried.
+    """
+    data = parse_json_object(raw)
+    if not any(key in data for key in ("bullets", "categories")):
+        raise DiffValidationError("Diff JSON has no bullets field")
+    repaired = repair_diff(data)
+    try:
+        DiffDocument.model_validate(repaired)
+    except ValidationError as e:
+        raise DiffValidationError(f"Diff JSON does not match the schema: {e.error_count()} errors") from e
+    return json.dumps(repaired)
@@ -0,0 +1,80 @@
+"""Compact few-shot exemplar built from the validated APL pair and its diff JSON."""
+import os
+import json
+import logging
+from typing import Dict, List, Tuple
+
+from pdf_extraction import ExtractedDocument
+
+logger = logging.getLogger(__name__)
+
+# Lines of context kept before and after each line cited by the validated diff
+EXEMPLAR_CONTEXT_BEFORE = int(os.getenv("EXEMPLAR_CONTEXT_BEFORE", "2"))
+EXEMPLAR_CONTEXT_AFTER = int(os.getenv("EXEMPLAR_CONTEXT_AFTER", "6"))
+
+
+def _cited_lines(diff_data: dict, citation_key: str) -> List[Tuple[int, int]]:
+    """Collect the (page, line) pairs a diff cites for one APL."""
+    bullets = list(diff_data.get("bullets", []))
+    for category in (diff_data.get("categories") or {}).values():
+        bullets.extend(category)
+    cited = set()
+    for bullet in bullets:
+        citation = (bullet.get("citations") or {}).get(citation_key)
+        if isinstance(citation, dict) and citation.get("page") and citation.get("line"):
+            cited.add((int(citation["page"]), int(citation["line"])))
+    return sorted(cited)
+
+
+def _excerpts(document: ExtractedDocument, citation_key: str, cited: List[Tuple[int, int]]) -> List[str]:
+    """Render the cited lines with their context, merging windows that overlap."""
+    windows: Dict[int, List[List[int]]] = {}
+    for page, line in cited:
+        if not 1 <= page <= document.page_count or not document.line_offsets[page - 1]:
+            continue
+        last_line = len(document.line_offsets[page - 1])
+        # A line past the end of the page (a miscounted citation) stands for the page's last line
+        line = min(max(1, line), last_line)
+        start = max(1, line - EXEMPLAR_CONTEXT_BEFORE)
+        end = min(last_line, line + EXEMPLAR_CONTEXT_AFTER)
+        page_windows = windows.setdefault(page, [])
+        if page_windows and start <= page_windows[-1][1] + 1:
+            page_windows[-1][1] = max(page_windows[-1][1], end)
+        else:
+            page_windows.append([start, end])
+
+    excerpts = []
+    for page, page_windows in sorted(windows.items()):
+        for start, end in page_windows:
+            text = "\n".join(document.get_line(page, line) for line in range(start, end + 1))
+            excerpts.append(f"[{citation_key} p.{page} l.{start}-{end}]\n{text}")
+    return excerpts
+
+
+def build_compact_exemplar(
+    old_document: ExtractedDocument,
+    new_document: ExtractedDocument,
+    diff_json: str,
+    old_key: str,
+    new_key: str,
+) -> str:
+    """
+    Reduce the validated example to the excerpts its diff JSON cites.
+
+    The model only needs to see what a validated change looks like in the
+    source text, so every cited page/line is kept with a few lines of context
+    and the rest of both APLs is dropped.
+    """
+    diff_data = json.loads(diff_json)
+    old_excerpts = _excerpts(old_document, old_key, _cited_lines(diff_data, old_key))
+    new_excerpts = _excerpts(new_document, new_key, _cited_lines(diff_data, new_key))
+    compact = (
+        f"Cited excerpts from the old APL ({old_key}):\n" + ("\n\n".join(old_excerpts) or "(none)") +
+        f"\n\nCited excerpts from the new APL ({new_key}):\n" + ("\n\n".join(new_excerpts) or "(none)") +
+        f"\n\nValidated difference JSON:\n{json.dumps(diff_data, ensure_ascii=False)}"
+    )
+    logger.info(
+        f"Compacted exemplar to {len(old_excerpts) + len(new_excerpts)} excerpts "
+        f"({len(compact)} of {len(old_document.text) + len(new_document.text) + len(diff_json)} characters)"
+    )
+    return compact
@@ -0,0 +1,81 @@
+"""Content-addressed cache for extracted PDF documents."""
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from pdf_extraction import ExtractedDocument
+
+logger = logging.getLogger(__name__)
+
+# Cache settings (override via environment variables)
+CACHE_DIR = os.getenv("APL_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", "64"))
+
+
+def sha256_bytes(data: bytes) -> str:
+    """Return the hex SHA-256 digest of a byte string."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ExtractionCache:
+    """
+    Two-level cache of extracted documents keyed by the SHA-256 of the PDF bytes.
+
+    Entries live in an in-memory LRU of ``max_entries`` items backed by one
+    file per document under ``directory``, so results survive restarts and
+    evicted entries can be reloaded without re-parsing the PDF.
+    """
+
+    def __init__(self, directory: str, max_entries: int = EXTRACTION_CACHE_SIZE):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, ExtractedDocument]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, digest: str) -> Optional[ExtractedDocument]:
+        """Return the cached document for a digest, or None on a miss."""
+        with self._lock:
+            if digest in self._memory:
+                self._memory.move_to_end(digest)
+                return self._memory[digest]
+
+        path = self._path(digest)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                document = ExtractedDocument.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not read extraction cache entry {digest}: {str(e)}")
+            return None
+        self._remember(digest, document)
+        return document
+
+    def put(self, digest: str, document: ExtractedDocument):
+        """Store a document for a digest in memory and on disk."""
+        self._remember(digest, document)
+        tmp_path = f"{self._path(digest)}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(document.to_dict(), f)
+            os.replace(tmp_path, self._path(digest))
+        except OSError as e:
+            logger.warning(f"Could not write extraction cache entry {digest}: {str(e)}")
+
+    def _remember(self, digest: str, document: ExtractedDocument):
+        with self._lock:
+            self._memory[digest] = document
+            self._memory.move_to_end(digest)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+
+extraction_cache = ExtractionCache(os.path.join(CACHE_DIR, "extraction"))
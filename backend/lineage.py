@@ -0,0 +1,555 @@
+"""Index of processed APLs, their supersession chains and stored diffs, with diff composition."""
+import os
+import json
+import time
+import sqlite3
+import logging
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from citations import CitationIndex
+from coverage import SectionLocator
+from extraction_cache import CACHE_DIR
+from pdf_extraction import ExtractedDocument
+from scoring import MERGE_LINE_WINDOW, sort_by_score
+from sections import Section, section_hash, sections_differ
+
+logger = logging.getLogger(__name__)
+
+LINEAGE_PATH = os.getenv("LINEAGE_PATH", os.path.join(CACHE_DIR, "lineage.sqlite"))
+# Eviction limits of the per-section bullets kept for carrying diffs forward (comparisons themselves are kept)
+LINEAGE_SECTIONS_MAX_BYTES = int(os.getenv("LINEAGE_SECTIONS_MAX_BYTES", str(50 * 1024 * 1024)))
+LINEAGE_SECTIONS_MAX_AGE = float(os.getenv("LINEAGE_SECTIONS_MAX_AGE", str(90 * 24 * 3600)))
+
+
+class LineageIndex:
+    """
+    SQLite index of every APL the pipeline has processed.
+
+    Each document is stored by content hash with its APL number, year and
+    the letters its header says it supersedes (the extracted text itself
+    stays in the extraction cache under the same hash). Completed
+    comparisons are stored as structured diffs with the citation keys they
+    used, and their bullets are also kept per aligned section pair, so that
+    a later comparison against a newer version of the letter can carry them
+    forward for sections that did not change (see ``carry_forward``).
+
+    Section bullets older than ``max_age`` seconds are dropped on write, and
+    when they exceed ``max_bytes`` the least recently used are removed, as in
+    the LLM response cache.
+    """
+
+    def __init__(
+        self,
+        path: str = LINEAGE_PATH,
+        max_bytes: int = LINEAGE_SECTIONS_MAX_BYTES,
+        max_age: float = LINEAGE_SECTIONS_MAX_AGE,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS apls ("
+                "sha256 TEXT PRIMARY KEY, apl_number TEXT NOT NULL, year TEXT, citation_key TEXT, "
+                "filename TEXT, supersedes TEXT, page_count INTEGER, recorded_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS apls_number ON apls (apl_number, recorded_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS comparisons ("
+                "old_sha256 TEXT NOT NULL, new_sha256 TEXT NOT NULL, old_number TEXT NOT NULL, "
+                "new_number TEXT NOT NULL, model TEXT NOT NULL, quick_mode INTEGER NOT NULL, diff TEXT NOT NULL, "
+                "recorded_at REAL NOT NULL, PRIMARY KEY (old_sha256, new_sha256, model, quick_mode))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS comparisons_numbers ON comparisons (old_number, new_number)")
+            # Indexes made before citation keys were stored fall back to each letter's latest key
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(comparisons)")}
+            for column in ("old_key", "new_key"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE comparisons ADD COLUMN {column} TEXT")
+            # Section results keyed by exact text, replaced by the per-comparison section bullets below
+            conn.execute("DROP TABLE IF EXISTS section_diffs")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS comparison_sections ("
+                "old_sha256 TEXT NOT NULL, new_sha256 TEXT NOT NULL, model TEXT NOT NULL, quick_mode INTEGER NOT NULL, "
+                "old_hash TEXT NOT NULL, new_hash TEXT NOT NULL, old_key TEXT, new_key TEXT, bullets TEXT NOT NULL, "
+                "size INTEGER NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL, "
+                "PRIMARY KEY (old_sha256, new_sha256, model, quick_mode, old_hash, new_hash))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS comparison_sections_new ON comparison_sections (new_sha256, new_hash)")
+            conn.execute("CREATE INDEX IF NOT EXISTS comparison_sections_last_used ON comparison_sections (last_used)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record_apl(self, sha256: str, apl_info: dict, filename: str, supersedes: List[str], page_count: int):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO apls (sha256, apl_number, year, citation_key, filename, supersedes, "
+                "page_count, recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (sha256, apl_info["apl_number"], apl_info["year"], apl_info["citation_key"], filename,
+                 json.dumps(supersedes), page_count, time.time()),
+            )
+
+    def record_comparison(
+        self, old_sha256: str, new_sha256: str, old_number: str, new_number: str,
+        model: str, quick_mode: bool, diff_json: str, old_key: str, new_key: str,
+    ):
+        """Store a finished comparison's diff with the citation keys its bullets use."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO comparisons (old_sha256, new_sha256, old_number, new_number, model, "
+                "quick_mode, diff, recorded_at, old_key, new_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (old_sha256, new_sha256, old_number, new_number, model, int(quick_mode), diff_json, time.time(),
+                 old_key, new_key),
+            )
+
+    def record_sections(
+        self, old_sha256: str, new_sha256: str, model: str, quick_mode: bool, old_key: str, new_key: str,
+        sections: List[Tuple[str, str, List[dict]]],
+    ):
+        """
+        Store a comparison's bullets per changed section pair, as (old section hash, new section hash, bullets).
+
+        Expired and, over ``max_bytes``, least recently used section rows are evicted.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM comparison_sections WHERE old_sha256 = ? AND new_sha256 = ? AND model = ? AND quick_mode = ?",
+                (old_sha256, new_sha256, model, int(quick_mode)),
+            )
+            for old_hash, new_hash, bullets in sections:
+                encoded = json.dumps(bullets, ensure_ascii=False)
+                conn.execute(
+                    "INSERT OR REPLACE INTO comparison_sections (old_sha256, new_sha256, model, quick_mode, old_hash, "
+                    "new_hash, old_key, new_key, bullets, size, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (old_sha256, new_sha256, model, int(quick_mode), old_hash, new_hash, old_key, new_key, encoded,
+                     len(encoded.encode("utf-8")), now, now),
+                )
+            conn.execute("DELETE FROM comparison_sections WHERE created_at < ?", (now - self.max_age,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM comparison_sections").fetchone()[0]
+            while total > self.max_bytes:
+                row = conn.execute(
+                    "SELECT rowid, size, created_at FROM comparison_sections ORDER BY last_used LIMIT 1"
+                ).fetchone()
+                if row is None or row[2] == now:
+                    break
+                conn.execute("DELETE FROM comparison_sections WHERE rowid = ?", (row[0],))
+                total -= row[1]
+
+    def previous_versions(self, sha256: str, apl_number: str, supersedes: List[str]) -> List[str]:
+        """
+        Content hashes of the letters a version follows, most recent first.
+
+        These are earlier recorded versions of the same APL number, then the
+        latest recorded version of each letter it supersedes.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT sha256 FROM apls WHERE apl_number = ? AND sha256 != ? ORDER BY recorded_at DESC",
+                (apl_number, sha256),
+            ).fetchall()
+        hashes = [digest for (digest,) in rows]
+        for number in supersedes:
+            document = self.latest_document(number)
+            if document and document["sha256"] not in hashes and document["sha256"] != sha256:
+                hashes.append(document["sha256"])
+        return hashes
+
+    def section_bullets(
+        self, old_number: str, new_sha256s: List[str], model: str, quick_mode: bool
+    ) -> Dict[Tuple[str, str], Tuple[str, str, List[dict]]]:
+        """
+        Stored section bullets of comparisons of ``old_number`` against any of ``new_sha256s``.
+
+        Returns {(old section hash, new section hash): (old key, new key,
+        bullets)}, taking the most recent comparison for each section pair.
+        Only comparisons by ``model`` are used, and a full comparison uses
+        no quick-mode ones. Expired rows are skipped.
+        """
+        if not new_sha256s:
+            return {}
+        now = time.time()
+        placeholders = ", ".join("?" for _ in new_sha256s)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT s.rowid, s.old_hash, s.new_hash, s.old_key, s.new_key, s.bullets FROM comparison_sections s "
+                "JOIN apls o ON o.sha256 = s.old_sha256 "
+                f"WHERE o.apl_number = ? AND s.new_sha256 IN ({placeholders}) AND s.model = ? AND s.quick_mode <= ? "
+                "AND s.created_at >= ? ORDER BY s.quick_mode DESC, s.created_at ASC",
+                (old_number, *new_sha256s, model, int(quick_mode), now - self.max_age),
+            ).fetchall()
+            conn.executemany("UPDATE comparison_sections SET last_used = ? WHERE rowid = ?", [(now, row[0]) for row in rows])
+        # Later rows (full runs, then newer ones) replace earlier ones
+        return {
+            (old_hash, new_hash): (old_key, new_key, json.loads(bullets))
+            for _, old_hash, new_hash, old_key, new_key, bullets in rows
+        }
+
+    def get_document(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Return the recorded letter with this content hash."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT sha256, apl_number, year, citation_key, filename, supersedes, page_count FROM apls "
+                "WHERE sha256 = ?",
+                (sha256,),
+            ).fetchone()
+        return _document(row)
+
+    def latest_document(self, apl_number: str) -> Optional[Dict[str, Any]]:
+        """Return the most recently recorded version of an APL."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT sha256, apl_number, year, citation_key, filename, supersedes, page_count FROM apls "
+                "WHERE apl_number = ? ORDER BY recorded_at DESC LIMIT 1",
+                (apl_number,),
+            ).fetchone()
+        return _document(row)
+
+    def predecessors(self, apl_number: str) -> List[str]:
+        """APL numbers this letter supersedes, from its header and from comparisons run against it."""
+        numbers: List[str] = []
+        document = self.latest_document(apl_number)
+        if document:
+            numbers.extend(document["supersedes"])
+        numbers.extend(number for number in self.compared_predecessors(apl_number) if number not in numbers)
+        return numbers
+
+    def successors(self, apl_number: str) -> List[str]:
+        """APL numbers known to supersede this letter."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT apl_number, supersedes FROM apls").fetchall()
+            compared = conn.execute(
+                "SELECT DISTINCT new_number FROM comparisons WHERE old_number = ?", (apl_number,)
+            ).fetchall()
+        numbers = sorted({number for number, supersedes in rows if apl_number in json.loads(supersedes or "[]")})
+        numbers.extend(number for (number,) in compared if number not in numbers)
+        return numbers
+
+    def chain(self, apl_number: str) -> List[str]:
+        """
+        The supersession chain through an APL, oldest first.
+
+        Where a letter supersedes several others, the chain follows the
+        first one listed in its header.
+        """
+        older: List[str] = []
+        current = apl_number
+        while True:
+            previous = [number for number in self.predecessors(current) if number not in older and number != apl_number]
+            if not previous:
+                break
+            current = previous[0]
+            older.insert(0, current)
+        newer: List[str] = []
+        current = apl_number
+        while True:
+            following = [number for number in self.successors(current) if number not in newer and number != apl_number]
+            if not following:
+                break
+            current = following[0]
+            newer.append(current)
+        return older + [apl_number] + newer
+
+    def compared_predecessors(self, apl_number: str) -> List[str]:
+        """APL numbers with a stored comparison against this letter."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT old_number FROM comparisons WHERE new_number = ? ORDER BY old_number", (apl_number,)
+            ).fetchall()
+        return [number for (number,) in rows]
+
+    def find_path(self, from_number: str, to_number: str, compared_only: bool = False) -> Optional[List[str]]:
+        """
+        The shortest supersession path from an older APL to a newer one, or
+        None if they are not linked. With ``compared_only`` every hop must
+        have a stored comparison.
+        """
+        step = self.compared_predecessors if compared_only else self.predecessors
+        queue = deque([[to_number]])
+        seen = {to_number}
+        while queue:
+            path = queue.popleft()
+            if path[0] == from_number:
+                return path
+            for number in step(path[0]):
+                if number not in seen:
+                    seen.add(number)
+                    queue.append([number] + path)
+        return None
+
+    def get_comparison(self, old_number: str, new_number: str) -> Optional[Dict[str, Any]]:
+        """The most recent stored comparison between two APL numbers, preferring full (non-quick) runs."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT old_sha256, new_sha256, model, quick_mode, diff, recorded_at, old_key, new_key FROM comparisons "
+                "WHERE old_number = ? AND new_number = ? ORDER BY quick_mode ASC, recorded_at DESC LIMIT 1",
+                (old_number, new_number),
+            ).fetchone()
+        if row is None:
+            return None
+        old_sha256, new_sha256, model, quick_mode, diff, recorded_at, old_key, new_key = row
+        return {
+            "old_sha256": old_sha256, "new_sha256": new_sha256, "model": model,
+            "quick_mode": bool(quick_mode), "diff": diff, "recorded_at": recorded_at,
+            "old_key": old_key, "new_key": new_key,
+        }
+
+    def comparisons_for(self, apl_numbers: List[str]) -> List[Dict[str, Any]]:
+        """Stored comparisons between consecutive APLs of a chain."""
+        hops = []
+        for old_number, new_number in zip(apl_numbers, apl_numbers[1:]):
+            comparison = self.get_comparison(old_number, new_number)
+            hops.append({
+                "old": old_number, "new": new_number, "available": comparison is not None,
+                "model": comparison and comparison["model"], "quick_mode": comparison and comparison["quick_mode"],
+            })
+        return hops
+
+    def all_comparisons(self) -> List[Dict[str, Any]]:
+        """Every stored comparison with the filenames of both letters, oldest first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT c.old_sha256, c.new_sha256, c.old_number, c.new_number, c.diff, o.filename, n.filename "
+                "FROM comparisons c LEFT JOIN apls o ON o.sha256 = c.old_sha256 "
+                "LEFT JOIN apls n ON n.sha256 = c.new_sha256 ORDER BY c.recorded_at"
+            ).fetchall()
+        keys = ("old_sha256", "new_sha256", "old_number", "new_number", "diff", "old_filename", "new_filename")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def carry_forward(
+        self,
+        pairs: List[Tuple[Optional[Section], Optional[Section]]],
+        old_info: dict,
+        new_info: dict,
+        new_sha256: str,
+        supersedes: List[str],
+        model: str,
+        quick_mode: bool,
+    ) -> Dict[int, List[dict]]:
+        """
+        Bullets for the changed section pairs a previous version of the new letter was already compared on.
+
+        ``pairs`` are the aligned section pairs of the comparison. A changed pair
+        is carried forward when a stored comparison of the same old letter
+        against a previous version of the new one (see ``previous_versions``)
+        had the same text on both sides of it. Its bullets are returned under
+        the pair's index with their citations re-keyed to this comparison's
+        citation keys; page/line numbers are relocated by quote later, like
+        any model citation. ``supersedes`` lists the letters the new one's
+        header supersedes.
+        """
+        previous = self.previous_versions(new_sha256, new_info["apl_number"], supersedes)
+        stored = self.section_bullets(old_info["apl_number"], previous, model, quick_mode)
+        carried: Dict[int, List[dict]] = {}
+        for pair_index, (old_section, new_section) in enumerate(pairs):
+            if not sections_differ(old_section, new_section):
+                continue
+            found = stored.get((section_hash(old_section), section_hash(new_section)))
+            if found is not None:
+                stored_old_key, stored_new_key, bullets = found
+                keys = {stored_old_key: old_info["citation_key"], stored_new_key: new_info["citation_key"]}
+                carried[pair_index] = [_rekeyed(bullet, keys) for bullet in bullets]
+        return carried
+
+
+def _document(row: Optional[tuple]) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    keys = ("sha256", "apl_number", "year", "citation_key", "filename", "supersedes", "page_count")
+    document = dict(zip(keys, row))
+    document["supersedes"] = json.loads(document["supersedes"] or "[]")
+    return document
+
+
+def split_by_section(
+    old_document: ExtractedDocument, new_document: ExtractedDocument, diff_json: str, old_key: str, new_key: str
+) -> List[Tuple[str, str, List[dict]]]:
+    """
+    A diff's bullets grouped by the changed section pair (see sections.py) their citations point into.
+
+    Returns (old section hash, new section hash, bullets) for every changed
+    pair, with no bullets for a pair the diff found nothing meaningful in.
+    Bullets whose section cannot be told are left out.
+    """
+    locator = SectionLocator(old_document, new_document, old_key, new_key)
+    grouped: Dict[int, List[dict]] = {
+        index: [] for index, (old_section, new_section) in enumerate(locator.pairs)
+        if sections_differ(old_section, new_section)
+    }
+    for bullet in json.loads(diff_json).get("bullets", []):
+        if not isinstance(bullet, dict):
+            continue
+        index = locator.locate(bullet)
+        if index in grouped:
+            grouped[index].append({key: value for key, value in bullet.items() if key != "score"})
+    return [
+        (section_hash(locator.pairs[index][0]), section_hash(locator.pairs[index][1]), bullets)
+        for index, bullets in grouped.items()
+    ]
+
+
+def _rekeyed(bullet: dict, keys: Dict[str, str]) -> dict:
+    citations = bullet.get("citations") if isinstance(bullet.get("citations"), dict) else {}
+    return dict(bullet, citations={keys.get(key, key): citation for key, citation in citations.items()})
+
+
+@dataclass
+class DiffHop:
+    """One stored comparison in a chain, with its APL info and optional citation indexes."""
+    old_info: dict
+    new_info: dict
+    diff: dict
+    old_index: Optional[CitationIndex] = None
+    new_index: Optional[CitationIndex] = None
+
+
+def _citation(bullet: dict, key: str) -> Optional[dict]:
+    citation = (bullet.get("citations") or {}).get(key)
+    return citation if isinstance(citation, dict) else None
+
+
+def _near(a: Optional[dict], b: Optional[dict]) -> bool:
+    if not a or not b:
+        return False
+    try:
+        return int(a["page"]) == int(b["page"]) and abs(int(a["line"]) - int(b["line"])) <= MERGE_LINE_WINDOW
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def _relocate(citation: Optional[dict], index: Optional[CitationIndex]) -> Optional[dict]:
+    """Find a citation's text in another version of the letter; None if it is not there."""
+    if not citation or index is None or not citation.get("text"):
+        return None
+    location = index.locate(citation["text"])
+    if location is None:
+        return None
+    page, line, _ = location
+    return {"page": page, "line": line, "text": citation["text"], "verified": True}
+
+
+def _revision_type(bullet: dict) -> str:
+    return str(bullet.get("revision_type", "")).lower()
+
+
+def _composed(bullet: dict, revision_type: str, citations: Dict[str, Optional[dict]], score: Any = None) -> dict:
+    composed = dict(bullet, revision_type=revision_type, citations=citations)
+    if score is not None:
+        composed["score"] = score
+    return composed
+
+
+def _compose_pair(first: DiffHop, second: DiffHop) -> List[dict]:
+    """
+    Compose A→B and B→C bullets into A→C bullets, matching them on their B citations.
+
+    Each hop cites B under the key its own comparison used, which differs
+    when a letter was compared against one from the same year.
+    """
+    a_key, b_key = first.old_info["citation_key"], first.new_info["citation_key"]
+    later_b_key, c_key = second.old_info["citation_key"], second.new_info["citation_key"]
+    first_bullets = [b for b in first.diff.get("bullets", []) if isinstance(b, dict)]
+    matched = set()
+    bullets: List[dict] = []
+
+    for later in (b for b in second.diff.get("bullets", []) if isinstance(b, dict)):
+        later_type = _revision_type(later)
+        later_b = _citation(later, later_b_key)
+        earlier = None
+        if later_b:
+            for index, candidate in enumerate(first_bullets):
+                if index not in matched and _revision_type(candidate) != "redaction" and _near(_citation(candidate, b_key), later_b):
+                    earlier = candidate
+                    matched.add(index)
+                    break
+
+        if earlier is not None:
+            score = max(earlier.get("score") or 0, later.get("score") or 0) or None
+            if _revision_type(earlier) == "addition":
+                if later_type == "redaction":
+                    continue  # added in B and removed again in C
+                bullets.append(_composed(later, "addition", {a_key: None, c_key: _citation(later, c_key)}, score))
+            elif later_type == "redaction":
+                bullets.append(_composed(later, "redaction", {a_key: _citation(earlier, a_key), c_key: None}, score))
+            else:
+                bullets.append(_composed(later, "update", {a_key: _citation(earlier, a_key), c_key: _citation(later, c_key)}, score))
+        elif later_type == "addition":
+            bullets.append(_composed(later, "addition", {a_key: None, c_key: _citation(later, c_key)}))
+        else:
+            # Changed B text with no earlier bullet: it either came from A or was new in B
+            in_a = _relocate(later_b, first.old_index)
+            if in_a is not None:
+                bullets.append(_composed(later, later_type, {a_key: in_a, c_key: _citation(later, c_key)}))
+            elif later_type == "update" or first.old_index is None:
+                revision_type = "addition" if first.old_index is not None else later_type
+                bullets.append(_composed(later, revision_type, {a_key: None, c_key: _citation(later, c_key)}))
+
+    for index, earlier in enumerate(first_bullets):
+        if index in matched:
+            continue
+        if _revision_type(earlier) == "redaction":
+            bullets.append(_composed(earlier, "redaction", {a_key: _citation(earlier, a_key), c_key: None}))
+        else:
+            # Unchanged between B and C: carry the change forward, relocated into C where possible
+            earlier_b = _citation(earlier, b_key)
+            in_c = _relocate(earlier_b, second.new_index)
+            if in_c is None and earlier_b:
+                in_c = dict(earlier_b, verified=False)
+            bullets.append(_composed(earlier, _revision_type(earlier), {a_key: _citation(earlier, a_key), c_key: in_c}))
+    return bullets
+
+
+def compose_diffs(hops: List[DiffHop]) -> dict:
+    """
+    Compose the stored diffs of a supersession chain into one oldest-to-newest diff.
+
+    Bullets of consecutive hops are matched on their citations into the
+    shared intermediate letter: a change added and later removed drops out,
+    an addition later updated stays an addition, and updates chain into one
+    update citing the oldest and newest text. Unmatched bullets are carried
+    through, with their citations relocated by text into the other versions
+    when citation indexes are available.
+    """
+    oldest, newest = hops[0].old_info, hops[-1].new_info
+    result = hops[0]
+    for hop in hops[1:]:
+        bullets = _compose_pair(result, hop)
+        result = DiffHop(oldest, hop.new_info, {"bullets": bullets}, hops[0].old_index, hop.new_index)
+
+    bullets = sort_by_score(result.diff.get("bullets", []))
+    counts = {revision_type: 0 for revision_type in ("addition", "update", "redaction")}
+    for bullet in bullets:
+        if _revision_type(bullet) in counts:
+            counts[_revision_type(bullet)] += 1
+    via = ", ".join(f"APL {hop.new_info['apl_number']}" for hop in hops[:-1])
+    conclusions = [
+        f"APL {hop.new_info['apl_number']} vs. APL {hop.old_info['apl_number']}: {hop.diff.get('conclusion', '').strip()}"
+        for hop in hops if hop.diff.get("conclusion")
+    ]
+    return {
+        "title": f"Composed Difference Matrix — APL {newest['apl_number']} vs. APL {oldest['apl_number']} (via {via})",
+        "summary": (
+            f"Net changes from APL {oldest['apl_number']} ({oldest['year']}) to APL {newest['apl_number']} "
+            f"({newest['year']}), composed from the stored comparisons along the supersession chain: "
+            f"{counts['addition']} additions, {counts['update']} updates and {counts['redaction']} redactions. "
+            f"Changes introduced and later withdrawn within the chain are omitted."
+        ),
+        "bullets": bullets,
+        "conclusion": " ".join(conclusions),
+    }
+
+
+lineage_index = LineageIndex()
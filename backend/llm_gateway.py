@@ -0,0 +1,184 @@
+"""Shared async gateway for the chat completion calls made by the comparison pipeline."""
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+
+from llm_cache import cache_key, llm_response_cache
+from token_budget import log_prompt_size
+from metrics import llm_in_flight, record_llm_cache_hit, record_llm_call, record_llm_error
+from scheduler import LLM_COMPLETION_TOKEN_ESTIMATE, retry_after_seconds, scheduler
+
+logger = logging.getLogger(__name__)
+
+# Connection pool and timeout settings (override via environment variables)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "600"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# Times a request answered with HTTP 429 is queued again after waiting out its Retry-After
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "6"))
+
+# Errors retried up to LLM_MAX_RETRIES times; 429s go back through the scheduler instead
+_TRANSIENT_ERRORS = (openai.APIConnectionError, openai.InternalServerError, openai.ConflictError)
+
+_client: Optional[AsyncOpenAI] = None
+
+
+class LLMCallCancelled(Exception):
+    """Raised when a chat completion is aborted through its cancel event."""
+
+
+def get_client() -> AsyncOpenAI:
+    """Return the shared pooled async client, creating it on first use."""
+    global _client
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        )
+        # Retries are handled in chat_completion so that 429s reach the scheduler
+        _client = AsyncOpenAI(http_client=http_client, max_retries=0)
+        logger.info(
+            f"Created async LLM client (max_connections={LLM_MAX_CONNECTIONS}, "
+            f"timeout={LLM_REQUEST_TIMEOUT}s)"
+        )
+    return _client
+
+
+async def close_client():
+    """Close the shared client and release its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+async def chat_completion(
+    model: str,
+    messages: List[Dict[str, Any]],
+    response_format: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+    cancel_event: Optional[asyncio.Event] = None,
+    use_cache: bool = True,
+    stage: str = "chat",
+) -> str:
+    """
+    Send a chat completion request and return the message content.
+
+    The request runs on the shared connection pool without blocking the event
+    loop. ``timeout`` overrides the default request timeout for this call only.
+    Setting ``cancel_event`` aborts the in-flight request and raises
+    LLMCallCancelled; cancelling the awaiting task aborts it the same way.
+
+    Responses are cached on disk by model, messages and response format, so
+    an identical request returns without calling the API. Pass
+    ``use_cache=False`` to bypass the cache for a fresh answer; the new
+    response still replaces the cached one.
+
+    ``stage`` names the pipeline stage the call belongs to; the prompt size
+    is measured and logged against that stage's token budget before sending,
+    and latency, token usage and estimated cost are recorded under it.
+
+    Each attempt is admitted by the scheduler (see scheduler.py) within the
+    model's request and token rate limits, in the priority order of the
+    calling task. An HTTP 429 pauses the model for its Retry-After period
+    and queues the request again; connection errors and 5xx responses are
+    retried up to LLM_MAX_RETRIES times with backoff.
+    """
+    key = cache_key(model, messages, response_format)
+    if use_cache:
+        cached = await asyncio.to_thread(llm_response_cache.get, key)
+        if cached is not None:
+            logger.info(f"LLM response cache hit for model {model}")
+            record_llm_cache_hit(model, stage)
+            return cached
+
+    reserved_tokens = log_prompt_size(stage, messages, model) + LLM_COMPLETION_TOKEN_ESTIMATE
+    rate_limited = transient_failures = 0
+    while True:
+        await scheduler.acquire(model, reserved_tokens)
+        started = time.monotonic()
+        llm_in_flight.inc()
+        try:
+            response = await _request_completion(model, messages, response_format, timeout, cancel_event)
+            break
+        except openai.RateLimitError as e:
+            # A failed call's reservation goes back to the token bucket; the retry reserves again
+            scheduler.settle(model, reserved_tokens, 0)
+            record_llm_error(model, stage, outcome="rate_limited")
+            rate_limited += 1
+            if rate_limited > LLM_RATE_LIMIT_RETRIES:
+                raise
+            delay = retry_after_seconds(e.response.headers)
+            scheduler.pause(model, delay if delay is not None else min(60.0, 2.0 ** rate_limited))
+        except _TRANSIENT_ERRORS as e:
+            scheduler.settle(model, reserved_tokens, 0)
+            record_llm_error(model, stage)
+            transient_failures += 1
+            if transient_failures > LLM_MAX_RETRIES:
+                raise
+            delay = min(8.0, 0.5 * 2 ** transient_failures) * random.uniform(0.5, 1.0)
+            logger.warning(f"Transient error from model {model} ({str(e)}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        except BaseException:
+            scheduler.settle(model, reserved_tokens, 0)
+            record_llm_error(model, stage)
+            raise
+        finally:
+            llm_in_flight.dec()
+    usage = response.usage
+    if usage is not None:
+        scheduler.settle(model, reserved_tokens, int(usage.total_tokens or 0))
+    record_llm_call(model, stage, time.monotonic() - started, usage)
+
+    content = response.choices[0].message.content
+    if content:
+        await asyncio.to_thread(llm_response_cache.put, key, model, content)
+    return content
+
+
+async def _request_completion(
+    model: str,
+    messages: List[Dict[str, Any]],
+    response_format: Optional[Dict[str, Any]],
+    timeout: Optional[float],
+    cancel_event: Optional[asyncio.Event],
+) -> ChatCompletion:
+    """Call the chat completions API, racing the request against an optional cancel event."""
+    kwargs: Dict[str, Any] = {}
+    if response_format is not None:
+        kwargs["response_format"] = response_format
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+
+    request = get_client().chat.completions.create(model=model, messages=messages, **kwargs)
+
+    if cancel_event is None:
+        return await request
+
+    request_task = asyncio.ensure_future(request)
+    cancel_task = asyncio.ensure_future(cancel_event.wait())
+    try:
+        await asyncio.wait({request_task, cancel_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        cancel_task.cancel()
+        if not request_task.done():
+            request_task.cancel()
+            # Let the request unwind (closing its connection) before reporting the cancellation
+            await asyncio.wait({request_task})
+
+    if request_task.cancelled():
+        raise LLMCallCancelled(f"Chat completion for model {model} was cancelled")
+    return request_task.result()
@@ -1,22 +1,50 @@
 import os
-import tempfile
 import json
-import re
-from typing import List, Optional
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Form
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple, Union
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import pypdf
-from openai import OpenAI
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 import asyncio
 import logging
 
+from llm_gateway import chat_completion, close_client
+from extraction_cache import extraction_cache, sha256_bytes
+from pdf_extraction import ExtractedDocument, extract_document, shutdown_executor
+from diff_prepass import DIFF_MAX_CHANGED_RATIO, changed_ratio, compute_hunks, min_changed_ratio, render_hunks
+from paragraph_alignment import ALIGN_MAX_VIEW_RATIO, align_paragraphs, render_alignment
+from coverage import COVERAGE_THRESHOLD, keep_initial_bullets, measure_coverage, uncovered_section_texts
+from citations import CitationIndex, resolve_citations
+from task_store import TASK_TTL, create_task_store
+from sections import SECTION_MAX_CONCURRENCY, Section, align_sections, merge_section_diffs, section_texts, sections_differ, split_sections
+from exemplar import build_compact_exemplar
+from token_budget import fit_to_budget
+from apl_metadata import distinct_citation_keys, extract_apl_info, superseded_apl_numbers
+from metrics import TaskMetrics, adaptive_runs, current_task_metrics, render_metrics, span, tasks_in_flight, tasks_queued, tasks_total
+from uploads import BULK_UPLOAD_MAX_BYTES, UPLOAD_REQUEST_MAX_BYTES, RequestSizeLimitMiddleware, StoredUpload, save_upload, sweep_stale_uploads
+from scoring import SCORING_MAX_CONCURRENCY, batches, earliest_citations, find_merge_candidates, sort_by_score
+from diff_schema import _revision_type, parse_json_object, repair_section_diff, validate_diff
+from stages import run_stage
+from scheduler import FULL_PRIORITY, QUICK_PRIORITY, RequestPriority, current_priority, scheduler
+from bulk import BULK_MAX_CONCURRENCY, BULK_OUTPUT_DIR, APLPair, load_manifest, manifest_entries, pair_apls, run_bulk
+from lineage import DiffHop, compose_diffs, lineage_index, split_by_section
+from search_index import search_index
+from response_encoding import GZIP_MIN_SIZE, decode_body, encode_body, etag_matches, preferred_encoding
+from task_control import attached_clients, comparison_task_id, task_registry
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="APL Comparison API")
 
+# Reject oversized uploads before their multipart body is read (added first so CORS headers still apply)
+app.add_middleware(
+    RequestSizeLimitMiddleware,
+    limits={"/api/compare": UPLOAD_REQUEST_MAX_BYTES, "/api/bulk": BULK_UPLOAD_MAX_BYTES},
+)
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -24,83 +52,260 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+# Compress other large responses on the fly (completed task status is stored pre-compressed)
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=6)
 
-# Initialize OpenAI client
-client = OpenAI()
+# Store processing status (shared across workers, see task_store.py)
+task_store = create_task_store()
 
-# Store processing status
-processing_tasks = {}
+# Progress stream: how often an open stream checks the task store, and how often it sends a keep-alive
+STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", "0.25"))
+STREAM_HEARTBEAT_INTERVAL = float(os.getenv("STREAM_HEARTBEAT_INTERVAL", "15"))
 
-# Reduce token usage to stay within rate limits
-maxtokens = 4000
-max_words = 3000
+# Validated example used as context for every comparison, loaded once at startup
+exemplar_pack: Optional[dict] = None
 
-# # Function to truncate text to reduce token usage
-# def truncate_for_api(text, max_length=3000):
-#     """Truncate text to reduce token usage while preserving important parts."""
-#     if len(text) <= max_length:
-#         return text
-    
-#     # Take the first third and the last third of the content
-#     first_part = text[:max_length // 2]
-#     last_part = text[-max_length // 2:]
-    
-#     return first_part + "\n\n[...content truncated...]\n\n" + last_part
+# Prompt sizes are kept within per-stage token budgets (see token_budget.py)
 
 
-def extract_text_from_pdf(pdf_file: str) -> str:
-    """Extract text content from a PDF file."""
+def extract_document_from_pdf(pdf_file: str) -> ExtractedDocument:
+    """Extract the page/line-indexed content of a PDF file, reusing cached results for identical files."""
+    return extract_pdf_file(pdf_file)[1]
+
+def extract_pdf_file(pdf_file: str) -> Tuple[str, ExtractedDocument]:
+    """Extract a PDF file, returning its content hash along with the document."""
     try:
         with open(pdf_file, 'rb') as file:
-            reader = pypdf.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            logger.info(f"Extracted text from PDF: {pdf_file}")
-            return text
+            pdf_bytes = file.read()
+        digest = sha256_bytes(pdf_bytes)
+        cached_document = extraction_cache.get(digest)
+        if cached_document is not None:
+            logger.info(f"Extraction cache hit for PDF: {pdf_file}")
+            return digest, cached_document
+
+        document = extract_document(pdf_bytes)
+        extraction_cache.put(digest, document)
+        logger.info(f"Extracted text from PDF: {pdf_file} ({document.page_count} pages)")
+        return digest, document
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error extracting text from PDF: {str(e)}")
 
-def extract_apl_info(filename):
-    """Extract APL number and year from filename."""
-    match = re.search(r'APL(\d{2})-(\d{3})', filename, re.IGNORECASE)
-    if match:
-        year_prefix = int(match.group(1))
-        apl_number = match.group(1) + '-' + match.group(2)
-        # Determine century based on year prefix
-        year = f"19{year_prefix}" if year_prefix > 50 else f"20{year_prefix}"
-        return {
-            "apl_number": apl_number,
-            "year": year,
-            "citation_key": f"APL{match.group(1)}"
-        }
-    return None
+def extract_document_from_upload(upload: StoredUpload) -> ExtractedDocument:
+    """Extract an uploaded PDF, keyed by the hash computed while it was received."""
+    try:
+        cached_document = extraction_cache.get(upload.sha256)
+        if cached_document is not None:
+            logger.info(f"Extraction cache hit for upload: {upload.filename}")
+            return cached_document
+
+        document = extract_document(upload.read_bytes())
+        extraction_cache.put(upload.sha256, document)
+        logger.info(f"Extracted text from upload: {upload.filename} ({document.page_count} pages)")
+        return document
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error extracting text from PDF: {str(e)}")
+
+def load_pdf_source(source: Union[str, StoredUpload]) -> Tuple[str, ExtractedDocument]:
+    """Extract a PDF given either its path on disk or a stored upload, returning its content hash too."""
+    if isinstance(source, StoredUpload):
+        return source.sha256, extract_document_from_upload(source)
+    return extract_pdf_file(source)
+
+def extract_text_from_pdf(pdf_file: str) -> str:
+    """Extract text content from a PDF file."""
+    return extract_document_from_pdf(pdf_file).text
+
+def load_exemplar_pack() -> dict:
+    """Load the validated example and compact it to the excerpts its diff JSON cites."""
+    parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    validated_old_apl_path = os.path.join(parent_dir, "APL13-014.pdf")
+    validated_new_apl_path = os.path.join(parent_dir, "APL25-008.pdf")
+    validated_diff_path = os.path.join(parent_dir, "Diff_13-014_25-008 copy.json")
+
+    # Verify that the validated files exist
+    for file_path in [validated_old_apl_path, validated_new_apl_path, validated_diff_path]:
+        if not os.path.exists(file_path):
+            raise HTTPException(status_code=500, detail=f"Validated file not found: {file_path}")
+
+    with open(validated_diff_path, 'r') as f:
+        validated_diff_json = f.read()
+
+    old_info = extract_apl_info(os.path.basename(validated_old_apl_path))
+    new_info = extract_apl_info(os.path.basename(validated_new_apl_path))
+    return {
+        "compact": build_compact_exemplar(
+            extract_document_from_pdf(validated_old_apl_path),
+            extract_document_from_pdf(validated_new_apl_path),
+            validated_diff_json,
+            old_info['citation_key'],
+            new_info['citation_key'],
+        ),
+        "diff_json": validated_diff_json,
+    }
+
+def get_exemplar_pack() -> dict:
+    """Return the exemplar pack, loading it if startup did not."""
+    global exemplar_pack
+    if exemplar_pack is None:
+        exemplar_pack = load_exemplar_pack()
+    return exemplar_pack
+
+def build_comparison_input(
+    old_apl_document: ExtractedDocument,
+    new_apl_document: ExtractedDocument,
+    old_apl_info: dict,
+    new_apl_info: dict,
+) -> str:
+    """
+    Describe the pair under analysis as compactly as its changes allow.
+
+    Mostly unchanged pairs are sent as anchored changed hunks. When most of
+    the text changed, paragraphs are aligned instead so that moved and
+    unchanged paragraphs can be left out; the full texts are sent when that
+    view saves too little (see ALIGN_MAX_VIEW_RATIO). A pair that shares too
+    few sentences verbatim to pass DIFF_MAX_CHANGED_RATIO skips the sentence
+    diff altogether.
+    """
+    hunks = []
+    ratio = min_changed_ratio(old_apl_document, new_apl_document)
+    if ratio > DIFF_MAX_CHANGED_RATIO:
+        logger.info(f"Diff pre-pass skipped: at least {ratio:.0%} of the text differs")
+    else:
+        hunks = compute_hunks(old_apl_document, new_apl_document)
+        ratio = changed_ratio(hunks, old_apl_document, new_apl_document)
+        logger.info(f"Diff pre-pass found {len(hunks)} changed hunks covering {ratio:.0%} of the text")
+
+    old_key = old_apl_info['citation_key']
+    new_key = new_apl_info['citation_key']
+    if ratio > DIFF_MAX_CHANGED_RATIO:
+        aligned_view = render_alignment(align_paragraphs(old_apl_document, new_apl_document), old_key, new_key)
+        full_size = len(old_apl_document.text) + len(new_apl_document.text)
+        logger.info(f"Paragraph alignment view is {len(aligned_view)} characters against {full_size} for the full texts")
+        if len(aligned_view) > full_size * ALIGN_MAX_VIEW_RATIO:
+            return f"""The pair I want you to analyze:
+                   - Old APL: {old_apl_document.text}...
+                   - New APL: {new_apl_document.text}..."""
+        return f"""The pair I want you to analyze, pre-aligned paragraph by paragraph.
+                Paragraphs of the old APL ({old_key}) have been matched to paragraphs of the new APL ({new_key}) by text similarity,
+                and paragraphs that are unchanged and in the same place have been left out. Every entry shows the page and line range of its paragraph.
+                [Moved, text unchanged] paragraphs only changed position: they are not additions or redactions, report them only if the move changes their meaning.
+                [Reworded] paragraphs show either a word diff ("~", with words only in the old APL in [-...-] and words only in the new APL in {{+...+}})
+                or the old text ("-") and the new text ("+"): report an update bullet for each meaningful change in wording.
+                [Added] paragraphs appear only in the new APL and [Removed] paragraphs only in the old APL, one per line after its page and line range:
+                report an addition or redaction bullet for each one that is meaningful.
+
+{aligned_view}"""
+
+    return f"""The pair I want you to analyze, reduced to the regions that differ.
+                A deterministic sentence diff has already located every change, and unchanged text has been left out.
+                Each hunk is tagged addition, update or redaction, and every line shows the page and line where that text starts in its PDF.
+                Lines starting with "-" appear only in the old APL ({old_key}), lines starting with "+" only in the new APL ({new_key}),
+                and unmarked lines are unchanged context from the new APL.
+                Every hunk tagged redaction is text removed from the old APL: report a redaction bullet for each one that is meaningful.
+
+{render_hunks(hunks, old_key, new_key)}"""
+
+def build_section_input(pairs: List[Tuple[Optional[Section], Optional[Section]]]) -> str:
+    """Describe only the given section pairs, for a comparison whose other changes were carried forward."""
+    old_text, new_text = section_texts(pairs)
+    return f"""The pair I want you to analyze, limited to the sections whose changes are not already known.
+                The changes in the other sections were found when an earlier version of the new APL was compared; they are added separately, do not report them.
+                   - Old APL sections: {old_text or "(These sections do not exist in the old APL.)"}...
+                   - New APL sections: {new_text}..."""
+
+def with_carried_bullets(diff_json: str, bullets: List[dict]) -> str:
+    """Append bullets carried forward from the lineage index to a diff."""
+    if not bullets:
+        return diff_json
+    diff_data = parse_json_object(diff_json)
+    diff_data.setdefault("bullets", []).extend(bullets)
+    return json.dumps(diff_data)
+
+async def publish_event(task_id: str, event: str, data: Optional[dict] = None):
+    """Record a stage event for the task's progress stream."""
+    await asyncio.to_thread(task_store.add_event, task_id, event, data)
 
 async def process_apl_comparison(
-    old_apl_path: str, 
-    new_apl_path: str, 
-    validated_old_apl_path: str,
-    validated_new_apl_path: str,
-    validated_diff_path: str,
+    old_apl_source: Union[str, StoredUpload],
+    new_apl_source: Union[str, StoredUpload],
     task_id: str,
     old_apl_filename: str,
     new_apl_filename: str,
     quick_mode: bool,
     model: str,
+    use_cache: bool = True,
+    chunked_mode: bool = False,
+    checkpoints: Optional[dict] = None,
+    adaptive_mode: bool = False,
 ):
-    """Process the APL comparison using OpenAI's o3 model."""
+    """
+    Process the APL comparison with ``model`` (any chat completions model).
+
+    The PDFs are given as paths or as stored uploads; uploads are deleted
+    once the task ends, whether it succeeds or fails. Stage timings and
+    token/cost totals are stored with the task as "metrics".
+
+    In adaptive mode (ignored when quick_mode is set) the estimate and final
+    diff stages run only if the initial diff's citations cover less than
+    COVERAGE_THRESHOLD of the new APL's changed text, and then only on the
+    sections holding the uncovered changes (see coverage.py).
+
+    Each model stage's output is validated, retried on its own when it
+    fails (see stages.py) and saved with the task as a checkpoint. Stages
+    found in ``checkpoints`` are not run again, which is how a failed task
+    is resumed.
+
+    The task can be cancelled through task_registry (see task_control.py);
+    it then ends with status "cancelled", keeping its checkpoints so it can
+    be resumed like a failed task.
+
+    Changed section pairs that a stored comparison of the old letter against
+    a previous version of the new one already covered, with the same text on
+    both sides, are carried forward from the lineage index (see lineage.py):
+    their bullets are added to the diff and only the other sections are sent
+    to the model.
+    """
+    task_metrics = TaskMetrics()
+    metrics_token = current_task_metrics.set(task_metrics)
+    # Model calls of quick-mode tasks, then of shorter documents, are admitted first
+    priority_tier = QUICK_PRIORITY if quick_mode else FULL_PRIORITY
+    priority_token = current_priority.set(RequestPriority(priority_tier, 0, task_id))
+    tasks_queued.dec()
+    tasks_in_flight.inc()
+    checkpoints = dict(checkpoints or {})
+    resume = None
+    task_registry.register(task_id)
+    cancel_watcher = asyncio.ensure_future(task_registry.watch(task_id, task_store))
+
+    async def run_checkpointed(stage: str, run, validate=None) -> str:
+        """Return a stage's checkpointed output, or run the stage and checkpoint its output."""
+        if stage in checkpoints:
+            logger.info(f"Task {task_id}: reusing {stage} checkpoint")
+            return checkpoints[stage]
+        with span(stage):
+            output = await run_stage(stage, run, validate, use_cache)
+        checkpoints[stage] = output
+        await asyncio.to_thread(task_store.set, task_id, {
+            "status": "processing",
+            "resume": resume,
+            "checkpoints": checkpoints
+        })
+        return output
+
     try:
         # Extract text from PDFs
-        old_apl_text = extract_text_from_pdf(old_apl_path)
-        new_apl_text = extract_text_from_pdf(new_apl_path)
-        validated_old_apl_text = extract_text_from_pdf(validated_old_apl_path)
-        validated_new_apl_text = extract_text_from_pdf(validated_new_apl_path)
-        
-        # Read validated diff JSON
-        with open(validated_diff_path, 'r') as f:
-            validated_diff_json = f.read()
+        # (run off the event loop so status polls stay responsive)
+        with span("extraction"):
+            old_apl_sha256, old_apl_document = await asyncio.to_thread(load_pdf_source, old_apl_source)
+            new_apl_sha256, new_apl_document = await asyncio.to_thread(load_pdf_source, new_apl_source)
+        old_apl_text = old_apl_document.text
+        new_apl_text = new_apl_document.text
+        current_priority.set(RequestPriority(priority_tier, len(old_apl_text) + len(new_apl_text), task_id))
+        exemplar = get_exemplar_pack()
         
         # Extract APL info from filenames
         old_apl_info = extract_apl_info(old_apl_filename)
@@ -108,74 +313,354 @@ async def process_apl_comparison(
         
         if not old_apl_info or not new_apl_info:
             raise HTTPException(status_code=400, detail="Invalid APL filenames. Expected format: APLxx-xxx.pdf")
+        old_apl_info, new_apl_info = distinct_citation_keys(old_apl_info, new_apl_info)
+
+        # Everything needed to resume the task later; the extracted documents
+        # stay in the extraction cache under their hashes
+        resume = {
+            "old_sha256": old_apl_sha256,
+            "new_sha256": new_apl_sha256,
+            "old_filename": old_apl_filename,
+            "new_filename": new_apl_filename,
+            "quick_mode": quick_mode,
+            "model": model,
+            "chunked_mode": chunked_mode,
+            "use_cache": use_cache,
+            "adaptive_mode": adaptive_mode,
+        }
         
+        await publish_event(task_id, "extraction", {
+            "old_pages": old_apl_document.page_count,
+            "new_pages": new_apl_document.page_count,
+        })
+
+        # Carry forward section changes found when a previous version of the new letter was compared
+        section_pairs = align_sections(split_sections(old_apl_document), split_sections(new_apl_document))
+        if "lineage_sections" not in checkpoints:
+            with span("lineage"):
+                try:
+                    carried = await asyncio.to_thread(
+                        lineage_index.carry_forward, section_pairs, old_apl_info, new_apl_info, new_apl_sha256,
+                        superseded_apl_numbers(new_apl_document), model, quick_mode
+                    )
+                except Exception as e:
+                    logger.warning(f"Task {task_id}: could not read earlier section changes from the lineage index: {str(e)}")
+                    carried = {}
+            checkpoints["lineage_sections"] = json.dumps(carried)
+        carried = {int(index): bullets for index, bullets in json.loads(checkpoints["lineage_sections"]).items()}
+        carried_bullets = [bullet for index in sorted(carried) for bullet in carried[index]]
+        remaining_pairs = [
+            pair for index, pair in enumerate(section_pairs) if sections_differ(*pair) and index not in carried
+        ]
+        if carried:
+            logger.info(
+                f"Task {task_id}: carried forward {len(carried_bullets)} changes in {len(carried)} sections "
+                f"from an earlier version; {len(remaining_pairs)} changed sections left to analyze"
+            )
+
         # Step 3: Generate initial diff JSON
         logger.info(f"Task {task_id}: Generating initial diff JSON")
         logger.info(f"Quick mode: {quick_mode}")
 
-        initial_diff_response = await generate_initial_diff(
-            old_apl_text, 
-            new_apl_text, 
-            validated_old_apl_text,
-            validated_new_apl_text,
-            validated_diff_json,
-            old_apl_info,
-            new_apl_info,
-            model
-        )
+        # Pre-pass: locate changed regions locally so the model only sees what differs
+        if not chunked_mode and "initial_diff" not in checkpoints:
+            with span("prepass"):
+                if carried:
+                    comparison_input = build_section_input(remaining_pairs)
+                else:
+                    comparison_input = await asyncio.to_thread(
+                        build_comparison_input, old_apl_document, new_apl_document, old_apl_info, new_apl_info
+                    )
+
+        async def initial_diff(stage_use_cache: bool) -> str:
+            if chunked_mode:
+                # Chunked mode: analyze aligned section pairs concurrently and merge the results
+                return await generate_sectioned_diff(
+                    old_apl_document,
+                    new_apl_document,
+                    exemplar["diff_json"],
+                    old_apl_info,
+                    new_apl_info,
+                    model,
+                    stage_use_cache,
+                    carried
+                )
+            if carried and not remaining_pairs:
+                return json.dumps({"bullets": carried_bullets})
+            return with_carried_bullets(await generate_initial_diff(
+                comparison_input,
+                exemplar["compact"],
+                old_apl_info,
+                new_apl_info,
+                model,
+                stage_use_cache
+            ), carried_bullets)
+
+        initial_diff_response = await run_checkpointed("initial_diff", initial_diff, validate_diff)
+        await publish_event(task_id, "initial_diff", {"json": initial_diff_response})
         
-        if quick_mode:
-            # In quick mode, we skip the estimate and final diff steps
-            logger.info(f"Task {task_id}: Quick mode enabled, skipping estimate and final diff steps")
+        # Text the estimate/final loop works from; adaptive mode may narrow it or skip the loop
+        estimate_source_text, final_target_text = old_apl_text, new_apl_text
+        run_estimate_loop = not quick_mode
+        if carried:
+            # Carried-forward sections need no estimate; they are added back to the final diff
+            estimate_source_text, final_target_text = section_texts(remaining_pairs)
+            run_estimate_loop = run_estimate_loop and bool(remaining_pairs)
+        if adaptive_mode and not quick_mode:
+            with span("coverage"):
+                coverage = await asyncio.to_thread(
+                    measure_coverage, old_apl_document, new_apl_document, initial_diff_response, new_apl_info['citation_key']
+                )
+            logger.info(
+                f"Task {task_id}: initial diff cites {coverage.ratio:.0%} of the changed text "
+                f"({len(coverage.uncovered)} changed sentences uncovered)"
+            )
+            coverage_event = {"ratio": round(coverage.ratio, 3), "threshold": COVERAGE_THRESHOLD, "sections": []}
+            if coverage.ratio >= COVERAGE_THRESHOLD:
+                run_estimate_loop = False
+                adaptive_runs.inc(outcome="skipped")
+            else:
+                estimate_source_text, final_target_text, coverage_event["sections"] = await asyncio.to_thread(
+                    uncovered_section_texts, old_apl_document, new_apl_document, coverage.uncovered
+                )
+                adaptive_runs.inc(outcome="partial")
+                logger.info(f"Task {task_id}: checking uncovered sections {', '.join(coverage_event['sections'])}")
+            await publish_event(task_id, "coverage", coverage_event)
+
+        if not run_estimate_loop:
+            # In quick mode (or adaptive mode with full coverage), we skip the estimate and final diff steps
+            logger.info(f"Task {task_id}: skipping estimate and final diff steps")
             final_diff = initial_diff_response
         else:
             # Step 5: Generate new APL estimate
-            logger.info(f"Task {task_id}: Generating new APL estimate")
-            new_apl_estimate = await generate_new_apl_estimate(
-                old_apl_text,
-                initial_diff_response,
-                model
-            )
+            if not estimate_source_text.strip():
+                # Adaptive mode found uncited changes only in sections the old APL does not have
+                logger.info(f"Task {task_id}: no old text to estimate from, skipping the estimate step")
+                new_apl_estimate = "(These sections do not exist in the old APL.)"
+            else:
+                logger.info(f"Task {task_id}: Generating new APL estimate")
+                new_apl_estimate = await run_checkpointed(
+                    "estimate",
+                    lambda stage_use_cache: generate_new_apl_estimate(
+                        estimate_source_text, initial_diff_response, model, stage_use_cache
+                    ),
+                    validate_estimate
+                )
+            await publish_event(task_id, "estimate")
             
             # Step 6: Generate final diff JSON
             logger.info(f"Task {task_id}: Generating final diff JSON")
-            final_diff = await generate_final_diff(
-                new_apl_text,
-                new_apl_estimate,
-                initial_diff_response,  
-                model
+            final_diff = await run_checkpointed(
+                "final_diff",
+                lambda stage_use_cache: generate_final_diff(
+                    final_target_text, new_apl_estimate, initial_diff_response, model, stage_use_cache
+                ),
+                validate_diff
             )
+            if adaptive_mode:
+                # A final diff of only some sections may leave out bullets about the others
+                final_diff = await asyncio.to_thread(
+                    keep_initial_bullets, final_diff, initial_diff_response, old_apl_document, new_apl_document,
+                    old_apl_info['citation_key'], new_apl_info['citation_key']
+                )
+            else:
+                final_diff = with_carried_bullets(final_diff, carried_bullets)
+            await publish_event(task_id, "final_diff", {"json": final_diff})
         
         # Step 7: Score changes
         logger.info(f"Task {task_id}: Scoring changes")
-        scored_diff = await score_and_categorize_changes(final_diff, model)
-        
+        scored_diff = await run_checkpointed(
+            "scoring",
+            lambda stage_use_cache: score_and_categorize_changes(final_diff, model, stage_use_cache),
+            validate_diff
+        )
+        await publish_event(task_id, "scoring")
+
+        # Step 8: Resolve citation page/line numbers against the extracted PDF text
+        with span("citations"):
+            old_index = await asyncio.to_thread(CitationIndex, old_apl_document)
+            new_index = await asyncio.to_thread(CitationIndex, new_apl_document)
+            scored_diff = await asyncio.to_thread(
+                resolve_citations, scored_diff, old_index, new_index,
+                old_apl_info['citation_key'], new_apl_info['citation_key']
+            )
+
+        # Remember both letters and the finished diff for later chained comparisons
+        await asyncio.to_thread(
+            record_lineage,
+            (old_apl_sha256, old_apl_document, old_apl_info, old_apl_filename),
+            (new_apl_sha256, new_apl_document, new_apl_info, new_apl_filename),
+            model,
+            quick_mode,
+            scored_diff
+        )
+
+        await asyncio.to_thread(
+            update_search_index,
+            (old_apl_sha256, old_apl_document, old_apl_info, old_apl_filename),
+            (new_apl_sha256, new_apl_document, new_apl_info, new_apl_filename),
+            scored_diff
+        )
+
         # Update task status
-        processing_tasks[task_id] = {
+        task_summary = task_metrics.to_dict()
+        logger.info(f"Task {task_id}: completed in {task_summary['total_seconds']}s, cost ${task_summary['cost_usd']}")
+        await asyncio.to_thread(task_store.set, task_id, {
             "status": "completed",
-            "json": scored_diff
-        }
+            "json": scored_diff,
+            "metrics": task_summary
+        })
+        await asyncio.to_thread(store_status_response, task_id, completed_status(scored_diff, task_summary))
+        await publish_event(task_id, "completed", {"json": scored_diff, "metrics": task_summary})
+        tasks_total.inc(status="completed")
         
+    except asyncio.CancelledError:
+        if not task_registry.cancel_requested(task_id):
+            raise
+        logger.info(f"Task {task_id}: cancelled")
+        await asyncio.to_thread(task_store.set, task_id, {
+            "status": "cancelled",
+            "metrics": task_metrics.to_dict(),
+            "resume": resume,
+            "checkpoints": checkpoints
+        })
+        await publish_event(task_id, "cancelled", {"resumable": resume is not None})
+        tasks_total.inc(status="cancelled")
+
     except Exception as e:
         logger.error(f"Error in APL comparison task {task_id}: {str(e)}")
-        processing_tasks[task_id] = {
+        # Keep the checkpoints so the task can be resumed from its last good stage
+        await asyncio.to_thread(task_store.set, task_id, {
             "status": "failed",
-            "error": str(e)
-        }
+            "error": str(e),
+            "metrics": task_metrics.to_dict(),
+            "resume": resume,
+            "checkpoints": checkpoints
+        })
+        await publish_event(task_id, "failed", {"error": str(e), "resumable": resume is not None})
+        tasks_total.inc(status="failed")
+    finally:
+        cancel_watcher.cancel()
+        task_registry.unregister(task_id)
+        tasks_in_flight.dec()
+        current_task_metrics.reset(metrics_token)
+        current_priority.reset(priority_token)
+        for source in (old_apl_source, new_apl_source):
+            if isinstance(source, StoredUpload):
+                source.cleanup()
+
+def record_lineage(old_apl: tuple, new_apl: tuple, model: str, quick_mode: bool, diff_json: str):
+    """
+    Record a finished comparison in the lineage index, with its bullets split by section pair.
+
+    ``old_apl`` and ``new_apl`` are (sha256, document, APL info, filename)
+    tuples. A failure here is logged and does not fail the task.
+    """
+    try:
+        for sha256, document, apl_info, filename in (old_apl, new_apl):
+            lineage_index.record_apl(sha256, apl_info, filename, superseded_apl_numbers(document), document.page_count)
+        old_key, new_key = old_apl[2]["citation_key"], new_apl[2]["citation_key"]
+        lineage_index.record_comparison(
+            old_apl[0], new_apl[0], old_apl[2]["apl_number"], new_apl[2]["apl_number"], model, quick_mode, diff_json,
+            old_key, new_key
+        )
+        lineage_index.record_sections(
+            old_apl[0], new_apl[0], model, quick_mode, old_key, new_key,
+            split_by_section(old_apl[1], new_apl[1], diff_json, old_key, new_key)
+        )
+    except Exception as e:
+        logger.warning(f"Could not record lineage for APL {old_apl[2]['apl_number']} vs. {new_apl[2]['apl_number']}: {str(e)}")
+
+def update_search_index(old_apl: tuple, new_apl: tuple, diff_json: str):
+    """
+    Add both letters' text (if new) and the comparison's bullets to the search index.
+
+    Takes the same tuples as record_lineage; a failure is logged and does
+    not fail the task.
+    """
+    try:
+        for sha256, document, apl_info, filename in (old_apl, new_apl):
+            search_index.index_document(sha256, apl_info["apl_number"], filename, document)
+        search_index.index_comparison(old_apl[0], new_apl[0], old_apl[2]["apl_number"], new_apl[2]["apl_number"], diff_json)
+    except Exception as e:
+        logger.warning(f"Could not index APL {old_apl[2]['apl_number']} vs. {new_apl[2]['apl_number']} for search: {str(e)}")
+
+async def run_bulk_comparison(
+    job_id: str,
+    output_dir: str,
+    quick_mode: bool,
+    model: str,
+    use_cache: bool = True,
+    chunked_mode: bool = False,
+    pdf_paths: Optional[List[str]] = None,
+    manifest_path: Optional[str] = None,
+    concurrency: int = BULK_MAX_CONCURRENCY,
+    adaptive_mode: bool = False,
+) -> Optional[dict]:
+    """
+    Compare every APL pair of a release and record aggregate progress under ``job_id``.
+
+    Pairs come from the manifest when one is given (restricted to the files
+    in ``pdf_paths``, if any), otherwise they are found among ``pdf_paths``
+    by supersession. Up to ``concurrency`` pairs run at
+    once; each pair runs as its own task
+    (``<job_id>_<pair name>``) and the job publishes a pair_completed event
+    as each one finishes. Returns the summary index.
+    """
+    async def compare(pair: APLPair) -> Optional[dict]:
+        task_id = f"{job_id}_{pair.name}"
+        await asyncio.to_thread(task_store.set, task_id, {"status": "processing"})
+        await process_apl_comparison(
+            pair.old_path, pair.new_path, task_id, pair.old_filename, pair.new_filename,
+            quick_mode, model, use_cache, chunked_mode, adaptive_mode=adaptive_mode
+        )
+        return await asyncio.to_thread(task_store.get, task_id)
+
+    async def on_progress(entry: dict, progress: dict):
+        logger.info(
+            f"Bulk job {job_id}: {entry['name']} {entry['status']} "
+            f"({progress['completed'] + progress['failed']}/{progress['total']} pairs done)"
+        )
+        await asyncio.to_thread(task_store.set, job_id, {"status": "processing", "progress": progress})
+        await publish_event(job_id, "pair_completed", {"pair": entry, "progress": progress})
+
+    try:
+        if manifest_path:
+            # Alongside uploaded files, a manifest may only name those files
+            allowed_files = None if pdf_paths is None else [os.path.basename(path) for path in pdf_paths]
+            pairs, unpaired = await asyncio.to_thread(load_manifest, manifest_path, allowed_files), []
+        else:
+            pairs, unpaired = await asyncio.to_thread(pair_apls, pdf_paths or [], extract_document_from_pdf)
+        get_exemplar_pack()
+        await asyncio.to_thread(task_store.set, job_id, {
+            "status": "processing",
+            "progress": {"total": len(pairs), "completed": 0, "failed": 0}
+        })
+        tasks_queued.inc(len(pairs))
+
+        index = await run_bulk(pairs, compare, output_dir, concurrency, on_progress, unpaired)
+        index["output_dir"] = output_dir
+        await asyncio.to_thread(task_store.set, job_id, {"status": "completed", "json": json.dumps(index)})
+        await publish_event(job_id, "completed", {"json": json.dumps(index)})
+        return index
+    except Exception as e:
+        logger.error(f"Error in bulk comparison job {job_id}: {str(e)}")
+        await asyncio.to_thread(task_store.set, job_id, {"status": "failed", "error": str(e)})
+        await publish_event(job_id, "failed", {"error": str(e)})
+        return None
 
 async def generate_initial_diff(
-    old_apl_text: str, 
-    new_apl_text: str, 
-    validated_old_apl_text: str,
-    validated_new_apl_text: str,
-    validated_diff_json: str,
+    comparison_input: str,
+    exemplar_context: str,
     old_apl_info: dict,
     new_apl_info: dict,
-    model: str
+    model: str,
+    use_cache: bool = True
 ) -> str:
     """Generate initial diff JSON using OpenAI's model."""
+    comparison_input = fit_to_budget("initial_diff", comparison_input, exemplar_context)
     try:
-        response = client.chat.completions.create(
+        return await chat_completion(
             model=model,
             messages=[
                 {"role": "system", 
@@ -192,14 +677,10 @@ async def generate_initial_diff(
                 {"role": "user", "content": f"""
                 I'm providing you with two pairs of APL documents:
                 
-                1. A validated example:
-                   - Old APL: {validated_old_apl_text}...
-                   - New APL: {validated_new_apl_text}...
-                   - Difference JSON: {validated_diff_json}...
+                1. A validated example, reduced to the passages its difference JSON cites:
+                {exemplar_context}
                 
-                2. The pair I want you to analyze:
-                   - Old APL: {old_apl_text}...
-                   - New APL: {new_apl_text}...
+                2. {comparison_input}
                 
                 Please analyze the second pair of documents and create a detailed JSON document that highlights the key differences between them. 
                 Use the validated example as a reference for the semantic meaning of the changes.
@@ -259,26 +740,137 @@ async def generate_initial_diff(
                 
                 For each change, provide precise citations with page and line numbers.
                 Include the text of the citation in the citation object. Try to include as little as possible while being fully informative of the change. 
-                Make sure the citations line up with the actual location of the start of the context in the pdf.
-                    -Double check each citation to make sure the page/line number is correct on its respecitve pdf.
+                Copy the citation text verbatim from the APL; page and line numbers are verified automatically against the PDF text.
 
                 Format text with ** for bold and * for italic when appropriate.
                 Make sure the output is valid JSON that can be parsed by a JSON parser.
                 """}
             ],
            # temperature=0,
-           # max_tokens=maxtokens,
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            use_cache=use_cache,
+            stage="initial_diff"
         )
-        return response.choices[0].message.content
     except Exception as e:
         logger.error(f"Error generating initial diff: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating initial diff: {str(e)}")
 
-async def generate_new_apl_estimate(old_apl_text: str, initial_diff_json: str, model: str) -> str:
+async def generate_section_diff(
+    old_section: Optional[Section],
+    new_section: Optional[Section],
+    validated_diff_json: str,
+    old_apl_info: dict,
+    new_apl_info: dict,
+    model: str,
+    use_cache: bool = True
+) -> dict:
+    """Generate the diff bullets for one aligned pair of APL sections."""
+    old_key = old_apl_info['citation_key']
+    new_key = new_apl_info['citation_key']
+    old_part = (f"(starts on page {old_section.page}, line {old_section.line})\n{old_section.text}"
+                if old_section else "(This section does not exist in the old APL.)")
+    new_part = (f"(starts on page {new_section.page}, line {new_section.line})\n{new_section.text}"
+                if new_section else "(This section does not exist in the new APL.)")
+    section_title = (new_section or old_section).title
+    old_part = fit_to_budget("section_diff", old_part, new_part, validated_diff_json)
+    new_part = fit_to_budget("section_diff", new_part, old_part, validated_diff_json)
+    try:
+        response = await chat_completion(
+            model=model,
+            messages=[
+                {"role": "system",
+                "content": ("You are a senior healthcare‑policy analyst who prepares executive‑level change "
+                    "briefs for health‑plan Compliance Officers.  You compare one section of two All Plan "
+                    "Letters (APLs) at a time and report ONLY changes that can alter obligations, benefits, "
+                    "eligibility, deadlines, reporting, oversight, or enforcement.  Ignore purely editorial "
+                    "or cosmetic edits.  Answer in valid JSON only.")
+                },
+                {"role": "user", "content": f"""
+                Compare the section "{section_title}" of the old APL ({old_key}, {old_apl_info['year']}) and the new APL ({new_key}, {new_apl_info['year']}).
+
+                Old APL section:
+                {old_part}
+
+                New APL section:
+                {new_part}
+
+                For reference, this validated difference JSON from another APL pair shows the kind of changes that matter:
+                {validated_diff_json}
+
+                Look for 3 types of changes: additions (entirely new), updates (materially rewritten or expanded)
+                and redactions (entirely removed). Redactions are critical compliance changes.
+                Skip formatting, renumbering, grammar, title renames without duty change, and address/phone/email updates.
+
+                Return JSON with:
+                1. A bullets field with an array of bullet objects, each structured as
+                (bullet_title: "", bullet_content: "", revision_type: "addition" | "update" | "redaction", citations: ())
+                Citations should look like:
+                "citations": ("{new_key}": ("page": 3,"line": 12, "text": "..."), "{old_key}": null)
+                2. An impact field: one sentence on what the changes in this section mean for a health plan
+                (empty string if there are no meaningful changes).
+
+                Copy the citation text verbatim from the APL; page and line numbers are verified automatically against the PDF text.
+                Format text with ** for bold and * for italic when appropriate.
+                Make sure the output is valid JSON that can be parsed by a JSON parser.
+                """}
+            ],
+            response_format={"type": "json_object"},
+            use_cache=use_cache,
+            stage="section_diff"
+        )
+        return repair_section_diff(parse_json_object(response))
+    except Exception as e:
+        logger.error(f"Error generating diff for section {section_title}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error generating diff for section {section_title}: {str(e)}")
+
+async def generate_sectioned_diff(
+    old_apl_document: ExtractedDocument,
+    new_apl_document: ExtractedDocument,
+    validated_diff_json: str,
+    old_apl_info: dict,
+    new_apl_info: dict,
+    model: str,
+    use_cache: bool = True,
+    carried: Optional[Dict[int, List[dict]]] = None
+) -> str:
+    """
+    Compare aligned section pairs concurrently and merge them into one diff JSON.
+
+    ``carried`` maps the index of an aligned pair to bullets carried forward
+    from the lineage index; those pairs are not sent to the model.
+    """
+    carried = carried or {}
+    pairs = align_sections(split_sections(old_apl_document), split_sections(new_apl_document))
+    changed = [index for index, (old, new) in enumerate(pairs) if sections_differ(old, new)]
+    logger.info(
+        f"Chunked mode: {len(changed)} of {len(pairs)} aligned sections changed, "
+        f"{sum(1 for index in changed if index in carried)} carried forward from an earlier version"
+    )
+
+    semaphore = asyncio.Semaphore(SECTION_MAX_CONCURRENCY)
+
+    async def analyze(index: int) -> dict:
+        if index in carried:
+            return {"bullets": carried[index], "impact": ""}
+        old_section, new_section = pairs[index]
+        async with semaphore:
+            return await generate_section_diff(
+                old_section, new_section, validated_diff_json, old_apl_info, new_apl_info, model, use_cache
+            )
+
+    section_results = await asyncio.gather(*(analyze(index) for index in changed))
+    return json.dumps(merge_section_diffs(list(section_results), old_apl_info, new_apl_info))
+
+def validate_estimate(estimate: str) -> str:
+    if not estimate or not estimate.strip():
+        raise ValueError("Model returned an empty APL estimate")
+    return estimate
+
+async def generate_new_apl_estimate(old_apl_text: str, initial_diff_json: str, model: str, use_cache: bool = True) -> str:
     """Generate an estimate of the new APL based on the old APL and initial diff JSON."""
+    old_apl_text = fit_to_budget("estimate", old_apl_text, initial_diff_json)
     try:
-        response = client.chat.completions.create(
+        return await chat_completion(
             model=model,
             messages=[
                 {"role": "system", "content": "You are an expert in healthcare policy analysis, specifically for All Plan Letters (APLs). Your task is to generate an estimate of a new APL document based on an old APL document and a diff JSON."},
@@ -297,17 +889,20 @@ async def generate_new_apl_estimate(old_apl_text: str, initial_diff_json: str, m
                 """}
             ],
            # temperature=0,
-           # max_tokens=maxtokens
+            use_cache=use_cache,
+            stage="estimate"
         )
-        return response.choices[0].message.content
     except Exception as e:
         logger.error(f"Error generating new APL estimate: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating new APL estimate: {str(e)}")
 
-async def generate_final_diff(new_apl_text: str, new_apl_estimate: str, initial_diff_json: str, model: str) -> str:
+async def generate_final_diff(new_apl_text: str, new_apl_estimate: str, initial_diff_json: str, model: str, use_cache: bool = True) -> str:
     """Generate the final diff JSON by comparing the actual new APL with the estimated one."""
+    # Trim the model-written estimate before the actual APL text
+    new_apl_estimate = fit_to_budget("final_diff", new_apl_estimate, new_apl_text, initial_diff_json)
+    new_apl_text = fit_to_budget("final_diff", new_apl_text, new_apl_estimate, initial_diff_json)
     try:
-        response = client.chat.completions.create(
+        return await chat_completion(
             model=model,
             messages=[
                 {"role": "system", 
@@ -380,103 +975,171 @@ async def generate_final_diff(new_apl_text: str, new_apl_estimate: str, initial_
                 
                 For each change, provide precise citations with page and line numbers.
                 Include the text of the citation in the citation object. Try to include as little as possible while being fully informative of the change. 
-                Make sure the citations line up with the actual location of the start of the context in the pdf.
-                    -Double check each citation to make sure the page/line number is correct on its respecitve pdf.
+                Copy the citation text verbatim from the APL; page and line numbers are verified automatically against the PDF text.
 
                 Make sure the output is valid JSON that can be parsed by a JSON parser.
                 """
                     }
                 ],
            # temperature=0,
-           # max_tokens=maxtokens,
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            use_cache=use_cache,
+            stage="final_diff"
         )
-        return response.choices[0].message.content
     except Exception as e:
         logger.error(f"Error generating final diff: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating final diff: {str(e)}")
 
-async def score_and_categorize_changes(diff_json: str, model: str) -> str:
-    """Score each change on a scale of 1-10 ."""
+async def score_bullet_batch(bullets: List[dict], model: str, use_cache: bool = True) -> List[int]:
+    """Score one batch of bullets on a scale of 1-10, returning the scores in order."""
+    numbered = "\n\n".join(
+        f"{index}. [{bullet.get('revision_type', '')}] {bullet.get('bullet_title', '')}\n{bullet.get('bullet_content', '')}"
+        for index, bullet in enumerate(bullets, start=1)
+    )
     try:
-        # Parse the diff JSON if it's a string
-        diff_data = json.loads(diff_json) if isinstance(diff_json, str) else diff_json
-        
-        response = client.chat.completions.create(
+        response = await chat_completion(
             model=model,
             messages=[
-                {"role": "system", 
+                {"role": "system",
                 "content": "You are a senior healthcare‑policy analyst who scores policy changes on their significance. "
-                    "Your task is to evaluate each change in a diff JSON and score it on a scale of 1-10, where 1 is not meaningful "
-                    "and 10 is extremely meaningful. Maintain the original change type (Addition, Update, or Redaction) "
-                    "for each item. Output valid JSON only."},
+                    "Your task is to score each change on a scale of 1-10, where 1 is not meaningful "
+                    "and 10 is extremely meaningful. Output valid JSON only."},
                 {"role": "user", "content": f"""
-                I'm providing you with a diff JSON that describes changes between two APL documents:
-                
-                {json.dumps(diff_data, indent=2)}
-                
+                Here are {len(bullets)} changes between two APL documents:
+
+{numbered}
+
                 Please score each change on a scale of 1-10 based on the following criteria:
 
                 Definition of a "meaningful" change (score higher if more apply)
-                * Alters covered populations, benefits, services, or exclusions  
-                * Adds/deletes reporting, documentation, audit, or data requirements  
-                * Changes dollar amounts, penalties, or funding mechanisms  
-                * Modifies timelines, effective dates, or frequency of tasks  
-                * Introduces/changes/removes enforcement or sanction language  
-                * Redefines roles **in a way that shifts responsibility or scope**  
-                * References new or rescinded statutes, regulations, or external guidance  
+                * Alters covered populations, benefits, services, or exclusions
+                * Adds/deletes reporting, documentation, audit, or data requirements
+                * Changes dollar amounts, penalties, or funding mechanisms
+                * Modifies timelines, effective dates, or frequency of tasks
+                * Introduces/changes/removes enforcement or sanction language
+                * Redefines roles **in a way that shifts responsibility or scope**
+                * References new or rescinded statutes, regulations, or external guidance
                 * Adds operational, clinical, or data‑standard procedures
 
                 Ignore List (score lower if these are the only changes)
-                * Formatting/style choices (fonts, italics, bold, citation style)  
-                * Pure title renames without duty change  
-                * Section renumbering, grammar fixes, punctuation, typographical cleanup  
-                * Boilerplate like "revised text in italics" notifications  
+                * Formatting/style choices (fonts, italics, bold, citation style)
+                * Pure title renames without duty change
+                * Section renumbering, grammar fixes, punctuation, typographical cleanup
+                * Boilerplate like "revised text in italics" notifications
                 * Administrative address/phone/email updates with no policy effect
-                
+
                 In general, try to score changes based on their impact on a health plan trying to comply with the APL.
                 Think about actual changes that will require work to maintain regulatory alignment.
-                Think about changes that have actual operational impact. 
-                In addition, at this step, try to see if any changes are not meaningful enough to include,
-                or if they overlap with another change, and those two can be merged.
-                    -In the case of a merge, delete both of the existing bullets and replace them with a new bullet:
-                        -the new bullet should have fresh title logic, fresh scoring, and default to the earlier citation if there is a citation on the same document. 
-                
-                For each change, add a "score" field with the numeric score (1-10) 
+                Think about changes that have actual operational impact.
 
-                The JSON should include:
-                1. A title field with the APL numbers and dates
-                2. A summary field explaining the overall changes
-                3. A bullets field with an array of bullet objects
-                (title: "", summary: "", bullets: [], conclusion:"")
-                4. A conclusion field summarizing the impact of the changes
-               
-                Within each bullet, it should be structued as:
-                (bullet_title: "", bullet_content: "", score: int,revision_type: "addition" | "update" | "redaction", citations: ())
-                1. Title: make sure each bullet has a fitting brief title in the title field
-                2. Content: the bullet_content should be the main content of the bullet.
-                3. Score: A "score" field with the numeric score (1-10)
-                4. Revision Type: A "revision_type" field with the original category (Addition, Update, or Redaction)
-                5. Citations: citations should look like: 
-                "citations": ("APL25": ("page": 3,"line": 12, "text": "..."), "APL21": null)
-                "citations": ("APL21": ("page": 13,"line": 2, "text": "..."), "APL18": ("page": 1,"line": 23, "text": "..."))                
-                
-                For each change, provide precise citations with page and line numbers.
-                Include the text of the citation in the citation object. Try to include as little as possible while being fully informative of the change. 
-                Make sure the citations line up with the actual location of the start of the context in the pdf.
-                    -Double check each citation to make sure the page/line number is correct on its respecitve pdf.
-                
-                -NOTE: Bullets should be sorted by score, highest to lowest.
+                Return JSON with a scores field: an array with one (index: int, score: int) object per change, e.g.
+                "scores": [("index": 1, "score": 8), ("index": 2, "score": 3)]
+                """}
+            ],
+            response_format={"type": "json_object"},
+            use_cache=use_cache,
+            stage="scoring"
+        )
+        scores = {int(item["index"]): int(item["score"]) for item in parse_json_object(response).get("scores", [])}
+        return [max(1, min(10, scores.get(index, 1))) for index in range(1, len(bullets) + 1)]
+    except Exception as e:
+        logger.error(f"Error scoring changes: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error scoring changes: {str(e)}")
+
+async def merge_bullet_group(bullets: List[dict], model: str, use_cache: bool = True) -> List[dict]:
+    """Ask whether overlapping bullets describe one change, and merge them if so."""
+    numbered = "\n\n".join(
+        f"{index}. [{bullet.get('revision_type', '')}] {bullet.get('bullet_title', '')}\n{bullet.get('bullet_content', '')}"
+        for index, bullet in enumerate(bullets, start=1)
+    )
+    try:
+        response = await chat_completion(
+            model=model,
+            messages=[
+                {"role": "system",
+                "content": "You are a senior healthcare‑policy analyst who edits change briefs for health‑plan "
+                    "Compliance Officers. You decide whether overlapping bullets describe the same policy change. "
+                    "Output valid JSON only."},
+                {"role": "user", "content": f"""
+                These bullets from one APL change brief look similar:
+
+{numbered}
+
+                Do they describe the same change, or overlap so much that a Compliance Officer would want one bullet?
+                - If so, return (merge: true, bullet: (bullet_title: "", bullet_content: "", revision_type: "addition" | "update" | "redaction"))
+                  with a fresh title and content covering everything the merged bullets say.
+                - If not, return (merge: false).
+                Format text with ** for bold and * for italic when appropriate.
                 Make sure the output is valid JSON that can be parsed by a JSON parser.
-                """
-                }
+                """}
             ],
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            use_cache=use_cache,
+            stage="scoring"
+        )
+        decision = parse_json_object(response)
+        if not decision.get("merge") or not isinstance(decision.get("bullet"), dict):
+            return bullets
+        merged = {key: str(decision["bullet"].get(key) or "") for key in ("bullet_title", "bullet_content")}
+        # Keep the group's own type when the model's is missing or unrecognized
+        merged["revision_type"] = (
+            _revision_type(decision["bullet"].get("revision_type")) or _revision_type(bullets[0].get("revision_type"))
         )
-        return response.choices[0].message.content
+        if not merged["revision_type"]:
+            return bullets
+        merged["citations"] = earliest_citations(bullets)
+        return [merged]
     except Exception as e:
+        logger.error(f"Error merging overlapping changes: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error merging overlapping changes: {str(e)}")
+
+async def score_and_categorize_changes(diff_json: str, model: str, use_cache: bool = True) -> str:
+    """
+    Score each change on a scale of 1-10, merging overlapping changes first.
+
+    Merge candidates are found locally by text and citation similarity and
+    only those groups go to the model for a merge decision. Bullets are then
+    scored concurrently in small batches and sorted by score in Python, so
+    the model never re-emits the whole document.
+    """
+    try:
+        # Parse the diff JSON if it's a string
+        diff_data = parse_json_object(diff_json) if isinstance(diff_json, str) else diff_json
+    except ValueError as e:
         logger.error(f"Error scoring and categorizing changes: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error scoring and categorizing changes: {str(e)}")
+    bullets = [bullet for bullet in diff_data.get("bullets", []) if isinstance(bullet, dict)]
+    semaphore = asyncio.Semaphore(SCORING_MAX_CONCURRENCY)
+
+    async def merge(group: List[int]) -> List[dict]:
+        async with semaphore:
+            return await merge_bullet_group([bullets[index] for index in group], model, use_cache)
+
+    async def score(batch: List[dict]) -> List[int]:
+        async with semaphore:
+            return await score_bullet_batch(batch, model, use_cache)
+
+    # Merge decisions: each group's result takes the place of its first member
+    groups = find_merge_candidates(bullets)
+    logger.info(f"Scoring {len(bullets)} changes, {len(groups)} merge candidate groups")
+    merge_results = await asyncio.gather(*(merge(group) for group in groups))
+    replacements = {group[0]: result for group, result in zip(groups, merge_results)}
+    grouped = {index for group in groups for index in group}
+    merged_bullets: List[dict] = []
+    for index, bullet in enumerate(bullets):
+        if index in replacements:
+            merged_bullets.extend(replacements[index])
+        elif index not in grouped:
+            merged_bullets.append(bullet)
+
+    bullet_batches = batches(merged_bullets)
+    batch_scores = await asyncio.gather(*(score(batch) for batch in bullet_batches))
+    for batch, scores in zip(bullet_batches, batch_scores):
+        for bullet, bullet_score in zip(batch, scores):
+            bullet["score"] = bullet_score
+
+    diff_data["bullets"] = sort_by_score(merged_bullets)
+    return json.dumps(diff_data)
 
 @app.post("/api/compare")
 async def compare_apls(
@@ -485,7 +1148,10 @@ async def compare_apls(
     new_apl: UploadFile = File(...),
     quick_mode: str = Form(default="false"),
     model: str = Form(default="gpt-4.1"),
-    view_mode: str = Form(default="significance")
+    view_mode: str = Form(default="significance"),
+    bypass_cache: str = Form(default="false"),
+    chunked_mode: str = Form(default="false"),
+    adaptive_mode: str = Form(default="false")
 ):
     # Debug logging
     logger.info(f"Received quick_mode parameter: '{quick_mode}'")
@@ -499,86 +1165,486 @@ async def compare_apls(
     - old_apl: The predecessor APL file
     - new_apl: The new APL file
     
+    Set bypass_cache to "true" to ignore cached model responses for this run,
+    chunked_mode to "true" to compare long APLs section by section, and
+    adaptive_mode to "true" (with quick_mode "false") to run the estimate and
+    final diff steps only for changes the initial diff does not cite.
+    
     It returns a task ID that can be used to check the status of the comparison.
+    The ID is derived from both PDFs' content and the options: submitting a
+    comparison identical to one still running returns the running task's ID
+    (with "attached": true) instead of starting a second run.
     """
-    # Create a unique task ID
-    task_id = f"{old_apl.filename}_{new_apl.filename}"
+    # Convert quick_mode string to boolean
+    # Default to False if quick_mode is None
+    if quick_mode is None:
+        quick_mode_bool = False
+        logger.info("No quick_mode parameter received, defaulting to False")
+    else:
+        quick_mode_bool = quick_mode.lower() == "true"
+    use_cache = bypass_cache.lower() != "true"
+    chunked_mode_bool = chunked_mode.lower() == "true"
+    adaptive_mode_bool = adaptive_mode.lower() == "true" and not quick_mode_bool
+    
+    # Stream the uploads in chunks (small files stay in memory, larger ones go to
+    # temporary files that process_apl_comparison deletes when it finishes)
+    old_upload = await save_upload(old_apl)
+    try:
+        new_upload = await save_upload(new_apl)
+    except Exception:
+        old_upload.cleanup()
+        raise
     
-    # Initialize task status
-    processing_tasks[task_id] = {"status": "processing"}
+    # The task ID is derived from the PDFs' content and the options, so an identical
+    # submission made while the first is still running attaches to it
+    task_id = comparison_task_id(
+        old_apl.filename, old_upload.sha256, new_apl.filename, new_upload.sha256,
+        quick_mode=quick_mode_bool, model=model, use_cache=use_cache,
+        chunked_mode=chunked_mode_bool, adaptive_mode=adaptive_mode_bool,
+    )
+    # Initialize task status (dropping any earlier run's events under the same ID)
+    if not await asyncio.to_thread(task_store.claim, task_id, {"status": "processing"}):
+        old_upload.cleanup()
+        new_upload.cleanup()
+        logger.info(f"Task {task_id}: identical comparison already running, attaching to it")
+        await publish_event(task_id, "attached")
+        return {"task_id": task_id, "status": "processing", "attached": True}
     
     try:
-        # Create temporary files for the uploaded PDFs
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as old_temp, \
-             tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as new_temp:
-            
-            # Write uploaded files to temporary files
-            old_temp.write(await old_apl.read())
-            new_temp.write(await new_apl.read())
-            
-            # Get paths to validated example files
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            parent_dir = os.path.dirname(current_dir)
-            validated_old_apl_path = os.path.join(parent_dir, "APL13-014.pdf")
-            validated_new_apl_path = os.path.join(parent_dir, "APL25-008.pdf")
-            validated_diff_path = os.path.join(parent_dir, "Diff_13-014_25-008 copy.json")
-            
-            # Verify that the validated files exist
-            for file_path in [validated_old_apl_path, validated_new_apl_path, validated_diff_path]:
-                if not os.path.exists(file_path):
-                    raise HTTPException(status_code=500, detail=f"Validated file not found: {file_path}")
-            
-            # Convert quick_mode string to boolean
-            # Default to False if quick_mode is None
-            if quick_mode is None:
-                quick_mode_bool = False
-                logger.info("No quick_mode parameter received, defaulting to False")
-            else:
-                quick_mode_bool = quick_mode.lower() == "true"
-            
-            # Start background task for processing
-            background_tasks.add_task(
-                process_apl_comparison,
-                old_temp.name,
-                new_temp.name,
-                validated_old_apl_path,
-                validated_new_apl_path,
-                validated_diff_path,
-                task_id,
-                old_apl.filename,
-                new_apl.filename,
-                quick_mode_bool,
-                model,
-            )
-            
-            return {"task_id": task_id, "status": "processing"}
+        # Make sure the validated example is available before queueing work
+        get_exemplar_pack()
+        
+        # Start background task for processing
+        tasks_queued.inc()
+        background_tasks.add_task(
+            process_apl_comparison,
+            old_upload,
+            new_upload,
+            task_id,
+            old_apl.filename,
+            new_apl.filename,
+            quick_mode_bool,
+            model,
+            use_cache,
+            chunked_mode_bool,
+            adaptive_mode=adaptive_mode_bool,
+        )
+        
+        return {"task_id": task_id, "status": "processing"}
     
     except Exception as e:
         logger.error(f"Error processing APL comparison: {str(e)}")
-        processing_tasks[task_id] = {"status": "failed", "error": str(e)}
+        old_upload.cleanup()
+        new_upload.cleanup()
+        await asyncio.to_thread(task_store.set, task_id, {"status": "failed", "error": str(e)})
+        await publish_event(task_id, "failed", {"error": str(e)})
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/bulk")
+async def compare_apl_release(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    manifest: str = Form(default=""),
+    quick_mode: str = Form(default="false"),
+    model: str = Form(default="gpt-4.1"),
+    bypass_cache: str = Form(default="false"),
+    chunked_mode: str = Form(default="false"),
+    adaptive_mode: str = Form(default="false")
+):
+    """
+    Compare a whole release of APLs in one job.
+    
+    This endpoint accepts any number of APL PDFs. Predecessor/successor pairs
+    are found through each letter's "SUPERSEDES ALL PLAN LETTER" line, or taken
+    from ``manifest``, a JSON list of {"old": filename, "new": filename} objects
+    naming uploaded files.
+    
+    It returns a job ID; progress is available from /api/bulk/{job_id} and
+    as pair_completed events on /api/stream/{job_id}.
+    """
+    # Uploads are stored under their own filenames in the job's input directory
+    filenames = [os.path.basename(upload.filename or "") for upload in files]
+    for filename in filenames:
+        if not filename.lower().endswith(".pdf"):
+            raise HTTPException(status_code=400, detail=f"Every upload must be a named PDF file, got '{filename}'")
+    duplicates = sorted({filename for filename in filenames if filenames.count(filename) > 1})
+    if duplicates:
+        raise HTTPException(status_code=400, detail=f"Duplicate upload filenames: {', '.join(duplicates)}")
+    if manifest:
+        try:
+            entries = manifest_entries(json.loads(manifest))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid manifest: {str(e)}")
+        unknown = sorted({name for entry in entries for name in entry if name not in filenames})
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Manifest names files that were not uploaded: {', '.join(unknown)}")
+
+    job_id = f"bulk_{uuid.uuid4().hex[:12]}"
+    output_dir = os.path.join(BULK_OUTPUT_DIR, job_id)
+    input_dir = os.path.join(output_dir, "input")
+    os.makedirs(input_dir, exist_ok=True)
+
+    pdf_paths = []
+    for upload, filename in zip(files, filenames):
+        stored = await save_upload(upload, os.path.join(input_dir, filename))
+        pdf_paths.append(stored.path)
+
+    manifest_path = None
+    if manifest:
+        manifest_path = os.path.join(input_dir, "manifest.json")
+        with open(manifest_path, "w") as f:
+            f.write(manifest)
+
+    await asyncio.to_thread(task_store.set, job_id, {"status": "processing"})
+    background_tasks.add_task(
+        run_bulk_comparison,
+        job_id,
+        output_dir,
+        quick_mode.lower() == "true",
+        model,
+        bypass_cache.lower() != "true",
+        chunked_mode.lower() == "true",
+        pdf_paths,
+        manifest_path,
+        adaptive_mode=adaptive_mode.lower() == "true",
+    )
+    return {"job_id": job_id, "status": "processing"}
+
+@app.get("/api/bulk/{job_id}")
+async def get_bulk_status(job_id: str):
+    """
+    Check the progress of a bulk comparison job.
+    
+    Returns the pair counts while the job runs, and the summary index (one
+    entry per pair with its status and result file) once it is done.
+    """
+    job_info = await asyncio.to_thread(task_store.get, job_id)
+    if job_info is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job_info["status"] == "failed":
+        return {"status": "failed", "error": job_info.get("error", "Unknown error")}
+
+    if job_info["status"] == "completed":
+        return {"status": "completed", "index": json.loads(job_info["json"])}
+
+    return {"status": "processing", "progress": job_info.get("progress")}
+
+def completed_status(result_json: str, metrics: Optional[dict]) -> dict:
+    return {"status": "completed", "json": result_json, "metrics": metrics}
+
+def store_status_response(task_id: str, status: dict) -> str:
+    """Serialize and compress a completed task's status response once, returning its ETag."""
+    etag, encoded = encode_body(json.dumps(status).encode("utf-8"))
+    task_store.set_response(task_id, etag, encoded)
+    return etag
+
+def encoded_status_response(etag: str, encoding: Optional[str], body: bytes) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.get("/api/status/{task_id}")
-async def get_task_status(task_id: str):
+async def get_task_status(task_id: str, request: Request):
     """
     Check the status of an APL comparison task.
     
     This endpoint accepts a task ID and returns the status of the task.
     If the task is completed, it also returns the JSON result.
+
+    Completed responses are served from a pre-serialized, pre-compressed copy
+    (brotli or gzip, as the client accepts) with a content-hash ETag; a
+    request whose If-None-Match matches gets 304 Not Modified with no body.
     """
-    if task_id not in processing_tasks:
+    if_none_match = request.headers.get("if-none-match")
+    encoding = preferred_encoding(request.headers.get("accept-encoding"))
+    stored = await asyncio.to_thread(task_store.get_response, task_id, None if if_none_match else encoding or "gzip")
+    if stored is not None:
+        etag, body = stored
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"})
+        if body is None:
+            etag, body = await asyncio.to_thread(task_store.get_response, task_id, encoding or "gzip") or (etag, None)
+        if body is not None:
+            if encoding is None:
+                body = decode_body("gzip", body)
+            return encoded_status_response(etag, encoding, body)
+
+    task_info = await asyncio.to_thread(task_store.get, task_id)
+    if task_info is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task_info = processing_tasks[task_id]
-    
     if task_info["status"] == "failed":
-        return {"status": "failed", "error": task_info.get("error", "Unknown error")}
+        return {
+            "status": "failed",
+            "error": task_info.get("error", "Unknown error"),
+            "resumable": bool(task_info.get("resume")),
+            "checkpoints": list(task_info.get("checkpoints") or {}),
+        }
+
+    if task_info["status"] == "cancelled":
+        return {
+            "status": "cancelled",
+            "resumable": bool(task_info.get("resume")),
+            "checkpoints": list(task_info.get("checkpoints") or {}),
+        }
     
     if task_info["status"] == "completed":
-        return {"status": "completed", "json": task_info["json"]}
+        # Completed before responses were stored pre-encoded: encode it now for later reads
+        status = completed_status(task_info["json"], task_info.get("metrics"))
+        await asyncio.to_thread(store_status_response, task_id, status)
+        return status
     
+    # Position of the task's next model call in the admission queue (this worker's queue only)
+    queue_position = scheduler.queue_position(task_id)
+    if queue_position is not None:
+        return {"status": "processing", "queue_position": queue_position}
     return {"status": "processing"}
 
+@app.get("/api/lineage/{apl_number}")
+async def get_apl_lineage(apl_number: str):
+    """
+    Return the supersession chain through an APL (oldest first), the recorded
+    version of each letter in it and which consecutive comparisons are stored.
+    """
+    chain = await asyncio.to_thread(lineage_index.chain, apl_number)
+    documents = [await asyncio.to_thread(lineage_index.latest_document, number) for number in chain]
+    if len(chain) == 1 and documents[0] is None:
+        raise HTTPException(status_code=404, detail=f"APL {apl_number} has not been processed")
+    return {
+        "apl_number": apl_number,
+        "chain": chain,
+        "documents": documents,
+        "comparisons": await asyncio.to_thread(lineage_index.comparisons_for, chain),
+    }
+
+def compose_lineage_diff(old_number: str, new_number: str) -> dict:
+    path = lineage_index.find_path(old_number, new_number, compared_only=True) or lineage_index.find_path(old_number, new_number)
+    if path is None or len(path) < 2:
+        raise HTTPException(status_code=404, detail=f"APL {new_number} is not known to supersede APL {old_number}")
+
+    hops = []
+    for hop_old, hop_new in zip(path, path[1:]):
+        comparison = lineage_index.get_comparison(hop_old, hop_new)
+        if comparison is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No stored comparison of APL {hop_new} vs. APL {hop_old}; run that comparison first",
+            )
+        # Bullets cite the letters under the keys their own comparison used
+        infos = []
+        for sha256, number, stored_key in (
+            (comparison["old_sha256"], hop_old, comparison["old_key"]),
+            (comparison["new_sha256"], hop_new, comparison["new_key"]),
+        ):
+            document = lineage_index.get_document(sha256) or lineage_index.latest_document(number)
+            info = {key: document[key] for key in ("apl_number", "year", "citation_key")}
+            infos.append(dict(info, citation_key=stored_key or info["citation_key"]))
+        old_document = extraction_cache.get(comparison["old_sha256"])
+        new_document = extraction_cache.get(comparison["new_sha256"])
+        hops.append(DiffHop(
+            infos[0],
+            infos[1],
+            json.loads(comparison["diff"]),
+            CitationIndex(old_document) if old_document else None,
+            CitationIndex(new_document) if new_document else None,
+        ))
+
+    diff = hops[0].diff if len(hops) == 1 else compose_diffs(hops)
+    return {"status": "completed", "json": json.dumps(diff), "chain": path, "composed": len(hops) > 1}
+
+@app.get("/api/lineage/{old_number}/{new_number}")
+async def get_lineage_diff(old_number: str, new_number: str):
+    """
+    Return the net changes between two APLs of one supersession chain,
+    composed from the stored comparisons of each consecutive pair without
+    running the pipeline again.
+    """
+    return await asyncio.to_thread(compose_lineage_diff, old_number, new_number)
+
+@app.get("/api/search")
+async def search(
+    q: str,
+    type: str = "all",
+    apl: Optional[str] = None,
+    revision_type: Optional[str] = None,
+    min_score: Optional[int] = None,
+    limit: int = 20
+):
+    """
+    Search the text of processed APLs and the bullets of completed comparisons.
+
+    ``type`` is "text", "bullets" or "all". Text hits carry a page/line
+    citation and a highlighted snippet; bullet hits carry the bullet and its
+    citations. Both are ranked by relevance. ``apl`` limits results to one
+    APL number; ``revision_type`` and ``min_score`` filter bullets.
+    """
+    if type not in ("all", "text", "bullets"):
+        raise HTTPException(status_code=400, detail='type must be "all", "text" or "bullets"')
+    limit = max(1, min(limit, 100))
+    started = time.perf_counter()
+    results = {}
+    if type in ("all", "bullets"):
+        results["bullets"] = await asyncio.to_thread(
+            search_index.search_bullets, q, apl, revision_type, min_score, limit
+        )
+    if type in ("all", "text"):
+        results["text"] = await asyncio.to_thread(search_index.search_text, q, apl, limit)
+    return {"query": q, "took_ms": round((time.perf_counter() - started) * 1000, 2), **results}
+
+@app.post("/api/resume/{task_id}")
+async def resume_task(task_id: str, background_tasks: BackgroundTasks):
+    """
+    Resume a failed or cancelled comparison from its last checkpointed stage.
+
+    Stages that completed before the failure are not run again. The PDFs
+    are not needed: their extracted text is read back from the extraction
+    cache. Returns 409 if the task has not failed or been cancelled, stopped
+    before its PDFs were extracted, or its extracted text is no longer cached.
+    """
+    task_info = await asyncio.to_thread(task_store.get, task_id)
+    if task_info is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task_info["status"] not in ("failed", "cancelled"):
+        raise HTTPException(status_code=409, detail="Only failed or cancelled tasks can be resumed")
+    resume = task_info.get("resume")
+    if not resume:
+        raise HTTPException(status_code=409, detail="Task failed before its PDFs were extracted; submit it again")
+    for digest in (resume["old_sha256"], resume["new_sha256"]):
+        if await asyncio.to_thread(extraction_cache.get, digest) is None:
+            raise HTTPException(status_code=409, detail="Extracted text is no longer cached; submit the task again")
+
+    checkpoints = task_info.get("checkpoints") or {}
+    logger.info(f"Task {task_id}: resuming with checkpoints for {', '.join(checkpoints) or 'no stages'}")
+    # Start a fresh event stream for the resumed run (unless a concurrent resume already did)
+    claimed = await asyncio.to_thread(
+        task_store.claim, task_id, {"status": "processing", "resume": resume, "checkpoints": checkpoints}
+    )
+    if not claimed:
+        raise HTTPException(status_code=409, detail="Task is already running")
+    tasks_queued.inc()
+    background_tasks.add_task(
+        process_apl_comparison,
+        # Already-extracted documents are looked up in the extraction cache by hash
+        StoredUpload(resume["old_filename"], resume["old_sha256"], 0),
+        StoredUpload(resume["new_filename"], resume["new_sha256"], 0),
+        task_id,
+        resume["old_filename"],
+        resume["new_filename"],
+        resume["quick_mode"],
+        resume["model"],
+        resume["use_cache"],
+        resume["chunked_mode"],
+        checkpoints,
+        resume.get("adaptive_mode", False),
+    )
+    return {"task_id": task_id, "status": "processing", "checkpoints": list(checkpoints)}
+
+@app.post("/api/cancel/{task_id}")
+async def cancel_task(task_id: str):
+    """
+    Cancel a running comparison on behalf of one client waiting on it.
+
+    A comparison that other clients attached to keeps running until each
+    of them has cancelled too. Once nobody is waiting, the task's queued
+    and in-flight model calls are aborted and it ends with status
+    "cancelled" (resumable from its checkpoints). The task may run in
+    another worker, which notices the request within
+    TASK_CANCEL_POLL_INTERVAL seconds. Returns 409 if the task is not
+    running.
+    """
+    task_info = await asyncio.to_thread(task_store.get, task_id)
+    if task_info is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task_info["status"] != "processing":
+        raise HTTPException(status_code=409, detail=f"Task is {task_info['status']}, not running")
+
+    await publish_event(task_id, "cancel_requested")
+    remaining = attached_clients(await asyncio.to_thread(task_store.get_events, task_id))
+    if remaining > 0:
+        return {"task_id": task_id, "status": "processing", "attached": remaining}
+    task_registry.cancel(task_id)
+    return {"task_id": task_id, "status": "cancelling"}
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Expose stage latencies, model token/cost counters and task gauges in the
+    Prometheus text format. Values are per server process.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/stream/{task_id}")
+async def stream_task_events(task_id: str, request: Request):
+    """
+    Stream the progress of an APL comparison task as server-sent events.
+    
+    Each finished stage is pushed as an event (extraction, initial_diff,
+    estimate, final_diff, scoring), with partial results attached where a
+    stage produces one, followed by a final completed, failed or cancelled
+    event.
+    Reconnecting clients send Last-Event-ID and resume after that event.
+    """
+    if await asyncio.to_thread(task_store.get, task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    last_event_id = request.headers.get("last-event-id", "")
+    after = int(last_event_id) if last_event_id.isdigit() else 0
+
+    async def event_source():
+        nonlocal after
+        idle = 0.0
+        while not await request.is_disconnected():
+            events = await asyncio.to_thread(task_store.get_events, task_id, after)
+            for seq, event, data in events:
+                after = seq
+                yield f"id: {seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+                if event in ("completed", "failed", "cancelled"):
+                    return
+
+            if events:
+                idle = 0.0
+            else:
+                idle += STREAM_POLL_INTERVAL
+                if idle >= STREAM_HEARTBEAT_INTERVAL:
+                    idle = 0.0
+                    # The event log may have expired before the task did; fall back to its final state
+                    task_info = await asyncio.to_thread(task_store.get, task_id)
+                    if task_info is None:
+                        return
+                    if task_info["status"] == "completed":
+                        yield f"event: completed\ndata: {json.dumps({'json': task_info['json']})}\n\n"
+                        return
+                    if task_info["status"] == "failed":
+                        yield f"event: failed\ndata: {json.dumps({'error': task_info.get('error', 'Unknown error')})}\n\n"
+                        return
+                    if task_info["status"] == "cancelled":
+                        yield "event: cancelled\ndata: {}\n\n"
+                        return
+                    yield ": keep-alive\n\n"
+            await asyncio.sleep(STREAM_POLL_INTERVAL)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.on_event("startup")
+async def startup():
+    """Preload the validated example so comparisons never re-read it from disk."""
+    global exemplar_pack
+    await asyncio.to_thread(sweep_stale_uploads, TASK_TTL)
+    exemplar_pack = await asyncio.to_thread(load_exemplar_pack)
+    logger.info("Loaded validated exemplar pack")
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release pooled LLM connections and extraction workers when the server stops."""
+    await close_client()
+    shutdown_executor()
+
 @app.get("/")
 async def root():
     return {"message": "APL Comparison API is running"}
@@ -0,0 +1,227 @@
+"""Per-task timing spans, token/cost accounting and Prometheus-style process metrics."""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# USD per million prompt / completion tokens; override or extend with a JSON object in LLM_PRICES,
+# e.g. {"gpt-4.1": [2.0, 8.0]}
+DEFAULT_LLM_PRICES = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "o3": (2.00, 8.00),
+    "o4-mini": (1.10, 4.40),
+}
+LLM_PRICES = {**DEFAULT_LLM_PRICES, **{k: tuple(v) for k, v in json.loads(os.getenv("LLM_PRICES", "{}")).items()}}
+
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _label_value(value: str) -> str:
+    """Escape a label value for the text exposition format (backslash, double quote and line feed)."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {value:g}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = (), buckets=DURATION_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            # [per-bucket counts, sum, count]
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, observed) in sorted(self._values.items()):
+                bounds = [f'le="{bound:g}"' for bound in self.buckets] + ['le="+Inf"']
+                for bound, count in zip(bounds, counts + [observed]):
+                    lines.append(f"{self.name}_bucket{_label_text(self.labels, key, bound)} {count}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {total:g}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, key)} {observed}")
+        return lines
+
+
+stage_duration = Histogram("apl_stage_duration_seconds", "Wall time of each comparison stage", ("stage",))
+llm_request_duration = Histogram("apl_llm_request_duration_seconds", "Latency of chat completion requests", ("model", "stage"))
+llm_requests = Counter("apl_llm_requests_total", "Chat completion requests by outcome", ("model", "stage", "outcome"))
+llm_tokens = Counter("apl_llm_tokens_total", "Tokens reported by the API", ("model", "stage", "kind"))
+llm_cost = Counter("apl_llm_cost_usd_total", "Estimated model spend in US dollars", ("model",))
+tasks_total = Counter("apl_tasks_total", "Finished comparison tasks by status", ("status",))
+stage_retries = Counter("apl_stage_retries_total", "Pipeline stage attempts that failed and were retried", ("stage",))
+adaptive_runs = Counter("apl_adaptive_runs_total", "Adaptive-mode tasks by how much of the estimate/final loop ran", ("outcome",))
+tasks_queued = Gauge("apl_tasks_queued", "Accepted comparison tasks that have not started")
+tasks_in_flight = Gauge("apl_tasks_in_flight", "Comparison tasks being processed")
+llm_in_flight = Gauge("apl_llm_requests_in_flight", "Chat completion requests awaiting a response")
+llm_queued = Gauge("apl_llm_requests_queued", "Chat completion requests waiting for admission", ("model",))
+llm_queue_wait = Histogram("apl_llm_queue_wait_seconds", "Time chat completion requests waited for admission", ("model",))
+
+REGISTRY: List[_Metric] = [
+    stage_duration, llm_request_duration, llm_requests, llm_tokens, llm_cost,
+    tasks_total, stage_retries, adaptive_runs, tasks_queued, tasks_in_flight, llm_in_flight, llm_queued, llm_queue_wait,
+]
+
+
+def render_metrics() -> str:
+    """Render every metric in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """Estimated USD cost of a call, or None for models without a known price."""
+    prices = LLM_PRICES.get(model)
+    if prices is None:
+        # Dated snapshots such as "gpt-4.1-2025-04-14" use their base model's price
+        base = max((name for name in LLM_PRICES if model.startswith(name + "-")), key=len, default=None)
+        prices = LLM_PRICES.get(base) if base else None
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+class TaskMetrics:
+    """Timing spans and per-model token/cost totals collected while one task runs."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.spans: List[Dict[str, Any]] = []
+        self.models: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, stage: str, start: float, seconds: float):
+        with self._lock:
+            self.spans.append({"stage": stage, "start": round(start - self.started, 3), "seconds": round(seconds, 3)})
+
+    def add_usage(self, model: str, prompt_tokens: int, completion_tokens: int, cost: Optional[float], cached: bool):
+        with self._lock:
+            totals = self.models.setdefault(
+                model, {"requests": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0}
+            )
+            totals["requests"] += 1
+            totals["cache_hits"] += int(cached)
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["cost_usd"] += cost or 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {model: dict(totals, cost_usd=round(totals["cost_usd"], 6)) for model, totals in self.models.items()}
+            return {
+                "total_seconds": round(time.monotonic() - self.started, 3),
+                "spans": list(self.spans),
+                "models": models,
+                "cost_usd": round(sum(totals["cost_usd"] for totals in self.models.values()), 6),
+            }
+
+
+# Metrics of the task whose code is running; copied into tasks created by asyncio.gather
+current_task_metrics: ContextVar[Optional[TaskMetrics]] = ContextVar("current_task_metrics", default=None)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a block as a stage of the current task and in the stage duration histogram."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        seconds = time.monotonic() - start
+        stage_duration.observe(seconds, stage=stage)
+        task_metrics = current_task_metrics.get()
+        if task_metrics is not None:
+            task_metrics.add_span(stage, start, seconds)
+
+
+def record_llm_call(model: str, stage: str, seconds: float, usage: Any):
+    """Account for a completed chat completion request and its reported token usage."""
+    prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+    completion_tokens = int(getattr(usage, "completion_tokens", 0) or 0)
+    cost = estimate_cost(model, prompt_tokens, completion_tokens)
+    llm_request_duration.observe(seconds, model=model, stage=stage)
+    llm_requests.inc(model=model, stage=stage, outcome="ok")
+    llm_tokens.inc(prompt_tokens, model=model, stage=stage, kind="prompt")
+    llm_tokens.inc(completion_tokens, model=model, stage=stage, kind="completion")
+    if cost is not None:
+        llm_cost.inc(cost, model=model)
+    task_metrics = current_task_metrics.get()
+    if task_metrics is not None:
+        task_metrics.add_usage(model, prompt_tokens, completion_tokens, cost, cached=False)
+
+
+def record_llm_cache_hit(model: str, stage: str):
+    llm_requests.inc(model=model, stage=stage, outcome="cache_hit")
+    task_metrics = current_task_metrics.get()
+    if task_metrics is not None:
+        task_metrics.add_usage(model, 0, 0, 0.0, cached=True)
+
+
+def record_llm_error(model: str, stage: str, outcome: str = "error"):
+    llm_requests.inc(model=model, stage=stage, outcome=outcome)
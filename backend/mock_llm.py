@@ -0,0 +1,154 @@
+"""
+Local OpenAI-compatible stand-in for benchmarking the pipeline without live model calls.
+
+Responses are replayed from a recorded response cache (the SQLite database
+the LLM gateway writes, see llm_cache.py) when the request was seen before,
+and otherwise synthesized per stage from the sample JSON in the repository.
+Latency and HTTP 429 rate limiting are configurable. Run from the backend
+directory:
+
+    python -m mock_llm --port 9999 --latency 0.5 --rate-limit-ratio 0.05
+"""
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from llm_cache import LLMResponseCache, cache_key
+from token_budget import count_message_tokens, count_tokens
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIFF_PATH = os.path.join(REPO_DIR, "newjsonformat.json")
+FIXTURE_ESTIMATE_PDF = os.path.join(REPO_DIR, "APL25-008.pdf")
+
+_NUMBERED_BULLET = re.compile(r"^\s*\d+\. \[", re.MULTILINE)
+
+
+class MockSettings:
+    """Behaviour of the stand-in server, set from the command line."""
+    latency: float = 0.5
+    jitter: float = 0.1
+    rate_limit_ratio: float = 0.0
+    retry_after: float = 1.0
+    recordings: Optional[LLMResponseCache] = None
+
+
+settings = MockSettings()
+stats: Dict[str, int] = {"requests": 0, "replayed": 0, "synthesized": 0, "rate_limited": 0}
+app = FastAPI(title="Mock LLM")
+
+_fixtures: Dict[str, Any] = {}
+
+
+def _fixture_diff() -> dict:
+    if "diff" not in _fixtures:
+        with open(FIXTURE_DIFF_PATH, "r") as f:
+            _fixtures["diff"] = json.load(f)
+    return _fixtures["diff"]
+
+
+def _fixture_estimate() -> str:
+    if "estimate" not in _fixtures:
+        from pdf_extraction import extract_document
+        with open(FIXTURE_ESTIMATE_PDF, "rb") as f:
+            _fixtures["estimate"] = extract_document(f.read()).text
+    return _fixtures["estimate"]
+
+
+def synthesize_response(body: Dict[str, Any]) -> str:
+    """Answer a pipeline request in the shape its stage expects."""
+    messages = body.get("messages", [])
+    prompt = str(messages[-1].get("content", "")) if messages else ""
+    if body.get("response_format") is None:
+        return _fixture_estimate()
+    if "scores field" in prompt:
+        count = len(_NUMBERED_BULLET.findall(prompt))
+        return json.dumps({"scores": [{"index": i, "score": random.randint(1, 10)} for i in range(1, count + 1)]})
+    if "look similar" in prompt:
+        return json.dumps({"merge": False})
+    if "impact field" in prompt:
+        bullets = _fixture_diff()["bullets"]
+        start = random.randrange(len(bullets))
+        return json.dumps({"bullets": bullets[start:start + 2], "impact": "Plans must update affected policies."})
+    return json.dumps(_fixture_diff())
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+
+    if settings.rate_limit_ratio and random.random() < settings.rate_limit_ratio:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": str(settings.retry_after)},
+            content={"error": {"message": "Rate limit reached (injected)", "type": "requests", "code": "rate_limit_exceeded"}},
+        )
+
+    content = None
+    if settings.recordings is not None:
+        key = cache_key(body["model"], body["messages"], body.get("response_format"))
+        content = await asyncio.to_thread(settings.recordings.get, key)
+    if content is not None:
+        stats["replayed"] += 1
+    else:
+        stats["synthesized"] += 1
+        content = synthesize_response(body)
+
+    await asyncio.sleep(max(0.0, random.gauss(settings.latency, settings.jitter)))
+    prompt_tokens = count_message_tokens(body.get("messages", []))
+    completion_tokens = count_tokens(content)
+    return {
+        "id": f"chatcmpl-mock-{stats['requests']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body["model"],
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mock_llm", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--latency", type=float, default=settings.latency, help="mean seconds per response")
+    parser.add_argument("--jitter", type=float, default=settings.jitter, help="standard deviation of the latency")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=settings.retry_after, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--recordings", help="llm_responses.sqlite to replay recorded responses from")
+    args = parser.parse_args(argv)
+
+    settings.latency = args.latency
+    settings.jitter = args.jitter
+    settings.rate_limit_ratio = args.rate_limit_ratio
+    settings.retry_after = args.retry_after
+    if args.recordings:
+        settings.recordings = LLMResponseCache(args.recordings)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
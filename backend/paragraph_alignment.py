@@ -0,0 +1,491 @@
+"""
+Paragraph alignment between two APL versions with MinHash shingle similarity.
+
+Both documents are split into paragraphs anchored at their page/line. Each
+paragraph gets a MinHash signature of its word shingles; locality-sensitive
+hashing (LSH) bands pick candidate pairs and their signature agreement
+estimates Jaccard similarity, and the candidates' exact shingle overlap
+then decides the pairing. The best one-to-one matches are classified as
+matched, moved (out of reading order) or reworded, and the rest as added
+or removed. Only the LSH candidates are scored, in pure Python; the bands
+are sized so that pairs near ALIGN_MIN_SIMILARITY are still likely to
+share one. If NumPy happens to be installed (it is not required), the
+full old x new signature-agreement matrix is computed instead.
+"""
+import os
+import re
+import bisect
+import difflib
+import hashlib
+import logging
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from pdf_extraction import ExtractedDocument
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; without it only LSH candidates are scored
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Words per shingle, MinHash signature length and LSH bands (signature length must divide evenly). Pairs
+# become candidates from a Jaccard similarity of about (1 / bands) ** (bands / signature length): 0.125
+# for the default 64 bands of 2 rows
+ALIGN_SHINGLE_SIZE = int(os.getenv("ALIGN_SHINGLE_SIZE", "3"))
+ALIGN_MINHASH_PERMUTATIONS = int(os.getenv("ALIGN_MINHASH_PERMUTATIONS", "128"))
+ALIGN_LSH_BANDS = int(os.getenv("ALIGN_LSH_BANDS", "64"))
+# Jaccard similarity of shingles, and share of the shorter paragraph's shingles found in the longer
+# one (containment), both needed to pair an old paragraph with a new one
+ALIGN_MIN_SIMILARITY = float(os.getenv("ALIGN_MIN_SIMILARITY", "0.1"))
+ALIGN_MIN_CONTAINMENT = float(os.getenv("ALIGN_MIN_CONTAINMENT", "0.4"))
+# Smallest size of the shorter paragraph's shingle set, as a share of the longer one's, for a pair (so a
+# short footnote citing a rule is not paired with the paragraph that explains it)
+ALIGN_MIN_SIZE_RATIO = float(os.getenv("ALIGN_MIN_SIZE_RATIO", "0.25"))
+# The aligned view replaces the full texts only when it is at most this share of their size
+ALIGN_MAX_VIEW_RATIO = float(os.getenv("ALIGN_MAX_VIEW_RATIO", "0.9"))
+
+_MASK64 = (1 << 64) - 1
+_WORD = re.compile(r"\w+")
+_WHITESPACE = re.compile(r"\s+")
+_DIGITS = re.compile(r"\d+")
+_SENTENCE_END = (".", ";", "?", "!")
+_TERMINAL = _SENTENCE_END + (":",)
+# A line starting with superscript footnote reference numbers, a footnote at the foot of a page,
+# and a reference number printed right after a word or sentence ("terminally ill.19 The")
+_REFERENCE_LINE = re.compile(r"^\d{1,3}(?:,\d{1,3})*(?:\s+|$)")
+_FOOTNOTE_START = re.compile(r"^(\d{1,3})\s+\S")
+_INLINE_REFERENCE = re.compile(r"((?:[a-z]|[)”’\"])[.,;:]?)\d{1,3}(?:,\d{1,3})*(?=\s|$)")
+_LIST_ITEM = re.compile(r"^(\d{1,2}[).]|[a-zA-Z][).]|[ivxIVX]+[).]|[•▪●\-–])\s")
+_TITLE_WORD = re.compile(r"[A-Za-z][\w’'-]{3,}")
+
+
+def _permutations(count: int) -> List[Tuple[int, int]]:
+    """Fixed odd multipliers and offsets for the multiply-shift hash family."""
+    pairs = []
+    for index in range(count):
+        digest = hashlib.blake2b(f"minhash-{index}".encode(), digest_size=16).digest()
+        pairs.append((int.from_bytes(digest[:8], "little") | 1, int.from_bytes(digest[8:], "little")))
+    return pairs
+
+
+_PERMUTATIONS = _permutations(ALIGN_MINHASH_PERMUTATIONS)
+
+
+@dataclass
+class Paragraph:
+    """A paragraph of extracted text with the page/line where it starts and ends."""
+    page: int
+    line: int
+    end_page: int
+    end_line: int
+    text: str
+
+    @property
+    def anchor(self) -> str:
+        if self.page == self.end_page:
+            return f"p.{self.page} l.{self.line}" + (f"-{self.end_line}" if self.end_line != self.line else "")
+        return f"p.{self.page} l.{self.line} - p.{self.end_page} l.{self.end_line}"
+
+
+@dataclass
+class AlignedParagraph:
+    """
+    One entry of an alignment.
+
+    ``kind`` is "matched", "moved", "reworded", "added" or "removed"; a
+    reworded pair that is also out of order has ``moved`` set.
+    """
+    kind: str
+    old: Optional[Paragraph]
+    new: Optional[Paragraph]
+    similarity: float = 0.0
+    moved: bool = False
+
+
+def _normalized(line: str) -> str:
+    return _DIGITS.sub("#", _WHITESPACE.sub(" ", line).strip().lower())
+
+
+def _running_lines(document: ExtractedDocument) -> Set[str]:
+    """Normalized lines repeated on at least half the pages (running headers and footers)."""
+    if document.page_count < 2:
+        return set()
+    counts: Counter = Counter()
+    for page in range(1, document.page_count + 1):
+        counts.update({_normalized(line) for line in document.page_lines(page) if line.strip()})
+    threshold = max(2, document.page_count // 2)
+    return {line for line, count in counts.items() if count >= threshold}
+
+
+def _line_width(document: ExtractedDocument) -> int:
+    """Typical length of a full line of body text (90th percentile of non-blank lines)."""
+    lengths = sorted(len(line.strip()) for _, _, line in document.iter_lines() if line.strip())
+    return lengths[int(len(lengths) * 0.9)] if lengths else 0
+
+
+def _is_heading(text: str, width: int) -> bool:
+    """A line without closing punctuation that is short and capitalized or numbered, or a numbered title-case line."""
+    if text.endswith(_SENTENCE_END):
+        return False
+    if len(text) <= width * 0.6 and (not any(c.islower() for c in text) or _LIST_ITEM.match(text)):
+        return True
+    words = _TITLE_WORD.findall(text)
+    return bool(_LIST_ITEM.match(text) and words and all(word[0].isupper() for word in words))
+
+
+def _printed_lines(lines: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """
+    Rejoin extracted lines that are one printed line, and drop footnote reference numbers.
+
+    Extraction ends a line without trailing whitespace where a superscript
+    footnote reference (or a change of font inside a word) interrupts it; the
+    next extracted line then carries on the same printed line, starting with
+    the reference number or the rest of the word. Blank lines stay blank.
+    """
+    printed: List[Tuple[int, str]] = []
+    interrupted = False
+    for number, raw in lines:
+        if not raw.strip():
+            printed.append((number, ""))
+            interrupted = False
+            continue
+        reference = _REFERENCE_LINE.match(raw)
+        if interrupted and (reference or raw[0].islower() or raw[0].isspace()):
+            previous_number, previous = printed[-1]
+            if reference:
+                joined = f"{previous} {raw[reference.end():].strip()}"
+            elif raw[0].islower():
+                joined = previous + raw.strip()
+            else:
+                joined = f"{previous} {raw.strip()}"
+            printed[-1] = (previous_number, joined.strip())
+        else:
+            printed.append((number, _WHITESPACE.sub(" ", raw).strip()))
+        interrupted = not raw[-1].isspace()
+    return [(number, _INLINE_REFERENCE.sub(r"\1", _WHITESPACE.sub(" ", text))) for number, text in printed]
+
+
+def _page_lines(
+    document: ExtractedDocument, page: int, running: Set[str]
+) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]:
+    """
+    Printed body lines and footnote lines of a page, without running headers and footers.
+
+    Footnotes are the lines after the page's last blank line when the first
+    of them starts with a footnote number.
+    """
+    lines = [
+        (number, raw) for number, raw in enumerate(document.page_lines(page), start=1)
+        if not raw.strip() or _normalized(raw) not in running
+    ]
+    end = len(lines)
+    while end and not lines[end - 1][1].strip():
+        end -= 1
+    split = end
+    for index in range(end - 1, -1, -1):
+        if not lines[index][1].strip():
+            if _FOOTNOTE_START.match(lines[index + 1][1].strip()):
+                split = index
+            break
+    return _printed_lines(lines[:split]), _printed_lines(lines[split:end])
+
+
+def _footnotes(page: int, lines: List[Tuple[int, str]]) -> List[Paragraph]:
+    """Split a page's footnote lines into one paragraph per consecutively numbered footnote."""
+    footnotes: List[Paragraph] = []
+    expected = None
+    for number, text in lines:
+        if not text:
+            continue
+        start = _FOOTNOTE_START.match(text)
+        if start and (expected is None or int(start.group(1)) == expected) or not footnotes:
+            footnotes.append(Paragraph(page, number, page, number, text))
+            expected = int(start.group(1)) + 1 if start else None
+        else:
+            footnote = footnotes[-1]
+            footnotes[-1] = Paragraph(footnote.page, footnote.line, page, number, f"{footnote.text} {text}")
+    return footnotes
+
+
+def split_paragraphs(document: ExtractedDocument) -> List[Paragraph]:
+    """
+    Split a document into whitespace-normalized paragraphs.
+
+    Extracted text does not reliably keep blank lines between paragraphs,
+    so a paragraph also ends at a short printed line ending in terminal
+    punctuation, and list items and short headings start new ones. Running
+    headers and footers are skipped and footnotes are set aside (each
+    becomes its own paragraph after the paragraph they interrupted), so a
+    paragraph continues across a page break.
+    """
+    running = _running_lines(document)
+    width = _line_width(document)
+    paragraphs: List[Paragraph] = []
+    footnotes: List[Paragraph] = []
+    current: List[str] = []
+    start = end = (0, 0)
+
+    def close():
+        if current:
+            paragraphs.append(Paragraph(start[0], start[1], end[0], end[1], " ".join(current)))
+            current.clear()
+        paragraphs.extend(footnotes)
+        footnotes.clear()
+
+    for page in range(1, document.page_count + 1):
+        body, footnote_lines = _page_lines(document, page, running)
+        # Blank lines at the top and bottom of a page do not end a paragraph
+        text_lines = [index for index, (_, text) in enumerate(body) if text]
+        if text_lines:
+            body = body[text_lines[0]:text_lines[-1] + 1]
+        for line, text in body:
+            if not text:
+                close()
+                continue
+            heading = _is_heading(text, width)
+            if heading or _LIST_ITEM.match(text):
+                close()
+            if not current:
+                start = (page, line)
+            current.append(text)
+            end = (page, line)
+            if heading or (text.endswith(_TERMINAL) and len(text) < width * 0.85):
+                close()
+        footnotes.extend(_footnotes(page, footnote_lines))
+        if not current:
+            close()
+    close()
+    return paragraphs
+
+
+def _shingle_hashes(text: str) -> List[int]:
+    words = [word.lower() for word in _WORD.findall(text)]
+    size = ALIGN_SHINGLE_SIZE
+    shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))} if words else {text}
+    return [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") for s in shingles]
+
+
+def minhash_signatures(shingle_sets: List[List[int]]) -> List[Tuple[int, ...]]:
+    """MinHash signature of each shingle hash set (see ``_shingle_hashes``) under the fixed hash family."""
+    signatures = []
+    if np is not None:
+        multipliers = np.array([a for a, _ in _PERMUTATIONS], dtype=np.uint64)[:, None]
+        offsets = np.array([b for _, b in _PERMUTATIONS], dtype=np.uint64)[:, None]
+    for hashes in shingle_sets:
+        if np is not None:
+            # uint64 arithmetic wraps around exactly like the masked pure-Python version
+            values = np.array(hashes, dtype=np.uint64)[None, :]
+            signature = ((multipliers * values + offsets) >> np.uint64(32)).min(axis=1)
+            signatures.append(tuple(int(value) for value in signature))
+        else:
+            signatures.append(tuple(
+                min((((a * value + b) & _MASK64) >> 32) for value in hashes) for a, b in _PERMUTATIONS
+            ))
+    return signatures
+
+
+def _lsh_candidates(old_signatures: List[Tuple[int, ...]], new_signatures: List[Tuple[int, ...]]) -> Set[Tuple[int, int]]:
+    """Pairs that agree on every row of at least one LSH band."""
+    rows = max(1, ALIGN_MINHASH_PERMUTATIONS // ALIGN_LSH_BANDS)
+    candidates: Set[Tuple[int, int]] = set()
+    for band in range(0, ALIGN_MINHASH_PERMUTATIONS, rows):
+        buckets: Dict[Tuple[int, ...], List[int]] = defaultdict(list)
+        for index, signature in enumerate(old_signatures):
+            buckets[signature[band:band + rows]].append(index)
+        for new_index, signature in enumerate(new_signatures):
+            for old_index in buckets.get(signature[band:band + rows], ()):
+                candidates.add((old_index, new_index))
+    return candidates
+
+
+def similarity_pairs(
+    old_signatures: List[Tuple[int, ...]], new_signatures: List[Tuple[int, ...]]
+) -> Dict[Tuple[int, int], float]:
+    """
+    Estimated Jaccard similarity of every old/new paragraph pair at or above ALIGN_MIN_SIMILARITY.
+
+    With NumPy the full old x new signature-agreement matrix is computed
+    in row blocks; without it only LSH candidate pairs are scored.
+    """
+    if not old_signatures or not new_signatures:
+        return {}
+    if np is not None:
+        old_matrix = np.array(old_signatures, dtype=np.uint64)
+        new_matrix = np.array(new_signatures, dtype=np.uint64)
+        pairs: Dict[Tuple[int, int], float] = {}
+        block = max(1, 4_000_000 // (len(new_signatures) * ALIGN_MINHASH_PERMUTATIONS))
+        for first in range(0, len(old_signatures), block):
+            matrix = (old_matrix[first:first + block, None, :] == new_matrix[None, :, :]).mean(axis=2)
+            for old_index, new_index in zip(*np.nonzero(matrix >= ALIGN_MIN_SIMILARITY)):
+                pairs[(first + int(old_index), int(new_index))] = float(matrix[old_index, new_index])
+        return pairs
+
+    pairs = {}
+    for old_index, new_index in _lsh_candidates(old_signatures, new_signatures):
+        old_signature, new_signature = old_signatures[old_index], new_signatures[new_index]
+        similarity = sum(a == b for a, b in zip(old_signature, new_signature)) / ALIGN_MINHASH_PERMUTATIONS
+        if similarity >= ALIGN_MIN_SIMILARITY:
+            pairs[(old_index, new_index)] = similarity
+    return pairs
+
+
+def _in_order(matches: List[Tuple[int, int]]) -> Set[Tuple[int, int]]:
+    """The largest subset of (old, new) matches whose new indices increase with old indices (LIS)."""
+    ordered = sorted(matches)
+    tails: List[int] = []
+    tail_index: List[int] = []
+    previous: List[int] = [-1] * len(ordered)
+    for index, (_, new_index) in enumerate(ordered):
+        position = bisect.bisect_left(tails, new_index)
+        if position == len(tails):
+            tails.append(new_index)
+            tail_index.append(index)
+        else:
+            tails[position] = new_index
+            tail_index[position] = index
+        previous[index] = tail_index[position - 1] if position else -1
+    keep: Set[Tuple[int, int]] = set()
+    index = tail_index[-1] if tail_index else -1
+    while index != -1:
+        keep.add(ordered[index])
+        index = previous[index]
+    return keep
+
+
+def align_paragraphs(old_document: ExtractedDocument, new_document: ExtractedDocument) -> List[AlignedParagraph]:
+    """
+    Align the paragraphs of two documents.
+
+    Candidate pairs need an exact Jaccard similarity of ALIGN_MIN_SIMILARITY
+    and ALIGN_MIN_CONTAINMENT, so a paragraph that was expanded or cut down
+    in the new version still finds its counterpart, but not one under
+    ALIGN_MIN_SIZE_RATIO of its size. They are matched greedily
+    from the most similar down, one-to-one. A pair is matched or moved only
+    if its text is identical (so no edit is ever hidden from the model), and
+    reworded otherwise; pairs outside the longest in-order run of matches are
+    moved. Entries are returned in new-document order, each removed paragraph
+    placed after the entry of the old paragraph before it.
+    """
+    old_paragraphs = split_paragraphs(old_document)
+    new_paragraphs = split_paragraphs(new_document)
+    old_shingles = [_shingle_hashes(paragraph.text) for paragraph in old_paragraphs]
+    new_shingles = [_shingle_hashes(paragraph.text) for paragraph in new_paragraphs]
+    candidates = similarity_pairs(minhash_signatures(old_shingles), minhash_signatures(new_shingles))
+
+    # MinHash only proposes candidates; their exact similarity decides the pairing
+    old_sets, new_sets = [set(hashes) for hashes in old_shingles], [set(hashes) for hashes in new_shingles]
+    pairs: Dict[Tuple[int, int], float] = {}
+    for old_index, new_index in candidates:
+        old_set, new_set = old_sets[old_index], new_sets[new_index]
+        shared = len(old_set & new_set)
+        smaller, larger = sorted((len(old_set), len(new_set)))
+        if smaller < larger * ALIGN_MIN_SIZE_RATIO or shared < smaller * ALIGN_MIN_CONTAINMENT:
+            continue
+        similarity = shared / (smaller + larger - shared)
+        if similarity >= ALIGN_MIN_SIMILARITY:
+            pairs[(old_index, new_index)] = similarity
+
+    matched_old: Dict[int, Tuple[int, float]] = {}
+    matched_new: Set[int] = set()
+    for (old_index, new_index), similarity in sorted(pairs.items(), key=lambda item: (-item[1], item[0])):
+        if old_index not in matched_old and new_index not in matched_new:
+            matched_old[old_index] = (new_index, similarity)
+            matched_new.add(new_index)
+    in_order = _in_order([(old_index, new_index) for old_index, (new_index, _) in matched_old.items()])
+
+    new_entries: List[AlignedParagraph] = [AlignedParagraph("added", None, paragraph) for paragraph in new_paragraphs]
+    for old_index, (new_index, similarity) in matched_old.items():
+        moved = (old_index, new_index) not in in_order
+        if old_paragraphs[old_index].text == new_paragraphs[new_index].text:
+            kind = "moved" if moved else "matched"
+        else:
+            kind = "reworded"
+        new_entries[new_index] = AlignedParagraph(
+            kind, old_paragraphs[old_index], new_paragraphs[new_index], round(similarity, 3), moved
+        )
+
+    # Removed paragraphs follow the entry of the nearest earlier matched old paragraph
+    removed_after: Dict[int, List[AlignedParagraph]] = defaultdict(list)
+    anchor = -1
+    for old_index, paragraph in enumerate(old_paragraphs):
+        if old_index in matched_old:
+            anchor = matched_old[old_index][0]
+        else:
+            removed_after[anchor].append(AlignedParagraph("removed", paragraph, None))
+
+    alignment = list(removed_after.get(-1, []))
+    for new_index, entry in enumerate(new_entries):
+        alignment.append(entry)
+        alignment.extend(removed_after.get(new_index, []))
+
+    counts = Counter(entry.kind for entry in alignment)
+    logger.info(
+        f"Paragraph alignment: {len(old_paragraphs)} old / {len(new_paragraphs)} new paragraphs, "
+        f"{len(candidates)} candidate pairs, "
+        + ", ".join(f"{counts[kind]} {kind}" for kind in ("matched", "moved", "reworded", "added", "removed"))
+    )
+    return alignment
+
+
+def _preview(text: str, words: int = 25) -> str:
+    parts = text.split()
+    return " ".join(parts[:words]) + (" …" if len(parts) > words else "")
+
+
+def _word_diff(old: str, new: str) -> str:
+    """The new text with old-only words marked [-like this-] and new-only words {+like this+}."""
+    old_words, new_words = old.split(), new.split()
+    parts = []
+    matcher = difflib.SequenceMatcher(None, old_words, new_words, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            parts.append(" ".join(new_words[new_start:new_end]))
+            continue
+        if old_end > old_start:
+            parts.append(f"[-{' '.join(old_words[old_start:old_end])}-]")
+        if new_end > new_start:
+            parts.append(f"{{+{' '.join(new_words[new_start:new_end])}+}}")
+    return " ".join(parts)
+
+
+def render_alignment(alignment: List[AlignedParagraph], old_key: str, new_key: str) -> str:
+    """
+    Render an alignment as a compact, anchored text view for the model.
+
+    Matched paragraphs are left out and moved ones are shown by a short
+    preview, since their text did not change. A reworded paragraph is shown as
+    one word diff ("~", old-only words in [-...-] and new-only words in
+    {+...+}), or as both versions ("-" old, "+" new) when that is shorter.
+    Consecutive added or removed paragraphs share one block, each line giving
+    a paragraph's anchor and full text.
+    """
+    blocks = []
+    run_kind = None
+    for entry in alignment:
+        if entry.kind in ("added", "removed"):
+            key, paragraph = (new_key, entry.new) if entry.kind == "added" else (old_key, entry.old)
+            if entry.kind != run_kind:
+                blocks.append(f"[{entry.kind.capitalize()}] {key}")
+                run_kind = entry.kind
+            blocks[-1] += f"\n{paragraph.anchor}: {paragraph.text}"
+            continue
+        run_kind = None
+        if entry.kind == "moved":
+            blocks.append(
+                f"[Moved, text unchanged] {old_key} {entry.old.anchor} -> {new_key} {entry.new.anchor}: "
+                f"{_preview(entry.new.text)}"
+            )
+        elif entry.kind == "reworded":
+            label = "Reworded and moved" if entry.moved else "Reworded"
+            both = f"- {entry.old.text}\n+ {entry.new.text}"
+            inline = f"~ {_word_diff(entry.old.text, entry.new.text)}"
+            blocks.append(
+                f"[{label}] {old_key} {entry.old.anchor} -> {new_key} {entry.new.anchor}\n"
+                f"{inline if len(inline) < len(both) else both}"
+            )
+    if not blocks:
+        return "(Every paragraph of the old APL appears unchanged, in the same order, in the new APL.)"
+    return "\n\n".join(blocks)
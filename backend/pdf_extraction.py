@@ -0,0 +1,136 @@
+"""Page/line-indexed PDF text extraction with a process pool for large documents."""
+import io
+import os
+import bisect
+import logging
+import multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Tuple
+
+import pypdf
+
+logger = logging.getLogger(__name__)
+
+# Documents with at least this many pages are split across worker processes
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "12"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+class ExtractedDocument:
+    """
+    Extracted text of a PDF, kept page by page with an index of its lines.
+
+    Pages and lines are numbered from 1, matching the citations the model is
+    asked to produce. ``line_offsets[p]`` holds the character offset of every
+    line start within page ``p``; ``page_line_starts`` maps each page to the
+    global index of its first line so a global line number can be resolved
+    to a (page, line) pair with a binary search.
+    """
+
+    def __init__(self, pages: List[str]):
+        self.pages = pages
+        self.line_offsets: List[array] = []
+        self.page_line_starts = array("I")
+        total_lines = 0
+        for page_text in pages:
+            offsets = array("I", [0])
+            position = page_text.find("\n")
+            while position != -1:
+                offsets.append(position + 1)
+                position = page_text.find("\n", position + 1)
+            self.line_offsets.append(offsets)
+            self.page_line_starts.append(total_lines)
+            total_lines += len(offsets)
+        self.line_count = total_lines
+
+    @property
+    def page_count(self) -> int:
+        return len(self.pages)
+
+    @property
+    def text(self) -> str:
+        """Full document text, one page after another."""
+        return "".join(page_text + "\n" for page_text in self.pages)
+
+    def page_lines(self, page: int) -> List[str]:
+        """Return the lines of a 1-based page."""
+        return self.pages[page - 1].split("\n")
+
+    def get_line(self, page: int, line: int) -> str:
+        """Return a single line by 1-based page and line number."""
+        page_text = self.pages[page - 1]
+        offsets = self.line_offsets[page - 1]
+        start = offsets[line - 1]
+        end = offsets[line] - 1 if line < len(offsets) else len(page_text)
+        return page_text[start:end]
+
+    def locate(self, global_line: int) -> Tuple[int, int]:
+        """Map a 0-based global line index to a 1-based (page, line) pair."""
+        page_index = bisect.bisect_right(self.page_line_starts, global_line) - 1
+        return page_index + 1, global_line - self.page_line_starts[page_index] + 1
+
+    def iter_lines(self) -> Iterator[Tuple[int, int, str]]:
+        """Yield (page, line, text) for every line in reading order."""
+        for page_index, page_text in enumerate(self.pages):
+            for line_index, line_text in enumerate(page_text.split("\n")):
+                yield page_index + 1, line_index + 1, line_text
+
+    def to_dict(self) -> dict:
+        return {"pages": self.pages}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ExtractedDocument":
+        return cls(data["pages"])
+
+
+def _extract_page_range(pdf_bytes: bytes, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end) (runs inside a worker process)."""
+    reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+    return [reader.pages[i].extract_text() for i in range(start, end)]
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def shutdown_executor():
+    """Stop the extraction worker processes."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def extract_document(pdf_bytes: bytes) -> ExtractedDocument:
+    """Extract a PDF into an ExtractedDocument, fanning large files out over worker processes."""
+    reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+    page_total = len(reader.pages)
+
+    if page_total < PARALLEL_MIN_PAGES or PDF_WORKERS < 2:
+        return ExtractedDocument([page.extract_text() for page in reader.pages])
+
+    chunk_size = -(-page_total // PDF_WORKERS)
+    ranges = [(start, min(start + chunk_size, page_total)) for start in range(0, page_total, chunk_size)]
+    try:
+        executor = _get_executor()
+        futures = [executor.submit(_extract_page_range, pdf_bytes, start, end) for start, end in ranges]
+        pages: List[str] = []
+        for future in futures:
+            pages.extend(future.result())
+    except BrokenProcessPool as e:
+        logger.warning(f"PDF worker pool failed, extracting serially: {str(e)}")
+        shutdown_executor()
+        return ExtractedDocument([page.extract_text() for page in reader.pages])
+
+    logger.info(f"Extracted {page_total} pages across {len(ranges)} worker processes")
+    return ExtractedDocument(pages)
@@ -0,0 +1,71 @@
+"""Pre-encoded response bodies: content-hash ETags and gzip/brotli content negotiation."""
+import os
+import gzip
+import hashlib
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Responses smaller than this many bytes are sent uncompressed
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1000"))
+
+# Encodings stored for each pre-encoded body, most preferred first
+ENCODINGS: Tuple[str, ...] = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def encode_body(body: bytes) -> Tuple[str, Dict[str, bytes]]:
+    """
+    Return a body's ETag and its compressed forms, one per supported encoding.
+
+    Compression runs once at the highest level, since the result is served
+    many times.
+    """
+    encoded = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded["br"] = brotli.compress(body, quality=11)
+    return make_etag(body), encoded
+
+
+def decode_body(encoding: str, data: bytes) -> bytes:
+    """Recover the identity body from one of its stored encodings."""
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "br" and brotli is not None:
+        return brotli.decompress(data)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def preferred_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best stored encoding the client accepts, or None for an uncompressed body."""
+    accepted: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches ``etag`` (weak comparison, as for GET)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    return etag in {tag[2:] if tag.startswith("W/") else tag for tag in tags}
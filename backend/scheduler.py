@@ -0,0 +1,194 @@
+"""Admission scheduler for model calls: per-model rate limits, priorities and Retry-After pauses."""
+import os
+import json
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import llm_queue_wait, llm_queued
+
+logger = logging.getLogger(__name__)
+
+# Requests and tokens per minute allowed for each model; override per model with a JSON object in
+# LLM_RATE_LIMITS, e.g. {"gpt-4.1": [500, 30000]}. Limits apply per server process.
+LLM_DEFAULT_RPM = int(os.getenv("LLM_DEFAULT_RPM", "500"))
+LLM_DEFAULT_TPM = int(os.getenv("LLM_DEFAULT_TPM", "450000"))
+LLM_RATE_LIMITS: Dict[str, Tuple[int, int]] = {
+    model: tuple(limits) for model, limits in json.loads(os.getenv("LLM_RATE_LIMITS", "{}")).items()
+}
+# Completion tokens reserved per request until the API reports actual usage
+LLM_COMPLETION_TOKEN_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKEN_ESTIMATE", "2000"))
+
+QUICK_PRIORITY = 0
+FULL_PRIORITY = 1
+
+# How often a queued request re-checks the queue when it is not at the head
+_POLL_INTERVAL = 1.0
+
+
+@dataclass(frozen=True)
+class RequestPriority:
+    """Queue order of a task's model calls: quick mode before full runs, then shorter documents first."""
+    tier: int = FULL_PRIORITY
+    size: int = 0
+    task_id: Optional[str] = None
+
+
+# Priority of the task whose code is running; copied into tasks created by asyncio.gather
+current_priority: ContextVar[RequestPriority] = ContextVar("current_priority", default=RequestPriority())
+
+
+class TokenBucket:
+    """A bucket holding up to one minute's allowance, refilled continuously."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` can be taken (requests larger than the bucket wait for a full bucket)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Charge (positive) or refund (negative) tokens once actual usage is known."""
+        self.level = min(self.capacity, self.level - amount)
+
+
+@dataclass(order=True)
+class _Waiter:
+    key: Tuple[int, int, int]
+    tokens: int = field(compare=False)
+    task_id: Optional[str] = field(compare=False)
+
+
+class _ModelLimiter:
+    def __init__(self, model: str):
+        rpm, tpm = LLM_RATE_LIMITS.get(model, (LLM_DEFAULT_RPM, LLM_DEFAULT_TPM))
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.waiters: List[_Waiter] = []
+        self.changed = asyncio.Condition()
+
+
+class AdmissionScheduler:
+    """
+    Admit model calls in priority order within each model's rate limits.
+
+    Every call estimates its token cost up front and waits in a per-model
+    priority queue until both the request and token buckets can cover it.
+    Only the head of the queue is admitted, so a large full-mode request
+    cannot be overtaken indefinitely but quick-mode and short-document work
+    goes first. A 429 pauses the whole model for its Retry-After period.
+    """
+
+    def __init__(self):
+        self._limiters: Dict[str, _ModelLimiter] = {}
+        self._sequence = itertools.count()
+
+    def _limiter(self, model: str) -> _ModelLimiter:
+        if model not in self._limiters:
+            self._limiters[model] = _ModelLimiter(model)
+        return self._limiters[model]
+
+    async def acquire(self, model: str, tokens: int):
+        """Wait until a call of an estimated ``tokens`` may be sent to ``model``."""
+        limiter = self._limiter(model)
+        priority = current_priority.get()
+        waiter = _Waiter((priority.tier, priority.size, next(self._sequence)), tokens, priority.task_id)
+        heapq.heappush(limiter.waiters, waiter)
+        llm_queued.inc(model=model)
+        queued_at = time.monotonic()
+        admitted = False
+        try:
+            async with limiter.changed:
+                while True:
+                    now = time.monotonic()
+                    delay = _POLL_INTERVAL
+                    if limiter.waiters[0] is waiter:
+                        delay = max(
+                            limiter.paused_until - now,
+                            limiter.requests.wait_time(1, now),
+                            limiter.tokens.wait_time(tokens, now),
+                        )
+                        if delay <= 0:
+                            heapq.heappop(limiter.waiters)
+                            limiter.requests.take(1, now)
+                            limiter.tokens.take(tokens, now)
+                            admitted = True
+                            limiter.changed.notify_all()
+                            break
+                    try:
+                        await asyncio.wait_for(limiter.changed.wait(), min(delay, _POLL_INTERVAL))
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            llm_queued.dec(model=model)
+            if admitted:
+                llm_queue_wait.observe(time.monotonic() - queued_at, model=model)
+            elif waiter in limiter.waiters:
+                limiter.waiters.remove(waiter)
+                heapq.heapify(limiter.waiters)
+
+    def settle(self, model: str, reserved_tokens: int, actual_tokens: int):
+        """Correct the token bucket once the API reports what a call actually used."""
+        self._limiter(model).tokens.adjust(actual_tokens - reserved_tokens)
+
+    def pause(self, model: str, seconds: float):
+        """Hold every queued call to ``model`` for ``seconds`` (a Retry-After from the API)."""
+        limiter = self._limiter(model)
+        limiter.paused_until = max(limiter.paused_until, time.monotonic() + seconds)
+        logger.warning(f"Rate limited by the API for model {model}; pausing requests for {seconds:.1f}s")
+
+    def queue_position(self, task_id: str) -> Optional[int]:
+        """1-based position of a task's earliest queued call in its model's queue, or None if none is queued."""
+        positions = [
+            sorted(limiter.waiters).index(waiter) + 1
+            for limiter in self._limiters.values()
+            for waiter in limiter.waiters
+            if waiter.task_id == task_id
+        ]
+        return min(positions) if positions else None
+
+
+def retry_after_seconds(headers: Any) -> Optional[float]:
+    """Read the wait an API response asks for from its retry-after-ms or retry-after header."""
+    if headers is None:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+scheduler = AdmissionScheduler()
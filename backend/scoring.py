@@ -0,0 +1,133 @@
+"""Local helpers for the scoring stage: batching, merge-candidate detection and ordering."""
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Bullets scored per model call, and scoring/merge calls in flight at once
+SCORING_BATCH_SIZE = int(os.getenv("SCORING_BATCH_SIZE", "5"))
+SCORING_MAX_CONCURRENCY = int(os.getenv("SCORING_MAX_CONCURRENCY", "6"))
+# Word overlap (Jaccard) at which two bullets are sent for a merge decision; bullets citing
+# the same spot (same APL and page, lines within MERGE_LINE_WINDOW) need only half of it
+MERGE_SIMILARITY_THRESHOLD = float(os.getenv("MERGE_SIMILARITY_THRESHOLD", "0.5"))
+MERGE_LINE_WINDOW = int(os.getenv("MERGE_LINE_WINDOW", "3"))
+# Most bullets sent for one merge decision
+MERGE_MAX_GROUP_SIZE = int(os.getenv("MERGE_MAX_GROUP_SIZE", "4"))
+
+_WORD = re.compile(r"[a-z0-9]{3,}")
+
+
+def _words(bullet: dict) -> set:
+    text = f"{bullet.get('bullet_title', '')} {bullet.get('bullet_content', '')}"
+    return set(_WORD.findall(text.lower()))
+
+
+def _citation_spots(bullet: dict) -> List[Tuple[str, int, int]]:
+    spots = []
+    for key, citation in (bullet.get("citations") or {}).items():
+        if isinstance(citation, dict) and citation.get("page") and citation.get("line"):
+            try:
+                spots.append((key, int(citation["page"]), int(citation["line"])))
+            except (TypeError, ValueError):
+                continue
+    return spots
+
+
+def _share_citation(a: List[Tuple[str, int, int]], b: List[Tuple[str, int, int]]) -> bool:
+    return any(
+        key_a == key_b and page_a == page_b and abs(line_a - line_b) <= MERGE_LINE_WINDOW
+        for key_a, page_a, line_a in a
+        for key_b, page_b, line_b in b
+    )
+
+
+def find_merge_candidates(bullets: List[dict]) -> List[List[int]]:
+    """
+    Group bullets that likely describe the same change.
+
+    Two bullets are linked when their title/content word sets overlap by at
+    least MERGE_SIMILARITY_THRESHOLD, or by half of that when they also cite
+    the same spot of the same APL. Every bullet in a group is linked to every
+    other one (a chain of loosely similar bullets is not one change), and a
+    group holds at most MERGE_MAX_GROUP_SIZE bullets. Groups are built
+    greedily in document order; only groups of two or more are returned, as
+    lists of bullet indexes.
+    """
+    words = [_words(bullet) for bullet in bullets]
+    spots = [_citation_spots(bullet) for bullet in bullets]
+
+    def linked(i: int, j: int) -> bool:
+        union = words[i] | words[j]
+        if not union:
+            return False
+        threshold = MERGE_SIMILARITY_THRESHOLD
+        if _share_citation(spots[i], spots[j]):
+            threshold /= 2
+        return len(words[i] & words[j]) / len(union) >= threshold
+
+    links = [set() for _ in bullets]
+    for i in range(len(bullets)):
+        for j in range(i + 1, len(bullets)):
+            if linked(i, j):
+                links[i].add(j)
+                links[j].add(i)
+
+    grouped = set()
+    groups = []
+    for i in range(len(bullets)):
+        if i in grouped:
+            continue
+        group = [i]
+        for j in sorted(links[i] - grouped):
+            if len(group) >= MERGE_MAX_GROUP_SIZE:
+                break
+            if j > i and all(j in links[member] for member in group[1:]):
+                group.append(j)
+        if len(group) > 1:
+            grouped.update(group)
+            groups.append(group)
+    return groups
+
+
+def earliest_citations(bullets: List[dict]) -> Dict[str, Optional[dict]]:
+    """
+    Combine the citations of merged bullets, keeping the earliest citation per APL.
+
+    Citations without a page or line rank after those that have one.
+    """
+    merged: Dict[str, Optional[dict]] = {}
+    for bullet in bullets:
+        for key, citation in (bullet.get("citations") or {}).items():
+            current = merged.get(key)
+            if not isinstance(citation, dict):
+                merged.setdefault(key, None)
+            elif current is None or _position(citation) < _position(current):
+                merged[key] = citation
+    return merged
+
+
+def _position(citation: dict) -> Tuple[bool, int, bool, int]:
+    """Sort key of a citation's page and line, with unknown values last."""
+    position = []
+    for field in ("page", "line"):
+        try:
+            value = int(citation.get(field))
+        except (TypeError, ValueError):
+            position.extend((True, 0))
+        else:
+            position.extend((False, value))
+    return tuple(position)
+
+
+def batches(items: list, size: int = SCORING_BATCH_SIZE) -> List[list]:
+    """Split a list into consecutive batches of at most ``size`` items."""
+    return [items[start:start + size] for start in range(0, len(items), max(size, 1))]
+
+
+def sort_by_score(bullets: List[dict]) -> List[dict]:
+    """Order bullets by score, highest first, keeping document order among equal scores."""
+    def score(bullet: dict) -> float:
+        try:
+            return float(bullet.get("score") or 0)
+        except (TypeError, ValueError):
+            return 0.0
+    return sorted(bullets, key=score, reverse=True)
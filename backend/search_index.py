@@ -0,0 +1,211 @@
+"""Local full-text search over processed APL text and scored diff bullets (SQLite FTS5)."""
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from extraction_cache import CACHE_DIR
+from pdf_extraction import ExtractedDocument
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", os.path.join(CACHE_DIR, "search.sqlite"))
+# Lines of APL text per indexed passage
+SEARCH_PASSAGE_LINES = int(os.getenv("SEARCH_PASSAGE_LINES", "5"))
+
+_PHRASE = re.compile(r'"([^"]+)"')
+_WORD = re.compile(r"\w+\*?")
+_STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from has have how in is it its of on or that the this to "
+    "was were what when where which who why will with".split()
+)
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query.
+
+    Quoted phrases are kept as phrases, other words become OR'd terms
+    (common stopwords dropped) so results rank by how many terms match; a
+    trailing ``*`` makes a prefix search. Returns None if nothing searchable
+    remains.
+    """
+    terms = [f'"{phrase.strip()}"' for phrase in _PHRASE.findall(query) if phrase.strip()]
+    for word in _WORD.findall(_PHRASE.sub(" ", query)):
+        prefix = word.endswith("*")
+        word = word.rstrip("*").lower()
+        if word and word not in _STOPWORDS:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return " OR ".join(terms) if terms else None
+
+
+def _best_line(lines: List[str], query: str) -> int:
+    """Index of the passage line sharing the most words with the query."""
+    words = {word.rstrip("*").lower() for word in _WORD.findall(query)} - _STOPWORDS
+    scores = [len(words & {word.lower() for word in _WORD.findall(line)}) for line in lines]
+    return max(range(len(lines)), key=lambda index: (scores[index], -index)) if lines else 0
+
+
+class SearchIndex:
+    """
+    Inverted index of APL text passages (with page/line anchors) and diff bullets.
+
+    Documents are indexed once per content hash; a comparison's bullets are
+    replaced whenever that comparison completes again. Queries are ranked
+    with BM25, bullet titles weighing double.
+    """
+
+    def __init__(self, path: str = SEARCH_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "sha256 TEXT PRIMARY KEY, apl_number TEXT NOT NULL, filename TEXT, page_count INTEGER, indexed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5("
+                "text, sha256 UNINDEXED, apl_number UNINDEXED, page UNINDEXED, line UNINDEXED, "
+                "tokenize='porter unicode61')"
+            )
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS bullets USING fts5("
+                "bullet_title, bullet_content, revision_type UNINDEXED, score UNINDEXED, old_number UNINDEXED, "
+                "new_number UNINDEXED, citations UNINDEXED, comparison UNINDEXED, tokenize='porter unicode61')"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def index_document(self, sha256: str, apl_number: str, filename: str, document: ExtractedDocument) -> bool:
+        """Index a document's text in passages of SEARCH_PASSAGE_LINES lines; False if it was already indexed."""
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM documents WHERE sha256 = ?", (sha256,)).fetchone():
+                return False
+            rows = []
+            for page in range(1, document.page_count + 1):
+                lines = document.page_lines(page)
+                for start in range(0, len(lines), SEARCH_PASSAGE_LINES):
+                    text = "\n".join(lines[start:start + SEARCH_PASSAGE_LINES])
+                    if text.strip():
+                        rows.append((text, sha256, apl_number, page, start + 1))
+            conn.executemany(
+                "INSERT INTO passages (text, sha256, apl_number, page, line) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            conn.execute(
+                "INSERT INTO documents (sha256, apl_number, filename, page_count, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                (sha256, apl_number, filename, document.page_count, time.time()),
+            )
+        logger.info(f"Indexed APL {apl_number} for search ({len(rows)} passages)")
+        return True
+
+    def index_comparison(self, old_sha256: str, new_sha256: str, old_number: str, new_number: str, diff_json: str):
+        """Replace the indexed bullets of one comparison with those of ``diff_json``."""
+        comparison = f"{old_sha256}:{new_sha256}"
+        bullets = [bullet for bullet in json.loads(diff_json).get("bullets", []) if isinstance(bullet, dict)]
+        with self._connect() as conn:
+            conn.execute("DELETE FROM bullets WHERE comparison = ?", (comparison,))
+            conn.executemany(
+                "INSERT INTO bullets (bullet_title, bullet_content, revision_type, score, old_number, new_number, "
+                "citations, comparison) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (str(bullet.get("bullet_title", "")), str(bullet.get("bullet_content", "")),
+                     str(bullet.get("revision_type", "")).lower(), bullet.get("score"), old_number, new_number,
+                     json.dumps(bullet.get("citations") or {}), comparison)
+                    for bullet in bullets
+                ],
+            )
+
+    def search_text(self, query: str, apl_number: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        match = build_match_query(query)
+        if match is None:
+            return []
+        sql = (
+            "SELECT passages.text, snippet(passages, 0, '**', '**', '…', 16), passages.apl_number, "
+            "documents.filename, passages.page, passages.line, bm25(passages) AS rank "
+            "FROM passages JOIN documents ON documents.sha256 = passages.sha256 WHERE passages MATCH ?"
+        )
+        params: List[Any] = [match]
+        if apl_number:
+            sql += " AND passages.apl_number = ?"
+            params.append(apl_number)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+
+        hits = []
+        for text, snippet, number, filename, page, line, rank in rows:
+            lines = text.split("\n")
+            best = _best_line(lines, query)
+            hits.append({
+                "apl_number": number,
+                "filename": filename,
+                "citation": {"page": page, "line": line + best, "text": lines[best].strip()},
+                "snippet": snippet,
+                "rank": round(-rank, 4),
+            })
+        return hits
+
+    def search_bullets(
+        self,
+        query: str,
+        apl_number: Optional[str] = None,
+        revision_type: Optional[str] = None,
+        min_score: Optional[int] = None,
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        match = build_match_query(query)
+        if match is None:
+            return []
+        sql = (
+            "SELECT bullet_title, bullet_content, revision_type, score, old_number, new_number, citations, "
+            "bm25(bullets, 2.0, 1.0) AS rank FROM bullets WHERE bullets MATCH ?"
+        )
+        params: List[Any] = [match]
+        if apl_number:
+            sql += " AND (old_number = ? OR new_number = ?)"
+            params.extend((apl_number, apl_number))
+        if revision_type:
+            sql += " AND revision_type = ?"
+            params.append(revision_type.lower())
+        if min_score is not None:
+            sql += " AND score >= ?"
+            params.append(min_score)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [
+            {
+                "old_apl": old_number,
+                "new_apl": new_number,
+                "bullet_title": title,
+                "bullet_content": content,
+                "revision_type": revision,
+                "score": score,
+                "citations": json.loads(citations),
+                "rank": round(-rank, 4),
+            }
+            for title, content, revision, score, old_number, new_number, citations, rank in rows
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            documents = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            comparisons = conn.execute("SELECT COUNT(DISTINCT comparison) FROM bullets").fetchone()[0]
+        return {"documents": documents, "comparisons": comparisons}
+
+
+search_index = SearchIndex()
@@ -0,0 +1,175 @@
+"""Split APLs into headed sections, align them across versions and merge per-section diffs."""
+import os
+import re
+import difflib
+import hashlib
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from pdf_extraction import ExtractedDocument
+from diff_schema import REVISION_TYPES
+
+# Section pairs analyzed concurrently in chunked mode
+SECTION_MAX_CONCURRENCY = int(os.getenv("SECTION_MAX_CONCURRENCY", "6"))
+# Lowest heading similarity at which an old and a new section are treated as the same section
+SECTION_MATCH_THRESHOLD = float(os.getenv("SECTION_MATCH_THRESHOLD", "0.6"))
+
+# "POLICY:", "BACKGROUND:" ... and numbered subsections such as "IV. Transition to Hospice Services"
+_TOP_HEADING = re.compile(r"^[A-Z][A-Z ,&/-]{2,}:$")
+_NUMBERED_HEADING = re.compile(r"^(?=[IVX])(X{0,3}(?:IX|IV|V?I{0,3}))\.\s+([A-Z].{2,})$")
+_NON_LETTERS = re.compile(r"[^a-z]+")
+
+
+@dataclass
+class Section:
+    """A headed block of an APL with the page/line where its heading starts."""
+    title: str
+    key: str
+    page: int
+    line: int
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+
+def _heading_key(title: str) -> str:
+    match = _NUMBERED_HEADING.match(title)
+    if match:
+        title = match.group(2)
+    return _NON_LETTERS.sub(" ", title.lower()).strip()
+
+
+def split_sections(document: ExtractedDocument) -> List[Section]:
+    """
+    Split a document at its top-level and roman-numbered headings.
+
+    A heading with no text of its own ("POLICY:" right before "I. General")
+    is merged into the section that follows it, which keeps its title but
+    starts at the first heading.
+    """
+    sections = [Section("Header", "header", 1, 1)]
+    for page, line, raw_text in document.iter_lines():
+        text = raw_text.strip()
+        if len(text) < 80 and (_TOP_HEADING.match(text) or _NUMBERED_HEADING.match(text)):
+            sections.append(Section(text, _heading_key(text), page, line))
+        sections[-1].lines.append(raw_text)
+
+    merged: List[Section] = []
+    pending: Optional[Section] = None
+    for section in sections:
+        if not any(l.strip() for l in section.lines):
+            continue
+        if pending is not None:
+            section = Section(section.title, section.key, pending.page, pending.line, pending.lines + section.lines)
+            pending = None
+        if section is not sections[0] and sum(1 for l in section.lines if l.strip()) == 1:
+            pending = section
+            continue
+        merged.append(section)
+    if pending is not None:
+        merged.append(pending)
+    return merged
+
+
+def section_hash(section: Optional[Section]) -> str:
+    """Hash of a section's words (empty for a missing section), equal for sections that ``sections_differ`` treats as the same."""
+    if section is None:
+        return ""
+    return hashlib.sha256(" ".join(section.text.split()).encode("utf-8")).hexdigest()
+
+
+def section_texts(pairs: List[Tuple[Optional[Section], Optional[Section]]]) -> Tuple[str, str]:
+    """Old and new text of some section pairs, each section introduced with the page and line where it starts."""
+    old_parts, new_parts = [], []
+    for old_section, new_section in pairs:
+        if old_section is not None:
+            old_parts.append(f"(Section starting at page {old_section.page}, line {old_section.line})\n{old_section.text}")
+        if new_section is not None:
+            new_parts.append(f"(Section starting at page {new_section.page}, line {new_section.line})\n{new_section.text}")
+    return "\n\n".join(old_parts), "\n\n".join(new_parts)
+
+
+def _similarity(a: str, b: str) -> float:
+    if a == b or (a and b and (a.startswith(b) or b.startswith(a))):
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+def align_sections(
+    old_sections: List[Section], new_sections: List[Section]
+) -> List[Tuple[Optional[Section], Optional[Section]]]:
+    """
+    Pair old and new sections by heading.
+
+    Each new section is matched to the most similar unmatched old heading
+    above SECTION_MATCH_THRESHOLD. Unmatched new sections are paired with
+    None (entirely added) and unmatched old sections are placed after the
+    new section that follows their predecessor (entirely removed).
+    """
+    matched_old = set()
+    pairs: List[Tuple[Optional[Section], Optional[Section]]] = []
+    for new_section in new_sections:
+        best_index, best_score = None, SECTION_MATCH_THRESHOLD
+        for index, old_section in enumerate(old_sections):
+            if index in matched_old:
+                continue
+            score = _similarity(old_section.key, new_section.key)
+            if score >= best_score:
+                best_index, best_score = index, score
+                if score == 1.0:
+                    break
+        if best_index is None:
+            pairs.append((None, new_section))
+        else:
+            matched_old.add(best_index)
+            pairs.append((old_sections[best_index], new_section))
+
+    for index, old_section in enumerate(old_sections):
+        if index in matched_old:
+            continue
+        # Insert after the pair holding the closest preceding matched old section
+        position = len(pairs)
+        for pair_index, (paired_old, _) in enumerate(pairs):
+            if paired_old is not None and old_sections.index(paired_old) < index:
+                position = pair_index + 1
+        pairs.insert(position, (old_section, None))
+    return pairs
+
+
+def sections_differ(old_section: Optional[Section], new_section: Optional[Section]) -> bool:
+    """Whether a section pair has any non-whitespace difference worth sending to the model."""
+    if old_section is None or new_section is None:
+        return True
+    return old_section.text.split() != new_section.text.split()
+
+
+def merge_section_diffs(section_results: List[dict], old_apl_info: dict, new_apl_info: dict) -> dict:
+    """
+    Combine per-section diff results into the title/summary/bullets/conclusion schema.
+
+    ``section_results`` hold each section's "bullets" and one-sentence
+    "impact", in document order, as repaired by
+    ``diff_schema.repair_section_diff``.
+    """
+    bullets = [bullet for result in section_results for bullet in result["bullets"]]
+    counts = {revision_type: 0 for revision_type in REVISION_TYPES}
+    for bullet in bullets:
+        counts[bullet["revision_type"]] += 1
+
+    old_year, new_year = old_apl_info['year'], new_apl_info['year']
+    summary = (
+        f"APL {new_apl_info['apl_number']} ({new_year}) compared with APL {old_apl_info['apl_number']} ({old_year}), "
+        f"section by section: {counts['addition']} additions, {counts['update']} updates and "
+        f"{counts['redaction']} redactions. The changes are grouped into **Additions** (entirely new in {new_year}), "
+        f"**Updates** ({old_year} language materially rewritten or expanded) and **Redactions** "
+        f"(requirements present in {old_year} that disappear in {new_year})."
+    )
+    impacts = [result["impact"] for result in section_results if result["impact"]]
+    return {
+        "title": f"Comprehensive Difference Matrix — APL {new_apl_info['apl_number']} vs. APL {old_apl_info['apl_number']}",
+        "summary": summary,
+        "bullets": bullets,
+        "conclusion": " ".join(impacts),
+    }
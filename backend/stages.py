@@ -0,0 +1,86 @@
+"""Per-stage retry with backoff for the comparison pipeline."""
+import os
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+import openai
+from fastapi import HTTPException
+
+from llm_gateway import LLMCallCancelled
+from metrics import stage_retries
+
+logger = logging.getLogger(__name__)
+
+# Attempts per stage and the exponential backoff between them, in seconds
+STAGE_MAX_ATTEMPTS = int(os.getenv("STAGE_MAX_ATTEMPTS", "3"))
+STAGE_RETRY_BASE_DELAY = float(os.getenv("STAGE_RETRY_BASE_DELAY", "2"))
+STAGE_RETRY_MAX_DELAY = float(os.getenv("STAGE_RETRY_MAX_DELAY", "30"))
+
+
+def root_cause(error: BaseException) -> BaseException:
+    """Follow the chain of wrapped exceptions (e.g. an HTTPException raised while handling an API error)."""
+    seen = set()
+    while id(error) not in seen:
+        seen.add(id(error))
+        cause = error.__cause__ or error.__context__
+        if cause is None:
+            break
+        error = cause
+    return error
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether a failed stage is worth running again.
+
+    API errors are not: the gateway (llm_gateway.py) has already retried
+    rate limits, connection errors and 5xx responses before raising, and
+    other 4xx responses would not change. Cancelled calls and client errors
+    are not either. Anything else, such as unusable model output, is.
+    """
+    cause = root_cause(error)
+    if isinstance(cause, (LLMCallCancelled, openai.APIError)):
+        return False
+    if isinstance(error, HTTPException) and error.status_code < 500:
+        return False
+    return True
+
+
+def retry_delay(attempt: int) -> float:
+    """Capped exponential backoff with jitter for the given (1-based) failed attempt."""
+    delay = min(STAGE_RETRY_MAX_DELAY, STAGE_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def run_stage(
+    stage: str,
+    run: Callable[[bool], Awaitable[str]],
+    validate: Optional[Callable[[str], str]] = None,
+    use_cache: bool = True,
+) -> str:
+    """
+    Run one pipeline stage, retrying only that stage when it fails.
+
+    ``run`` is called with whether the model response cache may be read and
+    returns the stage output; ``validate`` checks (and may repair) the output
+    and raises on output that is unusable. Up to STAGE_MAX_ATTEMPTS attempts
+    are made with exponential backoff. API errors are not retried here (see
+    ``is_retryable``). Retries bypass the response cache so the same bad
+    response is not replayed.
+    """
+    for attempt in range(1, STAGE_MAX_ATTEMPTS + 1):
+        try:
+            output = await run(use_cache)
+            return validate(output) if validate is not None else output
+        except Exception as e:
+            if attempt == STAGE_MAX_ATTEMPTS or not is_retryable(e):
+                raise
+            use_cache = False
+            delay = retry_delay(attempt)
+            stage_retries.inc(stage=stage)
+            logger.warning(
+                f"Stage {stage} failed (attempt {attempt} of {STAGE_MAX_ATTEMPTS}): {str(e)}; retrying in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
@@ -0,0 +1,89 @@
+"""Content-addressed comparison task IDs, and cancellation of running comparisons."""
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict, List, Set, Tuple
+
+from task_store import TaskStore
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of a running task's event log for cancel requests made through another worker
+TASK_CANCEL_POLL_INTERVAL = float(os.getenv("TASK_CANCEL_POLL_INTERVAL", "2"))
+
+
+def comparison_task_id(old_filename: str, old_sha256: str, new_filename: str, new_sha256: str, **options: Any) -> str:
+    """
+    Task ID of a comparison, derived from both PDFs' content and every option that changes the result.
+
+    Filenames are part of the identity because the APL numbers in the
+    prompts come from them; they also keep the ID readable in logs.
+    """
+    identity = json.dumps([old_filename, old_sha256, new_filename, new_sha256, options], sort_keys=True)
+    return f"{old_filename}_{new_filename}_{hashlib.sha256(identity.encode('utf-8')).hexdigest()[:12]}"
+
+
+def attached_clients(events: List[Tuple[int, str, Dict[str, Any]]]) -> int:
+    """Clients still waiting on a task: its submitter plus each attached duplicate, less each cancel request."""
+    attached = sum(1 for _, event, _ in events if event == "attached")
+    cancelled = sum(1 for _, event, _ in events if event == "cancel_requested")
+    return 1 + attached - cancelled
+
+
+class TaskRegistry:
+    """
+    Comparison tasks running in this process, so they can be cancelled.
+
+    Cancelling the asyncio task interrupts whatever the pipeline is awaiting:
+    a queued model call leaves the scheduler queue (freeing its slot) and an
+    in-flight request is aborted (see llm_gateway.py). A cancel request made
+    through another worker reaches the owning process through the task's
+    event log, which ``watch`` polls.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._cancelled: Set[str] = set()
+
+    def register(self, task_id: str):
+        """Record the current asyncio task as the one running ``task_id``."""
+        self._tasks[task_id] = asyncio.current_task()
+        self._cancelled.discard(task_id)
+
+    def unregister(self, task_id: str):
+        self._tasks.pop(task_id, None)
+        self._cancelled.discard(task_id)
+
+    def cancel(self, task_id: str) -> bool:
+        """Cancel ``task_id`` if it runs in this process; False if it does not."""
+        task = self._tasks.get(task_id)
+        if task is None:
+            return False
+        if task_id not in self._cancelled:
+            self._cancelled.add(task_id)
+            logger.info(f"Task {task_id}: cancelling")
+            task.cancel()
+        return True
+
+    def cancel_requested(self, task_id: str) -> bool:
+        """Whether the running ``task_id`` was cancelled on request (rather than by server shutdown)."""
+        return task_id in self._cancelled
+
+    async def watch(self, task_id: str, store: TaskStore):
+        """Cancel ``task_id`` once every client waiting on it has asked to cancel."""
+        after = 0
+        attached = cancelled = 0
+        while True:
+            for seq, event, _ in await asyncio.to_thread(store.get_events, task_id, after):
+                after = seq
+                attached += event == "attached"
+                cancelled += event == "cancel_requested"
+            if cancelled and 1 + attached - cancelled <= 0:
+                self.cancel(task_id)
+                return
+            await asyncio.sleep(TASK_CANCEL_POLL_INTERVAL)
+
+
+task_registry = TaskRegistry()
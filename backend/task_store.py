@@ -0,0 +1,321 @@
+"""Pluggable storage for comparison task status and results."""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from extraction_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Store settings (override via environment variables)
+TASK_STORE = os.getenv("TASK_STORE", "sqlite")
+TASK_STORE_PATH = os.getenv("TASK_STORE_PATH", os.path.join(CACHE_DIR, "tasks.sqlite"))
+TASK_TTL = float(os.getenv("TASK_TTL", str(24 * 3600)))
+# Minimum seconds between sweeps for expired tasks
+TASK_EVICTION_INTERVAL = float(os.getenv("TASK_EVICTION_INTERVAL", "300"))
+# A processing task not updated for this long is treated as abandoned (its worker stopped) and may be claimed again
+TASK_STALE_AFTER = float(os.getenv("TASK_STALE_AFTER", "3600"))
+
+
+class TaskStore:
+    """
+    Interface for task status storage.
+
+    A task is a dict with a "status" key ("processing", "completed",
+    "failed" or "cancelled"), an optional "error" message and, once
+    completed, the result JSON string under "json". Tasks expire ``ttl``
+    seconds after their last update.
+
+    Each task also has an ordered event log (stage transitions and partial
+    results) that the progress stream replays to clients.
+
+    A completed task can also keep its status response pre-encoded: an ETag
+    and the compressed body in each supported encoding, so repeat reads
+    serve stored bytes. Replacing the task with a non-completed status drops
+    the stored response.
+    """
+
+    def __init__(self, ttl: float = TASK_TTL):
+        self.ttl = ttl
+
+    def get(self, task_id: str) -> Optional[dict]:
+        """Return a task, or None if it does not exist or has expired."""
+        raise NotImplementedError
+
+    def set(self, task_id: str, task_info: dict):
+        """Create or replace a task."""
+        raise NotImplementedError
+
+    def claim(self, task_id: str, task_info: dict) -> bool:
+        """
+        Atomically start a task unless it is already processing.
+
+        Returns False, changing nothing, while a task under ``task_id`` is
+        processing and was updated within TASK_STALE_AFTER seconds.
+        Otherwise the task is replaced by ``task_info`` and any earlier
+        run's events and stored response are dropped.
+        """
+        raise NotImplementedError
+
+    def delete(self, task_id: str):
+        """Remove a task and its events."""
+        raise NotImplementedError
+
+    def set_response(self, task_id: str, etag: str, encoded: Dict[str, bytes]):
+        """Store a completed task's pre-encoded status response."""
+        raise NotImplementedError
+
+    def get_response(self, task_id: str, encoding: Optional[str] = None) -> Optional[Tuple[str, Optional[bytes]]]:
+        """Return (etag, body in ``encoding``) of a stored response; the body is None if ``encoding`` is None."""
+        raise NotImplementedError
+
+    def add_event(self, task_id: str, event: str, data: Optional[Dict[str, Any]] = None):
+        """Append an event to a task's log."""
+        raise NotImplementedError
+
+    def get_events(self, task_id: str, after: int = 0) -> List[Tuple[int, str, Dict[str, Any]]]:
+        """Return (sequence, event, data) tuples logged after sequence number ``after``."""
+        raise NotImplementedError
+
+    def evict_expired(self) -> int:
+        """Drop expired tasks and return how many were removed."""
+        raise NotImplementedError
+
+
+class InMemoryTaskStore(TaskStore):
+    """Process-local store; only suitable for a single uvicorn worker."""
+
+    def __init__(self, ttl: float = TASK_TTL):
+        super().__init__(ttl)
+        self._tasks: Dict[str, tuple] = {}
+        self._events: Dict[str, List[Tuple[int, str, Dict[str, Any]]]] = {}
+        self._responses: Dict[str, Tuple[str, Dict[str, bytes]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, task_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            if entry is None:
+                return None
+            updated_at, task_info = entry
+            if time.time() - updated_at > self.ttl:
+                del self._tasks[task_id]
+                self._responses.pop(task_id, None)
+                return None
+            return dict(task_info)
+
+    def set(self, task_id: str, task_info: dict):
+        with self._lock:
+            self._tasks[task_id] = (time.time(), dict(task_info))
+            if task_info["status"] != "completed":
+                self._responses.pop(task_id, None)
+
+    def claim(self, task_id: str, task_info: dict) -> bool:
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            if entry is not None and entry[1]["status"] == "processing" and time.time() - entry[0] < TASK_STALE_AFTER:
+                return False
+            self._tasks[task_id] = (time.time(), dict(task_info))
+            self._events.pop(task_id, None)
+            self._responses.pop(task_id, None)
+            return True
+
+    def delete(self, task_id: str):
+        with self._lock:
+            self._tasks.pop(task_id, None)
+            self._events.pop(task_id, None)
+            self._responses.pop(task_id, None)
+
+    def set_response(self, task_id: str, etag: str, encoded: Dict[str, bytes]):
+        with self._lock:
+            self._responses[task_id] = (etag, dict(encoded))
+
+    def get_response(self, task_id: str, encoding: Optional[str] = None) -> Optional[Tuple[str, Optional[bytes]]]:
+        if self.get(task_id) is None:
+            return None
+        with self._lock:
+            entry = self._responses.get(task_id)
+        if entry is None:
+            return None
+        etag, encoded = entry
+        return etag, encoded.get(encoding) if encoding else None
+
+    def add_event(self, task_id: str, event: str, data: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            events = self._events.setdefault(task_id, [])
+            events.append((len(events) + 1, event, data or {}))
+
+    def get_events(self, task_id: str, after: int = 0) -> List[Tuple[int, str, Dict[str, Any]]]:
+        with self._lock:
+            return list(self._events.get(task_id, [])[after:])
+
+    def evict_expired(self) -> int:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [task_id for task_id, (updated_at, _) in self._tasks.items() if updated_at < cutoff]
+            for task_id in expired:
+                del self._tasks[task_id]
+                self._events.pop(task_id, None)
+                self._responses.pop(task_id, None)
+        return len(expired)
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    Embedded SQLite store shared by every worker process on the host.
+
+    WAL mode lets status reads proceed while another worker writes. Result
+    JSON is stored zlib-compressed, separately from the small status fields,
+    and expired tasks are swept at most every ``TASK_EVICTION_INTERVAL``
+    seconds as a side effect of writes.
+    """
+
+    def __init__(self, path: str = TASK_STORE_PATH, ttl: float = TASK_TTL):
+        super().__init__(ttl)
+        self.path = path
+        self._last_eviction = 0.0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "task_id TEXT PRIMARY KEY, status TEXT NOT NULL, info TEXT, result BLOB, "
+                "updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_updated_at ON tasks (updated_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS task_events ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, task_id TEXT NOT NULL, event TEXT NOT NULL, "
+                "data TEXT, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS task_events_task ON task_events (task_id, seq)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS task_responses ("
+                "task_id TEXT PRIMARY KEY, etag TEXT NOT NULL, gzip BLOB, br BLOB, updated_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, task_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT status, info, result, updated_at FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+        if row is None or time.time() - row[3] > self.ttl:
+            return None
+        status, info, result, _ = row
+        task_info = json.loads(info) if info else {}
+        task_info["status"] = status
+        if result is not None:
+            task_info["json"] = zlib.decompress(result).decode("utf-8")
+        return task_info
+
+    def set(self, task_id: str, task_info: dict):
+        fields = {k: v for k, v in task_info.items() if k not in ("status", "json")}
+        result = task_info.get("json")
+        if result is not None and not isinstance(result, str):
+            result = json.dumps(result)
+        compressed = zlib.compress(result.encode("utf-8")) if result is not None else None
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tasks (task_id, status, info, result, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (task_id, task_info["status"], json.dumps(fields) if fields else None, compressed, now),
+            )
+            if task_info["status"] != "completed":
+                conn.execute("DELETE FROM task_responses WHERE task_id = ?", (task_id,))
+        if now - self._last_eviction > TASK_EVICTION_INTERVAL:
+            self._last_eviction = now
+            self.evict_expired()
+
+    def claim(self, task_id: str, task_info: dict) -> bool:
+        fields = {k: v for k, v in task_info.items() if k not in ("status", "json")}
+        now = time.time()
+        with self._connect() as conn:
+            # Take the write lock before reading so two workers cannot both claim the task
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT status, updated_at FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row is not None and row[0] == "processing" and now - row[1] < TASK_STALE_AFTER:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO tasks (task_id, status, info, result, updated_at) VALUES (?, ?, ?, NULL, ?)",
+                (task_id, task_info["status"], json.dumps(fields) if fields else None, now),
+            )
+            conn.execute("DELETE FROM task_events WHERE task_id = ?", (task_id,))
+            conn.execute("DELETE FROM task_responses WHERE task_id = ?", (task_id,))
+        return True
+
+    def delete(self, task_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            conn.execute("DELETE FROM task_events WHERE task_id = ?", (task_id,))
+            conn.execute("DELETE FROM task_responses WHERE task_id = ?", (task_id,))
+
+    def set_response(self, task_id: str, etag: str, encoded: Dict[str, bytes]):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO task_responses (task_id, etag, gzip, br, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (task_id, etag, encoded.get("gzip"), encoded.get("br"), time.time()),
+            )
+
+    def get_response(self, task_id: str, encoding: Optional[str] = None) -> Optional[Tuple[str, Optional[bytes]]]:
+        # Only the ETag and the one requested encoding are read, never the task's result JSON
+        if encoding not in (None, "gzip", "br"):
+            raise ValueError(f"Unsupported content encoding: {encoding}")
+        column = f"r.{encoding}" if encoding else "NULL"
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT r.etag, {column} FROM task_responses r JOIN tasks t ON t.task_id = r.task_id "
+                "WHERE r.task_id = ? AND t.updated_at > ?",
+                (task_id, time.time() - self.ttl),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def add_event(self, task_id: str, event: str, data: Optional[Dict[str, Any]] = None):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO task_events (task_id, event, data, created_at) VALUES (?, ?, ?, ?)",
+                (task_id, event, json.dumps(data or {}), time.time()),
+            )
+
+    def get_events(self, task_id: str, after: int = 0) -> List[Tuple[int, str, Dict[str, Any]]]:
+        # Sequence numbers are global in SQLite, so clients resume with the last seq they saw
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT seq, event, data FROM task_events WHERE task_id = ? AND seq > ? ORDER BY seq",
+                (task_id, after),
+            ).fetchall()
+        return [(seq, event, json.loads(data) if data else {}) for seq, event, data in rows]
+
+    def evict_expired(self) -> int:
+        cutoff = time.time() - self.ttl
+        with self._connect() as conn:
+            removed = conn.execute("DELETE FROM tasks WHERE updated_at < ?", (cutoff,)).rowcount
+            conn.execute("DELETE FROM task_events WHERE created_at < ?", (cutoff,))
+            conn.execute("DELETE FROM task_responses WHERE task_id NOT IN (SELECT task_id FROM tasks)")
+        if removed:
+            logger.info(f"Evicted {removed} expired tasks")
+        return removed
+
+
+def create_task_store() -> TaskStore:
+    """Build the task store selected by the TASK_STORE environment variable."""
+    if TASK_STORE == "memory":
+        return InMemoryTaskStore()
+    if TASK_STORE == "sqlite":
+        return SQLiteTaskStore()
+    raise ValueError(f"Unknown TASK_STORE: {TASK_STORE}")
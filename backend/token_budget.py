@@ -0,0 +1,84 @@
+"""Prompt token accounting and per-stage token budgets."""
+import os
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # optional; fall back to a character-based estimate
+    tiktoken = None
+
+# Prompt token budget per pipeline stage (override with TOKEN_BUDGET_<STAGE>)
+STAGE_TOKEN_BUDGETS = {
+    stage: int(os.getenv(f"TOKEN_BUDGET_{stage.upper()}", str(default)))
+    for stage, default in (
+        ("initial_diff", 100000),
+        ("section_diff", 30000),
+        ("estimate", 100000),
+        ("final_diff", 120000),
+        ("scoring", 50000),
+    )
+}
+# Tokens reserved for the fixed instructions wrapped around each stage's inputs
+PROMPT_TEMPLATE_TOKENS = int(os.getenv("PROMPT_TEMPLATE_TOKENS", "1500"))
+# Characters per token used when tiktoken is not installed
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        _encoding = tiktoken.get_encoding("o200k_base")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Count (or, without tiktoken, estimate) the tokens in a string."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def count_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Count the prompt tokens of a chat message list, including per-message overhead."""
+    return sum(count_tokens(str(message.get("content") or "")) + 4 for message in messages) + 2
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Trim text to roughly max_tokens, keeping its beginning and end."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    # Token counts are close to proportional to length, so cut by characters
+    half = int(len(text) * max_tokens / count_tokens(text)) // 2
+    tail = text[len(text) - half:] if half else ""
+    return text[:half] + "\n\n[...content truncated to fit the token budget...]\n\n" + tail
+
+
+def fit_to_budget(stage: str, text: str, *other_inputs: str) -> str:
+    """
+    Trim a stage's largest variable input so the whole prompt fits the stage budget.
+
+    ``other_inputs`` are the remaining variable inputs of the same prompt;
+    their size, plus the template reserve, is deducted from the budget.
+    """
+    budget = STAGE_TOKEN_BUDGETS[stage]
+    available = budget - PROMPT_TEMPLATE_TOKENS - sum(count_tokens(o) for o in other_inputs)
+    size = count_tokens(text)
+    if size <= available:
+        return text
+    logger.warning(f"Stage {stage}: input of {size} tokens exceeds the {budget}-token budget, truncating")
+    return truncate_to_tokens(text, max(available, 0))
+
+
+def log_prompt_size(stage: str, messages: List[Dict[str, Any]], model: Optional[str] = None) -> int:
+    """Measure a prompt before it is sent and log it against the stage budget."""
+    tokens = count_message_tokens(messages)
+    budget = STAGE_TOKEN_BUDGETS.get(stage)
+    budget_note = f" of {budget} budget" if budget else ""
+    logger.info(f"Stage {stage}: sending {tokens} prompt tokens{budget_note} to {model}")
+    return tokens
@@ -0,0 +1,175 @@
+"""Streaming storage of uploaded PDFs with size limits, on-the-fly hashing and cleanup."""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+from extraction_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Upload limits (override via environment variables)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Uploads up to this size stay in memory and never touch the disk
+UPLOAD_IN_MEMORY_MAX_BYTES = int(os.getenv("UPLOAD_IN_MEMORY_MAX_BYTES", str(2 * 1024 * 1024)))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(CACHE_DIR, "uploads"))
+# Largest request body of a comparison (two PDFs plus form fields) and of a bulk job upload
+UPLOAD_REQUEST_MAX_BYTES = int(os.getenv("UPLOAD_REQUEST_MAX_BYTES", str(2 * UPLOAD_MAX_BYTES + 1024 * 1024)))
+BULK_UPLOAD_MAX_BYTES = int(os.getenv("BULK_UPLOAD_MAX_BYTES", str(20 * UPLOAD_MAX_BYTES)))
+
+
+@dataclass
+class StoredUpload:
+    """An uploaded PDF held in memory (``data``) or in a temporary file (``path``)."""
+    filename: str
+    sha256: str
+    size: int
+    path: Optional[str] = None
+    data: Optional[bytes] = None
+
+    def read_bytes(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def cleanup(self):
+        """Delete the temporary file, if any; safe to call more than once."""
+        self.data = None
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Cap the request body of upload endpoints before it is parsed.
+
+    Starlette reads and spools a whole multipart body before the endpoint
+    (and so save_upload) runs. This middleware answers a Content-Length over
+    the path's limit with HTTP 413 without reading the body, and stops a body
+    that streams past the limit anyway (chunked encoding or a wrong
+    Content-Length) with 413 at the chunk that crosses it.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body is larger than the {limit / (1024 * 1024):g} MB limit"
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside form parsing, which passes HTTPException through
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _too_large(filename: str) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"{filename} is larger than the {UPLOAD_MAX_BYTES / (1024 * 1024):g} MB upload limit",
+    )
+
+
+async def save_upload(upload: UploadFile, destination: Optional[str] = None) -> StoredUpload:
+    """
+    Read an upload in chunks, hashing it as it streams.
+
+    Small uploads are kept in memory. Larger ones, and any upload with an
+    explicit ``destination``, are streamed to disk chunk by chunk, so memory
+    use stays bounded by UPLOAD_CHUNK_SIZE. Uploads over UPLOAD_MAX_BYTES are
+    rejected with HTTP 413 and their partial file is removed. By then the
+    request body has already been received and parsed; the request as a whole
+    is capped earlier by RequestSizeLimitMiddleware.
+    """
+    filename = os.path.basename(upload.filename or "upload.pdf")
+    if upload.size is not None and upload.size > UPLOAD_MAX_BYTES:
+        raise _too_large(filename)
+
+    digest = hashlib.sha256()
+    buffered: List[bytes] = []
+    size = 0
+    file = None
+    path = destination
+    try:
+        if destination is not None:
+            file = open(destination, "wb")
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > UPLOAD_MAX_BYTES:
+                raise _too_large(filename)
+            digest.update(chunk)
+            if file is None and size > UPLOAD_IN_MEMORY_MAX_BYTES:
+                # Spill to disk once the upload outgrows the in-memory limit
+                os.makedirs(UPLOAD_DIR, exist_ok=True)
+                file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=UPLOAD_DIR)
+                path = file.name
+                for buffered_chunk in buffered:
+                    file.write(buffered_chunk)
+                buffered = []
+            if file is not None:
+                await asyncio.to_thread(file.write, chunk)
+            else:
+                buffered.append(chunk)
+    except BaseException:
+        if file is not None:
+            file.close()
+        if path is not None:
+            StoredUpload(filename, "", size, path=path).cleanup()
+        raise
+    if file is not None:
+        file.close()
+        return StoredUpload(filename, digest.hexdigest(), size, path=path)
+    return StoredUpload(filename, digest.hexdigest(), size, data=b"".join(buffered))
+
+
+def sweep_stale_uploads(max_age: float) -> int:
+    """Remove temporary upload files left behind by a crashed or killed worker."""
+    if not os.path.isdir(UPLOAD_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(UPLOAD_DIR):
+        path = os.path.join(UPLOAD_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    if removed:
+        logger.info(f"Removed {removed} stale upload files")
+    return removed
@@ -106,7 +106,9 @@ function App() {
   const [viewMode, setViewMode] = useState<string>('significance')
   const oldAPLRef = useRef<HTMLInputElement>(null)
   const newAPLRef = useRef<HTMLInputElement>(null)
-  const pollingIntervalRef = useRef<number | null>(null)
+  const eventSourceRef = useRef<EventSource | null>(null)
+  // Task this page is still waiting on, cancelled on reset or unmount
+  const activeTaskRef = useRef<string | null>(null)
 
   // Effect to switch between different JSON views
   useEffect(() => {
@@ -128,165 +130,179 @@ function App() {
     }
   }, [viewMode, jsonA, jsonB, jsonC]);
 
-  // Poll for task status when taskId is set
-  useEffect(() => {
-    if (taskId && loading) {
-      const pollStatus = async () => {
-        try {
-          const response = await axios.get(`http://localhost:8000/api/status/${taskId}`)
-          const { status, json, error: taskError } = response.data
-          
-          if (status === 'completed') {
-            try {
-              const parsedJson = typeof json === 'string' ? JSON.parse(json) : json;
-              
-              // Set all JSON versions first
-              setJsonA(parsedJson);
-              
-              // Create page-sorted version
-              const pageSorted = [...parsedJson.bullets].sort((a: any, b: any) => {
-                const pick = (item: any) => {
-                  const oldKey = getAPLCitationKey(oldAPL?.name);
-                  const newKey = getAPLCitationKey(newAPL?.name);
-                  if (item.revision_type === 'addition')
-                    return item.citations?.[newKey] ?? {};
-                  if (item.revision_type === 'redaction')
-                    return item.citations?.[oldKey] ?? {};
-                  return item.citations?.[newKey] ?? item.citations?.[oldKey] ?? {};
-                };
-                const ca = pick(a);
-                const cb = pick(b);
-                const pageA = ca.page ?? Infinity;
-                const pageB = cb.page ?? Infinity;
-                if (pageA !== pageB) return pageA - pageB;
-                const lineA = ca.line ?? Infinity;
-                const lineB = cb.line ?? Infinity;
-                return lineA - lineB;
-              });
-              const pageJson = { ...parsedJson, bullets: pageSorted };
-              setJsonB(pageJson);
-              
-              // Create revision-sorted version
-              const revisionSorted = [...parsedJson.bullets].sort((a: any, b: any) => {
-                const rank: Record<string, number> = { addition: 0, update: 1, redaction: 2 };
-                const rA = rank[a.revision_type.toLowerCase()] ?? 99;
-                const rB = rank[b.revision_type.toLowerCase()] ?? 99;
-                if (rA !== rB) return rA - rB;
-                return (b.score ?? 0) - (a.score ?? 0);
-              });
-              const revisionJson = { ...parsedJson, bullets: revisionSorted };
-              setJsonC(revisionJson);
-              
-              // // Set initial view based on viewMode
-              // switch (viewMode) {
-              //   case 'significance':
-              //     setDiffJson(parsedJson);
-              //     break;
-              //   case 'revision':
-              //     setDiffJson(pageJson);
-              //     break;
-              //   case 'page':
-              //     setDiffJson(revisionJson);
-              //     break;
-              //   default:
-              //     setDiffJson(parsedJson);
-              // }
-
-              //   const byPageThenLine = (a: any, b: any) => {
-              //     const pick = (item: any) => {
-              //       const oldKey = getAPLCitationKey(oldAPL?.name);
-              //       const newKey = getAPLCitationKey(newAPL?.name);
+  // Apply a completed comparison result and build the alternate sort orders
+  const applyResult = (json: any) => {
+    const parsedJson = typeof json === 'string' ? JSON.parse(json) : json;
+    
+    // Set all JSON versions first
+    setJsonA(parsedJson);
+    
+    // Create page-sorted version
+    const pageSorted = [...parsedJson.bullets].sort((a: any, b: any) => {
+      const pick = (item: any) => {
+        const oldKey = getAPLCitationKey(oldAPL?.name);
+        const newKey = getAPLCitationKey(newAPL?.name);
+        if (item.revision_type === 'addition')
+          return item.citations?.[newKey] ?? {};
+        if (item.revision_type === 'redaction')
+          return item.citations?.[oldKey] ?? {};
+        return item.citations?.[newKey] ?? item.citations?.[oldKey] ?? {};
+      };
+      const ca = pick(a);
+      const cb = pick(b);
+      const pageA = ca.page ?? Infinity;
+      const pageB = cb.page ?? Infinity;
+      if (pageA !== pageB) return pageA - pageB;
+      const lineA = ca.line ?? Infinity;
+      const lineB = cb.line ?? Infinity;
+      return lineA - lineB;
+    });
+    const pageJson = { ...parsedJson, bullets: pageSorted };
+    setJsonB(pageJson);
+    
+    // Create revision-sorted version
+    const revisionSorted = [...parsedJson.bullets].sort((a: any, b: any) => {
+      const rank: Record<string, number> = { addition: 0, update: 1, redaction: 2 };
+      const rA = rank[a.revision_type.toLowerCase()] ?? 99;
+      const rB = rank[b.revision_type.toLowerCase()] ?? 99;
+      if (rA !== rB) return rA - rB;
+      return (b.score ?? 0) - (a.score ?? 0);
+    });
+    const revisionJson = { ...parsedJson, bullets: revisionSorted };
+    setJsonC(revisionJson);
+    
+    // // Set initial view based on viewMode
+    // switch (viewMode) {
+    //   case 'significance':
+    //     setDiffJson(parsedJson);
+    //     break;
+    //   case 'revision':
+    //     setDiffJson(pageJson);
+    //     break;
+    //   case 'page':
+    //     setDiffJson(revisionJson);
+    //     break;
+    //   default:
+    //     setDiffJson(parsedJson);
+    // }
+
+    //   const byPageThenLine = (a: any, b: any) => {
+    //     const pick = (item: any) => {
+    //       const oldKey = getAPLCitationKey(oldAPL?.name);
+    //       const newKey = getAPLCitationKey(newAPL?.name);
   
-              //       if (item.revision_type === 'addition')
-              //         return item.citations?.[newKey] ?? {};
-              //       if (item.revision_type === 'redaction')
-              //         return item.citations?.[oldKey] ?? {};
-              //       return item.citations?.[newKey] ?? item.citations?.[oldKey] ?? {};
-              //     };
-              //     const ca = pick(a);
-              //     const cb = pick(b);
-              //     const pageA = ca.page ?? Infinity;
-              //     const pageB = cb.page ?? Infinity;
-              //     if (pageA !== pageB) return pageA - pageB;
-              //     const lineA = ca.line ?? Infinity;
-              //     const lineB = cb.line ?? Infinity;
-              //     return lineA - lineB;
-              //   };
-              //   return [...diffJson.bullets].sort(byPageThenLine);
-              // }, [viewMode, diffJson.bullets]);
-              // setJsonB(pagejson)
-
-              // const revisionjson = React.useMemo(() => {
-              //     const rank: Record<string, number> = { addition: 0, update: 1, redaction: 2 };
-        
-              //     return [...diffJson.bullets].sort((a, b) => {
-              //       const rA = rank[a.revision_type] ?? 99;
-              //       const rB = rank[b.revision_type] ?? 99;
-              //       if (rA !== rB) return rA - rB;
-              //       return (b.score ?? 0) - (a.score ?? 0);
-              //     });
-              // }, [viewMode, diffJson.bullets]);
-
-              // setJsonC(revisionjson)  
-              setLoading(false)
-              setTaskId(null)
-              clearInterval(pollingIntervalRef.current as unknown as number)
-              pollingIntervalRef.current = null
-            } catch (parseError) {
-              console.error('Error parsing JSON:', parseError);
-              setError('Error parsing the comparison results. Please try again.');
-              setLoading(false);
-              setTaskId(null);
-              clearInterval(pollingIntervalRef.current as unknown as number);
-              pollingIntervalRef.current = null;
-            }
-          } else if (status === 'failed') {
-            setError(taskError || 'An error occurred during processing')
-            setLoading(false)
-            setTaskId(null)
-            clearInterval(pollingIntervalRef.current as unknown as number)
-            pollingIntervalRef.current = null
-          } else {
-            // Update progress message based on time elapsed
-            if (progress === 'Uploading files...') {
-              setProgress('Analyzing APL documents...')
-            } else if (progress === 'Analyzing APL documents...') {
-              if (quickMode) {
-                setProgress('Generating differences...')
-              } else {
-                setProgress('Generating initial differences...')
-              }
-            } else if (!quickMode && progress === 'Generating initial differences...') {
-              setProgress('Creating APL estimate...')
-            } else if (!quickMode && progress === 'Creating APL estimate...') {
-              setProgress('Finalizing comparison results...')
-            }
-          }
-        } catch (err) {
-          console.error('Error polling task status:', err)
-          setError('Error checking task status. Please try again.')
-          setLoading(false)
-          setTaskId(null)
-          clearInterval(pollingIntervalRef.current as unknown as number)
-          pollingIntervalRef.current = null
-        }
+    //       if (item.revision_type === 'addition')
+    //         return item.citations?.[newKey] ?? {};
+    //       if (item.revision_type === 'redaction')
+    //         return item.citations?.[oldKey] ?? {};
+    //       return item.citations?.[newKey] ?? item.citations?.[oldKey] ?? {};
+    //     };
+    //     const ca = pick(a);
+    //     const cb = pick(b);
+    //     const pageA = ca.page ?? Infinity;
+    //     const pageB = cb.page ?? Infinity;
+    //     if (pageA !== pageB) return pageA - pageB;
+    //     const lineA = ca.line ?? Infinity;
+    //     const lineB = cb.line ?? Infinity;
+    //     return lineA - lineB;
+    //   };
+    //   return [...diffJson.bullets].sort(byPageThenLine);
+    // }, [viewMode, diffJson.bullets]);
+    // setJsonB(pagejson)
+
+    // const revisionjson = React.useMemo(() => {
+    //     const rank: Record<string, number> = { addition: 0, update: 1, redaction: 2 };
+
+    //     return [...diffJson.bullets].sort((a, b) => {
+    //       const rA = rank[a.revision_type] ?? 99;
+    //       const rB = rank[b.revision_type] ?? 99;
+    //       if (rA !== rB) return rA - rB;
+    //       return (b.score ?? 0) - (a.score ?? 0);
+    //     });
+    // }, [viewMode, diffJson.bullets]);
+
+    // setJsonC(revisionjson)
+  }
+
+  // Tell the server this page no longer waits for a task; it stops once no client is waiting
+  const cancelTask = (id: string) => {
+    axios.post(`http://localhost:8000/api/cancel/${id}`).catch((err) => {
+      console.error('Error cancelling task:', err)
+    })
+  }
+
+  // Cancel a running comparison when the page is unmounted
+  useEffect(() => {
+    return () => {
+      if (activeTaskRef.current) {
+        cancelTask(activeTaskRef.current)
+        activeTaskRef.current = null
       }
+    }
+  }, [])
 
-      // Poll every 5 seconds
-      pollingIntervalRef.current = setInterval(pollStatus, 5000) as unknown as number
-      
-      // Initial poll
-      pollStatus()
-
-      // Cleanup interval on unmount
-      return () => {
-        if (pollingIntervalRef.current) {
-          clearInterval(pollingIntervalRef.current as unknown as number)
-          pollingIntervalRef.current = null
-        }
+  // Stream task progress from the server when taskId is set
+  useEffect(() => {
+    if (!taskId || !loading) return
+
+    const source = new EventSource(`http://localhost:8000/api/stream/${taskId}`)
+    eventSourceRef.current = source
+
+    const finish = () => {
+      source.close()
+      eventSourceRef.current = null
+      activeTaskRef.current = null
+      setLoading(false)
+      setTaskId(null)
+    }
+
+    source.addEventListener('extraction', () => {
+      setProgress(quickMode ? 'Generating differences...' : 'Generating initial differences...')
+    })
+    source.addEventListener('initial_diff', () => {
+      setProgress(quickMode ? 'Scoring changes...' : 'Creating APL estimate...')
+    })
+    source.addEventListener('estimate', () => setProgress('Finalizing comparison results...'))
+    source.addEventListener('final_diff', () => setProgress('Scoring changes...'))
+    source.addEventListener('scoring', () => setProgress('Verifying citations...'))
+
+    source.addEventListener('completed', (event) => {
+      try {
+        const { json } = JSON.parse((event as MessageEvent).data)
+        applyResult(json)
+      } catch (parseError) {
+        console.error('Error parsing JSON:', parseError);
+        setError('Error parsing the comparison results. Please try again.');
+      }
+      finish()
+    })
+
+    source.addEventListener('failed', (event) => {
+      const { error: taskError } = JSON.parse((event as MessageEvent).data)
+      setError(taskError || 'An error occurred during processing')
+      finish()
+    })
+
+    source.addEventListener('cancelled', () => {
+      setError('The comparison was cancelled.')
+      finish()
+    })
+
+    source.onerror = () => {
+      // EventSource reconnects by itself (resuming from the last event); only give up once it has closed
+      if (source.readyState === EventSource.CLOSED) {
+        console.error('Progress stream closed unexpectedly')
+        setError('Error checking task status. Please try again.')
+        finish()
       }
     }
-  }, [taskId, loading, progress])
+
+    // Close the stream on unmount
+    return () => {
+      source.close()
+      eventSourceRef.current = null
+    }
+  }, [taskId, loading])
 
   const handleOldAPLChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     if (e.target.files && e.target.files[0]) {
@@ -303,6 +319,11 @@ function App() {
   }
 
   const resetForm = () => {
+    if (activeTaskRef.current) {
+      cancelTask(activeTaskRef.current)
+      activeTaskRef.current = null
+    }
+    setLoading(false)
     setOldAPL(null)
     setNewAPL(null)
     setDiffJson(null)
@@ -314,9 +335,9 @@ function App() {
     setProgress('Uploading files...')
     if (oldAPLRef.current) oldAPLRef.current.value = ''
     if (newAPLRef.current) newAPLRef.current.value = ''
-    if (pollingIntervalRef.current) {
-      clearInterval(pollingIntervalRef.current as unknown as number)
-      pollingIntervalRef.current = null
+    if (eventSourceRef.current) {
+      eventSourceRef.current.close()
+      eventSourceRef.current = null
     }
   }
 
@@ -351,6 +372,7 @@ function App() {
       })
 
       if (response.data.task_id) {
+        activeTaskRef.current = response.data.task_id
         setTaskId(response.data.task_id)
         setProgress('Analyzing APL documents...')
       } else {
@@ -425,7 +447,7 @@ function App() {
               {loading ? <Spinner size="sm" className="mr-2" /> : null}
               Compare APLs
             </Button>
-            <Button variant="outline" onClick={resetForm} disabled={loading}>
+            <Button variant="outline" onClick={resetForm}>
               Reset
             </Button>
           </div>
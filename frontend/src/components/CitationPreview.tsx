@@ -6,6 +6,7 @@ interface CitationPreviewProps {
     page: number;
     line: number;
     text?: string; // New field
+    verified?: boolean; // false when the quoted text could not be found in the PDF
   } | null;
   documentName: string;
 }
@@ -16,7 +17,7 @@ export const CitationPreview: React.FC<CitationPreviewProps> = ({
 }) => {
   if (!citation) return null;
   
-  const displayText = `${documentName.replace('.pdf', '')}: Page ${citation.page}, Line ${citation.line}`;
+  const displayText = `${documentName.replace('.pdf', '')}: Page ${citation.page}, Line ${citation.line}${citation.verified === false ? ' (unverified)' : ''}`;
   
   // If there's no citation text, just render the plain text
   if (!citation.text) {